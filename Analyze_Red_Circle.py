@@ -1,53 +1,55 @@
 import os
 import glob
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import cv2
 import numpy as np
 
 
-def find_red_ring(frame, roi_rect=None):
-    """
-    在给定的帧或ROI中查找红色圆环。
-    封装了颜色分割、形态学处理和霍夫圆变换。
+# 光标圆环的基准半径；半径小于 R_NORMAL - RADIUS_SHRINK_THRESHOLD 视为正在点击
+R_NORMAL = 27
+RADIUS_SHRINK_THRESHOLD = 1
+RADIUS_MININUM = 21
+RADIUS_MAXINUM = 30
+
+# 批量处理时每次解码的帧数，以及拼接时帧与帧之间的黑边行数（须大于形态学运算的作用范围）
+CHUNK_SIZE = 16
+MASK_PADDING = 16
+# 流式处理时为点击扩展暂存的最大帧数
+LOOKAHEAD_FRAMES = 120
 
-    :param frame: 输入的视频帧 (BGR)。
-    :param roi_rect: 可选的感兴趣区域 (x, y, w, h)。
-    :return: 如果找到圆环，则返回 (x, y, r)；否则返回 None。
-    """
-    if roi_rect:
-        x_roi, y_roi, w_roi, h_roi = roi_rect
-        frame_roi = frame[y_roi:y_roi + h_roi, x_roi:x_roi + w_roi]
-        processing_frame = frame_roi
-    else:
-        processing_frame = frame
 
-    # ... 在 find_red_ring 函数内 ...
-    hsv = cv2.cvtColor(processing_frame, cv2.COLOR_BGR2HSV)
+def red_mask(image):
+    """BGR 图像（可以是多帧纵向拼接的整块）-> 红色二值掩码"""
+    hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
 
     # --- 新的、精确的红色HSV范围 ---
     # 基于测量数据：H=0, S=255, V=170-180
     # 我们只需要一个范围，因为H值稳定在0附近
     lower_red = np.array([0, 240, 170])
     upper_red = np.array([2, 255, 185])
-    red_mask = cv2.inRange(hsv, lower_red, upper_red)
+    return cv2.inRange(hsv, lower_red, upper_red)
+
 
+def clean_mask(mask):
     # 2. 形态学处理
     kernel = np.ones((5, 5), np.uint8)
     # 开运算：去除小的噪点
-    red_mask = cv2.morphologyEx(red_mask, cv2.MORPH_OPEN, kernel)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
     # 闭运算：填充圆环内部的空洞
-    red_mask = cv2.morphologyEx(red_mask, cv2.MORPH_CLOSE, kernel, iterations=2)
+    return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel, iterations=2)
 
-    # 为了调试，可以显示掩码
-    # cv2.imshow('Debug Mask', red_mask)
 
-    # 3. 圆环检测 (霍夫圆变换)
+def hough_ring(red_mask):
+    """在掩码上用霍夫圆变换查找圆环，返回掩码坐标系下的 (x, y, r) 或 None"""
     # 参数需要根据实际视频中圆环的大小和清晰度进行调整
     circles = cv2.HoughCircles(
         red_mask,
         cv2.HOUGH_GRADIENT,
         dp=1.2,  # 累加器分辨率，通常为1-2
-        minDist=processing_frame.shape[0] // 4,  # 圆心之间的最小距离，防止检测到多个同心圆
+        minDist=red_mask.shape[0] // 4,  # 圆心之间的最小距离，防止检测到多个同心圆
         param1=100,  # Canny边缘检测的高阈值
         param2=25,  # 累加器阈值，越小检测到的圆越多
         minRadius=15,  # 最小半径 (非常重要!)
@@ -57,15 +59,57 @@ def find_red_ring(frame, roi_rect=None):
     if circles is not None:
         # 取第一个检测到的圆
         circle = np.uint16(np.around(circles[0, 0]))
-        cx, cy, r = circle[0], circle[1], circle[2]
+        return circle[0], circle[1], circle[2]
+    return None
+
+
+def find_red_ring(frame, roi_rect=None, mask=None):
+    """
+    在给定的帧或ROI中查找红色圆环。
+    封装了颜色分割、形态学处理和霍夫圆变换。
+
+    :param frame: 输入的视频帧 (BGR)。
+    :param roi_rect: 可选的感兴趣区域 (x, y, w, h)。
+    :param mask: 可选的整帧掩码（已做形态学处理，由 red_masks 批量得到）；给出时不再对 frame 做颜色分割。
+    :return: 如果找到圆环，则返回 (x, y, r)；否则返回 None。
+    """
+    if roi_rect:
+        x_roi, y_roi, w_roi, h_roi = roi_rect
+        if mask is not None:
+            red_mask_roi = mask[y_roi:y_roi + h_roi, x_roi:x_roi + w_roi]
+        else:
+            red_mask_roi = clean_mask(red_mask(frame[y_roi:y_roi + h_roi, x_roi:x_roi + w_roi]))
+    else:
+        red_mask_roi = mask if mask is not None else clean_mask(red_mask(frame))
+
+    # 为了调试，可以显示掩码
+    # cv2.imshow('Debug Mask', red_mask_roi)
+
+    # 3. 圆环检测 (霍夫圆变换)
+    circle = hough_ring(red_mask_roi)
+    if circle is not None:
+        cx, cy, r = circle
 
         # 如果使用了ROI，将坐标转换回全图坐标
         if roi_rect:
             cx += x_roi
             cy += y_roi
-        return (cx, cy, r), red_mask  # 同时返回掩码用于调试
+        return (cx, cy, r), red_mask_roi  # 同时返回掩码用于调试
+
+    return None, red_mask_roi
+
 
-    return None, red_mask
+def red_masks(frames):
+    """
+    对一整块帧 (N, H + MASK_PADDING, W, 3) 一次性完成颜色分割和形态学处理。
+    每帧下方的 MASK_PADDING 行黑边把相邻帧隔开，形态学运算不会跨帧。
+
+    :return: (掩码 (N, H, W), 每帧是否含有红色像素 (N,))
+    """
+    count, padded_height, width = frames.shape[:3]
+    masks = clean_mask(red_mask(frames.reshape(count * padded_height, width, 3)))
+    masks = masks.reshape(count, padded_height, width)[:, :padded_height - MASK_PADDING]
+    return masks, masks.reshape(count, -1).any(axis=1)
 
 
 def calculate_radius_from_contour(hough_center, mask):
@@ -95,175 +139,178 @@ def calculate_radius_from_contour(hough_center, mask):
     return center, radius
 
 
-def main(video_path, output_path):
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"错误: 无法打开视频文件 {video_path}")
-        return
+def find_click_marker(frame, near):
+    """
+    在光标附近查找 main 烧录的点击标记（填充的黄色方块）。
+    经过 main 处理的视频中，点击期间红色圆环被黄色方块完全覆盖，需要据此识别点击。
 
-    # --- 状态变量初始化 ---
-    R_normal = 27
-    # R_normal_buffer = []
-    # INIT_FRAMES = 30
-    last_known_circle = None
-    RADIUS_SHRINK_THRESHOLD = 1
-    RADIUS_MININUM = 21
-    RADIUS_MAXINUM = 30
-    STD_DEV_THRESHOLD = 12.0
-    frame_count = 0
+    :param near: 上一次找到的光标 (x, y, r)。
+    :return: 找到则返回方块的 (x, y, r)，否则返回 None。
+    """
+    cx0, cy0, r0 = near
+    roi_size = int(r0 * 6)
+    x_roi = max(0, cx0 - roi_size // 2)
+    y_roi = max(0, cy0 - roi_size // 2)
+    frame_roi = frame[y_roi:y_roi + roi_size, x_roi:x_roi + roi_size]
+
+    hsv = cv2.cvtColor(frame_roi, cv2.COLOR_BGR2HSV)
+    yellow_mask = cv2.inRange(hsv, np.array([25, 200, 200]), np.array([35, 255, 255]))
+    contours, _ = cv2.findContours(yellow_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        # 只接受大小与光标相当、几乎被填满的正方形，排除界面中的黄色文字等
+        if not (2 * RADIUS_MININUM - 4 <= w <= 2 * RADIUS_MAXINUM + 4) or abs(w - h) > 4:
+            continue
+        if cv2.contourArea(contour) < 0.85 * w * h:
+            continue
+        cx, cy = x_roi + x + w // 2, y_roi + y + h // 2
+        if (cx - cx0) ** 2 + (cy - cy0) ** 2 <= (2 * r0) ** 2:
+            return cx, cy, w // 2
+    return None
+
+
+def analyze_frame(frame, last_known_circle, marker=False, mask=None):
+    """
+    分析一帧：先在上一帧光标附近的ROI中查找红色圆环，找不到再全图搜索；圆环半径收缩即视为点击。
+    marker=True 时，光标附近的黄色点击标记也视为点击。
+    mask 为 red_masks 预先算好的整帧掩码，给出时 ROI 与全图搜索都直接在其上进行。
 
-    result_stack = []
+    :return: (frame_result, 新的 last_known_circle)。frame_result 为 None 表示本帧没有找到光标。
+    """
+    # --- 追踪逻辑 ---
+    roi_rect = None
+    if last_known_circle:
+        cx, cy, r = last_known_circle
+        roi_size = int(r * 4)
+        x_roi = max(0, cx - roi_size // 2)
+        y_roi = max(0, cy - roi_size // 2)
+        w_roi = min(frame.shape[1] - x_roi, roi_size)
+        h_roi = min(frame.shape[0] - y_roi, roi_size)
+        roi_rect = (x_roi, y_roi, w_roi, h_roi)
+
+    # 查找圆环
+    found_circle_info, debug_mask = find_red_ring(frame, roi_rect, mask)
+
+    # 如果在ROI中没找到，则进行全图搜索作为备用方案
+    if found_circle_info is None and last_known_circle is not None:
+        found_circle_info, debug_mask = find_red_ring(frame, None, mask)
+
+    if found_circle_info:
+        # 从Hough变换中获取不稳定的结果作为参考
+        hough_cx, hough_cy, hough_r_unstable = found_circle_info
+
+        stable_debug_mask = np.zeros(frame.shape[:2], dtype=np.uint8)
+        # 检查 debug_mask 的尺寸是否与整个帧相同
+        if debug_mask.shape == stable_debug_mask.shape:
+            # 如果是全尺寸的（来自全图搜索），直接使用
+            stable_debug_mask = debug_mask
+        elif roi_rect is not None:
+            # 如果是小尺寸的（来自ROI搜索），则将其放置在正确的位置
+            x_roi, y_roi, w_roi, h_roi = roi_rect
+            # 确保 debug_mask 的形状与 roi 区域的形状完全匹配
+            if debug_mask.shape == (h_roi, w_roi):
+                stable_debug_mask[y_roi:y_roi + h_roi, x_roi:x_roi + w_roi] = debug_mask
+
+        # 使用更稳定的方法计算半径和中心
+        stable_center, stable_radius = calculate_radius_from_contour((hough_cx, hough_cy), stable_debug_mask)
+
+        if stable_radius and RADIUS_MININUM <= stable_radius <= RADIUS_MAXINUM:
+            cx, cy, r = int(stable_center[0]), int(stable_center[1]), stable_radius
+            frame_result = {'click': r < R_NORMAL - RADIUS_SHRINK_THRESHOLD, 'Radius': r, 'cx': cx, 'cy': cy}
+            return frame_result, (cx, cy, r)
+
+    if marker and last_known_circle:
+        square = find_click_marker(frame, last_known_circle)
+        if square:
+            cx, cy, r = square
+            # 光标位置沿用方块中心，半径保持未点击时的值，便于下一帧继续追踪
+            return {'click': True, 'Radius': r, 'cx': cx, 'cy': cy}, (cx, cy, last_known_circle[2])
+
+    return None, None
+
+
+def read_chunk(cap, buffer, start_seconds=None, end_seconds=None):
+    """
+    把后续帧解码进预分配的 buffer（每帧下方留 MASK_PADDING 行黑边），跳过 start_seconds 之前的帧。
 
-    while True:
+    :return: (帧数, 各帧时间戳毫秒, 是否已到视频或时间窗末尾)
+    """
+    height = buffer.shape[1] - MASK_PADDING
+    timestamps = []
+    while len(timestamps) < len(buffer):
         ret, frame = cap.read()
         if not ret:
-            print("视频结束或读取失败。")
-            break
+            return len(timestamps), timestamps, True
 
         # 获取当前帧的时间戳（毫秒）
         timestamp_ms = cap.get(cv2.CAP_PROP_POS_MSEC)
-        # 格式化时间戳为 M:S:ms
-        seconds = int(timestamp_ms / 1000)
-        minutes = seconds // 60
-        seconds %= 60
-        milliseconds = int(timestamp_ms % 1000)
-        timestamp_str = f"{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
-
-        frame_count += 1
-        # 创建用于输出和显示的副本
-        display_frame = frame.copy()
-
-        frame_result = None
-
-        # --- 追踪逻辑 ---
-        roi_rect = None
-        if last_known_circle:
-            cx, cy, r = last_known_circle
-            roi_size = int(r * 4)
-            x_roi = max(0, cx - roi_size // 2)
-            y_roi = max(0, cy - roi_size // 2)
-            w_roi = min(frame.shape[1] - x_roi, roi_size)
-            h_roi = min(frame.shape[0] - y_roi, roi_size)
-            roi_rect = (x_roi, y_roi, w_roi, h_roi)
-            cv2.rectangle(display_frame, (x_roi, y_roi), (x_roi + w_roi, y_roi + h_roi), (255, 255, 0), 1)
-
-        # 查找圆环
-        found_circle_info, debug_mask = find_red_ring(frame, roi_rect)
-
-        # 如果在ROI中没找到，则进行全图搜索作为备用方案
-        if found_circle_info is None and last_known_circle is not None:
-            found_circle_info, debug_mask = find_red_ring(frame, None)
-
-        # --- 状态判断与更新 ---
-        current_state = "Not Detected"
-        center_std_dev = 0
-        r = 'N/A'  # 预设半径为N/A
-
-        if found_circle_info:
-            # 从Hough变换中获取不稳定的结果作为参考
-            hough_cx, hough_cy, hough_r_unstable = found_circle_info
-
-            stable_debug_mask = np.zeros(frame.shape[:2], dtype=np.uint8)
-            # 检查 debug_mask 的尺寸是否与整个帧相同
-            if debug_mask.shape == stable_debug_mask.shape:
-                # 如果是全尺寸的（来自全图搜索），直接使用
-                stable_debug_mask = debug_mask
-            elif roi_rect is not None:
-                # 如果是小尺寸的（来自ROI搜索），则将其放置在正确的位置
-                x_roi, y_roi, w_roi, h_roi = roi_rect
-                # 确保 debug_mask 的形状与 roi 区域的形状完全匹配
-                if debug_mask.shape == (h_roi, w_roi):
-                    stable_debug_mask[y_roi:y_roi + h_roi, x_roi:x_roi + w_roi] = debug_mask
-            debug_mask = stable_debug_mask
-
-            # 2. 使用更稳定的方法计算半径和中心
-            #    注意：debug_mask 就是我们需要的二值掩码
-            stable_center, stable_radius = calculate_radius_from_contour((hough_cx, hough_cy), debug_mask)
-
-            if stable_radius and RADIUS_MININUM <= stable_radius <= RADIUS_MAXINUM:
-                cx, cy, r_val = stable_center[0], stable_center[1], stable_radius
-                r = r_val  # 更新半径值
-                last_known_circle = (cx, cy, r)
-
-                print(f"[{timestamp_str}] Radius: {r}, cx: {cx}, cy: {cy}, hough_cx: {hough_cx}, hough_cy: {hough_cy}")
-                frame_result = {'click': False, 'Radius': r, 'cx': cx, 'cy': cy}
-
-                # if frame_count < INIT_FRAMES:
-                #     current_state = "Initializing..."
-                #     R_normal_buffer.append(r)
-                #     if frame_count == INIT_FRAMES - 1 and R_normal_buffer:
-                #         R_normal = np.mean(R_normal_buffer)
-                #         print(f"初始化完成, 基准半径 R_normal = {R_normal:.2f}")
-
-                # elif R_normal is not None:
-                if R_normal is not None:
-                    gray_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    inner_mask = np.zeros(gray_frame.shape, dtype=np.uint8)
-                    inner_radius = max(0, r - 5)
-                    cv2.circle(inner_mask, (cx, cy), inner_radius, 255, -1)
-                    mean, stddev_val = cv2.meanStdDev(gray_frame, mask=inner_mask)
-                    center_std_dev = stddev_val[0][0]
-
-                    is_shrunk = r < R_normal - RADIUS_SHRINK_THRESHOLD
-                    is_opaque = center_std_dev < STD_DEV_THRESHOLD
-
-                    # if is_shrunk and is_opaque:
-                    if is_shrunk:
-                        current_state = "Clicked"
-                        cv2.circle(display_frame, (cx, cy), r, (0, 255, 0), 2)
-                        frame_result['click'] = True
-                    else:
-                        current_state = "Normal"
-                        cv2.circle(display_frame, (cx, cy), r, (255, 0, 255), 2)
-                        # R_normal = 0.98 * R_normal + 0.02 * r
-
-                cv2.circle(display_frame, (cx, cy), 2, (0, 0, 255), 3)
-            else:
-                last_known_circle = None
-        else:
-            last_known_circle = None
-
-        # --- 在屏幕上显示信息 ---
-        info_text = f"State: {current_state}"
-        radius_text = f"Radius: {r}" if isinstance(r, int) else f"Radius: {r}"
-        r_normal_text = f"R_normal: {R_normal:.2f}" if R_normal else "R_normal: N/A"
-        std_dev_text = f"Center StdDev: {center_std_dev:.2f}"
-
-        cv2.putText(display_frame, info_text, (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        cv2.putText(display_frame, radius_text, (20, 80), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-        cv2.putText(display_frame, r_normal_text, (20, 110), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-        cv2.putText(display_frame, std_dev_text, (20, 140), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-
-        # cv2.imshow('Red Ring Tracker', display_frame)
-
-        # ==========================================================
-        #               修正后的调试掩码显示逻辑
-        # ==========================================================
-        display_mask_to_show = np.zeros(frame.shape[:2], dtype=np.uint8)
-
-        # 检查 debug_mask 是否存在
-        if debug_mask is not None:
-            # 检查 debug_mask 的尺寸是否与整个帧相同
-            if debug_mask.shape == display_mask_to_show.shape:
-                # 如果是全尺寸的（来自全图搜索），直接使用
-                display_mask_to_show = debug_mask
-            elif roi_rect is not None:
-                # 如果是小尺寸的（来自ROI搜索），则将其放置在正确的位置
-                x_roi, y_roi, w_roi, h_roi = roi_rect
-                # 确保 debug_mask 的形状与 roi 区域的形状完全匹配
-                if debug_mask.shape == (h_roi, w_roi):
-                    display_mask_to_show[y_roi:y_roi + h_roi, x_roi:x_roi + w_roi] = debug_mask
-
-        # cv2.imshow('Debug Mask', display_mask_to_show)
-        # ==========================================================
-
-        result_stack.append(frame_result)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        if start_seconds and timestamp_ms < start_seconds * 1000:
+            continue
+        if end_seconds is not None and timestamp_ms > end_seconds * 1000:
+            return len(timestamps), timestamps, True
+
+        buffer[len(timestamps), :height] = frame
+        timestamps.append(timestamp_ms)
+    return len(timestamps), timestamps, False
+
+
+def iter_cursor(cap, start_seconds=None, end_seconds=None, marker=False, chunk_size=CHUNK_SIZE):
+    """
+    逐帧追踪光标，依次产出 (时间戳毫秒, 帧, frame_result)。帧按 chunk_size 一块解码，颜色分割与形态学处理对整块一次完成；
+    不含任何红色像素的帧不再做霍夫变换。产出的帧是解码缓冲区的视图，下一块解码后即被覆盖，需要保留时请自行拷贝。
+    """
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if start_seconds:
+        cap.set(cv2.CAP_PROP_POS_MSEC, start_seconds * 1000)
+
+    buffer = np.zeros((chunk_size, height + MASK_PADDING, width, 3), np.uint8)
+    last_known_circle = None
+    finished = False
+    while not finished:
+        count, timestamps, finished = read_chunk(cap, buffer, start_seconds, end_seconds)
+        if count == 0:
             break
+        masks, has_red = red_masks(buffer[:count])
+
+        for i, timestamp_ms in enumerate(timestamps):
+            frame = buffer[i, :height]
+            # 点击期间红色圆环可能被黄色标记完全覆盖，marker=True 时仍需在光标附近查找标记
+            if has_red[i] or (marker and last_known_circle):
+                frame_result, last_known_circle = analyze_frame(frame, last_known_circle, marker, masks[i])
+            else:
+                frame_result, last_known_circle = None, None
+            yield timestamp_ms, frame, frame_result
+
 
+def track_cursor(video_path, start_seconds=None, end_seconds=None, marker=False, verbose=False, chunk_size=CHUNK_SIZE):
+    """
+    逐帧追踪光标。
+
+    :return: ([(时间戳毫秒, frame_result)], 宽, 高)；无法打开视频时返回 None。
+    """
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"错误: 无法打开视频文件 {video_path}")
+        return None
+
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    frames = []
+    for timestamp_ms, _, frame_result in iter_cursor(cap, start_seconds, end_seconds, marker, chunk_size):
+        if verbose and frame_result:
+            print(f"[{format_timestamp(timestamp_ms)}] Radius: {frame_result['Radius']}, cx: {frame_result['cx']}, cy: {frame_result['cy']}")
+        frames.append((timestamp_ms, frame_result))
+
+    if verbose:
+        print("视频结束或读取失败。")
     cap.release()
+    return frames, width, height
+
 
+def expand_clicks(result_stack):
+    """把点击帧向前后扩展到半径恢复正常为止，使一次点击覆盖圆环收缩和恢复的全过程"""
     idx = 0
     temp_result_stack = result_stack
     while idx < len(result_stack):
@@ -273,7 +320,7 @@ def main(video_path, output_path):
             while idx_temp > 0:
                 idx_temp -= 1
                 frame_result_temp = result_stack[idx_temp]
-                if not frame_result_temp or frame_result_temp['click'] or frame_result_temp['Radius'] < R_normal:
+                if not frame_result_temp or frame_result_temp['click'] or frame_result_temp['Radius'] < R_NORMAL:
                     new_frame_result = frame_result_temp if frame_result_temp else result_stack[idx_temp + 1]
                     new_frame_result['click'] = True
                     temp_result_stack[idx_temp] = new_frame_result
@@ -283,7 +330,7 @@ def main(video_path, output_path):
             while idx_temp < len(result_stack) - 1:
                 idx_temp += 1
                 frame_result_temp = result_stack[idx_temp]
-                if not frame_result_temp or frame_result_temp['click'] or frame_result_temp['Radius'] < R_normal:
+                if not frame_result_temp or frame_result_temp['click'] or frame_result_temp['Radius'] < R_NORMAL:
                     new_frame_result = frame_result_temp if frame_result_temp else result_stack[idx_temp - 1]
                     new_frame_result['click'] = True
                     temp_result_stack[idx_temp] = new_frame_result
@@ -292,12 +339,149 @@ def main(video_path, output_path):
             idx = idx_temp + 1
         else:
             idx += 1
-    result_stack = temp_result_stack
+    return temp_result_stack
+
+
+def weak_frame(frame_result):
+    """没找到光标、已判定为点击或半径小于正常值的帧，可被相邻的点击扩展覆盖"""
+    return not frame_result or frame_result['click'] or frame_result['Radius'] < R_NORMAL
+
+
+class ClickSmoother:
+    """
+    expand_clicks 的流式版本：以"未点击且半径正常"的帧为界把视频分段，段内只要有一帧点击，整段都算点击，
+    段内没有找到光标的帧沿用相邻帧的结果。
+    push 按顺序送入帧，返回已能确定结果的 [(payload, frame_result)]；只有尚未出现点击的当前段需要暂存，
+    最多 lookahead 帧，超出时最早的帧按未点击输出（一次点击的收缩过程远短于该长度）。
+    """
+
+    def __init__(self, lookahead=LOOKAHEAD_FRAMES):
+        self.lookahead = lookahead
+        self.pending = []
+        self.clicking = False
+        # 当前点击段中最近一帧的结果，用于填补之后没有找到光标的帧
+        self.last = None
+
+    def push(self, payload, frame_result):
+        if not weak_frame(frame_result):
+            ready = self.pending + [(payload, frame_result)]
+            self.pending = []
+            self.clicking = False
+            self.last = None
+            return ready
+
+        if self.clicking:
+            if frame_result:
+                frame_result['click'] = True
+                self.last = frame_result
+            return [(payload, self.last)]
+
+        if frame_result and frame_result['click']:
+            # 向前扩展：暂存的整段都算点击，没有找到光标的帧沿用其后最近一帧的结果
+            ready = [(payload, frame_result)]
+            following = frame_result
+            for pending_payload, pending_result in reversed(self.pending):
+                if pending_result:
+                    pending_result['click'] = True
+                    following = pending_result
+                ready.append((pending_payload, following))
+            self.pending = []
+            self.clicking = True
+            self.last = frame_result
+            return ready[::-1]
+
+        self.pending.append((payload, frame_result))
+        if len(self.pending) > self.lookahead:
+            return [self.pending.pop(0)]
+        return []
+
+    def flush(self):
+        ready = self.pending
+        self.pending = []
+        return ready
+
+
+def draw_click(frame, frame_result):
+    """在点击位置烧录填充的黄色方块"""
+    r, cx, cy = frame_result['Radius'], frame_result['cx'], frame_result['cy']
+    top_left = (cx - r, cy - r)
+    bottom_right = (cx + r, cy + r)
+    cv2.rectangle(frame, top_left, bottom_right, (0, 255, 255), -1)  # -1 表示填充
+
+
+def format_timestamp(timestamp_ms):
+    """毫秒 -> 'mm:ss:xx'（xx 为百分之一秒）"""
+    minutes = int(timestamp_ms // 60000)
+    seconds = int(timestamp_ms // 1000 % 60)
+    centiseconds = int(timestamp_ms % 1000 // 10)
+    return f"{minutes:02d}:{seconds:02d}:{centiseconds:02d}"
+
+
+def parse_time(time_str):
+    """'mm:ss' 或 'mm:ss:xx' -> 秒"""
+    parts = time_str.strip().split(":")
+    seconds = int(parts[0]) * 60 + int(parts[1])
+    if len(parts) == 3:
+        seconds += int(parts[2]) / 10 ** len(parts[2])
+    return seconds
+
+
+def point_location(frame_result, width, height):
+    # PointLocation 以左下角为原点
+    return {
+        'x': min(1.0, max(0.0, frame_result['cx'] / width)),
+        'y': min(1.0, max(0.0, 1 - frame_result['cy'] / height)),
+    }
+
+
+def detect_clicks_local(video_path, start_time=None, end_time=None):
+    """
+    在本地视频上检测点击，返回与 Detect_Click.detect_click_time_location 相同的 ClickList 结构：
+    [{'start_timestamp': 'mm:ss:xx', 'end_timestamp': 'mm:ss:xx', 'start_location': {x, y}, 'end_location': {x, y}}]。
+    时间窗内一帧都没有找到光标（或视频无法打开）时返回 None，由调用方改用 Gemini。
+    """
+    start_seconds = parse_time(start_time) if start_time else None
+    end_seconds = parse_time(end_time) if end_time else None
+    tracked = track_cursor(video_path, start_seconds, end_seconds, marker=True)
+    if tracked is None:
+        return None
+    frames, width, height = tracked
+    if not any(frame_result for _, frame_result in frames):
+        return None
+
+    result_stack = expand_clicks([frame_result for _, frame_result in frames])
+
+    clicks = []
+    current = None
+    for (timestamp_ms, _), frame_result in zip(frames, result_stack):
+        if frame_result and frame_result['click']:
+            if current is None:
+                current = {'start_timestamp': format_timestamp(timestamp_ms), 'start_location': point_location(frame_result, width, height)}
+            current['end_timestamp'] = format_timestamp(timestamp_ms)
+            current['end_location'] = point_location(frame_result, width, height)
+        elif current is not None:
+            clicks.append(current)
+            current = None
+    if current is not None:
+        clicks.append(current)
+
+    return [{'start_timestamp': click['start_timestamp'], 'end_timestamp': click['end_timestamp'],
+             'start_location': click['start_location'], 'end_location': click['end_location']} for click in clicks]
+
+
+def main(video_path, output_path, chunk_size=CHUNK_SIZE, verbose=True):
+    """处理一个视频，返回 {"video", "frames", "seconds", "fps"}；无法打开视频时返回 None"""
+    start = time.monotonic()
+    tracked = track_cursor(video_path, verbose=verbose, chunk_size=chunk_size)
+    if tracked is None:
+        return None
+    frames, _, _ = tracked
+    result_stack = expand_clicks([frame_result for _, frame_result in frames])
 
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened():
         print(f"错误: 无法打开视频文件 {video_path}")
-        return
+        return None
 
     # 获取视频属性并初始化 VideoWriter
     frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -316,11 +500,7 @@ def main(video_path, output_path):
         output_frame = frame.copy()
 
         if result_stack[idx] and result_stack[idx]['click']:
-            r, cx, cy = result_stack[idx]['Radius'], result_stack[idx]['cx'], result_stack[idx]['cy']
-            diameter = r * 2
-            top_left = (cx - r, cy - r)
-            bottom_right = (cx + r, cy + r)
-            cv2.rectangle(output_frame, top_left, bottom_right, (0, 255, 255), -1)  # -1 表示填充
+            draw_click(output_frame, result_stack[idx])
 
         # 4. 无论检测结果如何，都将 output_frame 写入视频文件
         video_writer.write(output_frame)
@@ -331,13 +511,58 @@ def main(video_path, output_path):
     print("处理完成。正在释放资源...")
     cap.release()
     video_writer.release()
-    cv2.destroyAllWindows()
+    seconds = time.monotonic() - start
     print(f"视频已成功保存到: {output_path}")
+    return {"video": video_path, "frames": len(frames), "seconds": round(seconds, 2), "fps": round(len(frames) / seconds, 1) if seconds else 0.0}
+
+
+def init_worker():
+    # 并行度由进程池提供，每个进程内 OpenCV 只用单线程，避免线程数超额
+    cv2.setNumThreads(1)
+
+
+def process_video(video_path, output_path, chunk_size=CHUNK_SIZE):
+    try:
+        return main(video_path, output_path, chunk_size, verbose=False)
+    except Exception as e:
+        print(f"处理 {video_path} 失败: {e}")
+        return None
+
+
+def run_batch(jobs, workers=None, chunk_size=CHUNK_SIZE, process=process_video):
+    """
+    jobs 为 [(输入视频, 输出视频)]，在 workers 个进程中以 process(输入, 输出, chunk_size) 并行处理，
+    逐个打印每个视频的吞吐量（帧/秒）。返回全部成功视频的统计。
+    """
+    workers = workers or os.cpu_count()
+    start = time.monotonic()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as executor:
+        futures = [executor.submit(process, video_path, output_path, chunk_size) for video_path, output_path in jobs]
+        for future in as_completed(futures):
+            stats = future.result()
+            if stats is None:
+                continue
+            results.append(stats)
+            print(f"[{len(results)}/{len(jobs)}] {os.path.basename(stats['video'])}: {stats['frames']} frames, {stats['seconds']}s, {stats['fps']} fps")
+
+    seconds = time.monotonic() - start
+    frames = sum(stats["frames"] for stats in results)
+    print(f"共 {len(results)} 个视频, {frames} 帧, 用时 {seconds:.1f}s, 总吞吐 {frames / seconds if seconds else 0.0:.1f} fps ({workers} 进程)")
+    return results
 
 
 if __name__ == '__main__':
-    video_files = glob.glob('E:\\DarkDetection\\dataset\\syx\\us\\*')
-    for video_file in video_files:
-        output_path = os.path.join('E:\\DarkDetection\\dataset\\syx\\click\\us', os.path.basename(video_file))
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default='E:\\DarkDetection\\dataset\\syx\\us', help="Directory of raw screen recordings")
+    parser.add_argument("--output", default='E:\\DarkDetection\\dataset\\syx\\click\\us', help="Directory for videos with clicks marked")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Frames decoded and masked per batch")
+    args = parser.parse_args()
+
+    jobs = []
+    for video_file in glob.glob(os.path.join(args.input, '*')):
+        output_path = os.path.join(args.output, os.path.basename(video_file))
         if not os.path.exists(output_path):
-            main(video_file, output_path)
+            jobs.append((video_file, output_path))
+    run_batch(jobs, args.workers, args.chunk_size)
@@ -5,8 +5,7 @@ from PIL import Image
 from torchvision.transforms import Compose, Resize, CenterCrop, ToTensor, Normalize
 # pip install opencv-python
 import cv2
-import ffmpeg
-import io
+from frame_sampler import sample_frames
 
 def convert_to_rgb(image):
     return image.convert("RGB")
@@ -28,15 +27,6 @@ class RawVideoExtractorCV2():
             Normalize((0.48145466, 0.4578275, 0.40821073), (0.26862954, 0.26130258, 0.27577711)),
         ])
 
-    def _extract_frame_ffmpeg(self, video_path, timestamp_sec):
-        out, _ = (
-            ffmpeg
-            .input(video_path, ss=timestamp_sec)
-            .output('pipe:', vframes=1, format='image2pipe', vcodec='png')
-            .run(capture_stdout=True, capture_stderr=True)
-        )
-        return Image.open(io.BytesIO(out))
-
     def video_to_tensor(self, video_file, preprocess, sample_fp=0, start_time=None, end_time=None):
         if start_time is not None or end_time is not None:
             assert isinstance(start_time, int) and isinstance(end_time, int) \
@@ -101,9 +91,9 @@ class RawVideoExtractorCV2():
 
         images = []
 
-        for t in np.arange(start_sec, end_sec, interval):
-            frame = self._extract_frame_ffmpeg(video_file, t)
-            images.append(preprocess(frame.convert("RGB")))
+        # 整段只解码一次，ffmpeg 直接输出 RGB 原始像素
+        for t, frame in sample_frames(video_file, start_sec, end_sec, interval):
+            images.append(preprocess(Image.fromarray(frame)))
 
         if len(images) > 0:
             video_data = th.tensor(np.stack(images))
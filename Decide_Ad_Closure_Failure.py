@@ -3,14 +3,14 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request
+from utils import send_request, async_send_request
 from Bbox import Location
 from Point import PointLocation_Description
 from Bbox import Bbox_Description
 from typing import Literal
 
 
-def Decide_Ad_Closure_Failure(client, video, ad, close_button, click):
+def build_ad_closure_failure_request(video, ad, close_button, click):
     class AdClosureFailure(BaseModel):
         ad_closure_failure: bool = Field(..., description="Whether 'Ad Closure Failure' appears or not. ")
         timestamp: str = Field(...,
@@ -97,11 +97,20 @@ def Decide_Ad_Closure_Failure(client, video, ad, close_button, click):
 
     content = [video, prompt_decide_ad_closure_failure]
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def Decide_Ad_Closure_Failure(client, video, ad, close_button, click):
+    request = build_ad_closure_failure_request(video, ad, close_button, click)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
+async def Decide_Ad_Closure_Failure_async(client, video, ad, close_button, click):
+    request = build_ad_closure_failure_request(video, ad, close_button, click)
+    response = await async_send_request(client=client, **request)
     return json.loads(response.text)
@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request
+from utils import send_request, async_send_request
 from Bbox import Bbox_Description
 
 
-def Decide_Ad_Without_Exit_Option(client, video, ad, close_button):
+def build_ad_without_exit_option_request(video, ad, close_button):
     class AdWithoutExitOption(BaseModel):
         ad_without_exit_option: bool = Field(..., description="Whether 'Ad Without Exit Option' appears or not. ")
         timestamp: str = Field(...,
@@ -84,11 +84,20 @@ def Decide_Ad_Without_Exit_Option(client, video, ad, close_button):
 
     content = [video, prompt_decide_ad_without_exit_option]
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def Decide_Ad_Without_Exit_Option(client, video, ad, close_button):
+    request = build_ad_without_exit_option_request(video, ad, close_button)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
+async def Decide_Ad_Without_Exit_Option_async(client, video, ad, close_button):
+    request = build_ad_without_exit_option_request(video, ad, close_button)
+    response = await async_send_request(client=client, **request)
     return json.loads(response.text)
@@ -3,10 +3,10 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request
+from utils import send_request, async_send_request
 
 
-def Decide_App_Resumption_Ads(client, video, recheck_ad, outside_interface, start_time, end_time):
+def build_app_resumption_ads_request(video, recheck_ad, outside_interface, start_time, end_time):
     class AppResumptionAds(BaseModel):
         app_resumption_ads: bool = Field(..., description="Whether 'App Resumption Ads' appears or not.")
         start_time: str = Field(...,
@@ -87,13 +87,20 @@ def Decide_App_Resumption_Ads(client, video, recheck_ad, outside_interface, star
 
     content = [video, prompt_decide_app_resumption_ads]
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def Decide_App_Resumption_Ads(client, video, recheck_ad, outside_interface, start_time, end_time):
+    request = build_app_resumption_ads_request(video, recheck_ad, outside_interface, start_time, end_time)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
-    # print("Decide on App Resumption Ads:")
-    # print(response.text)
-    return json.loads(response.text)
\ No newline at end of file
+async def Decide_App_Resumption_Ads_async(client, video, recheck_ad, outside_interface, start_time, end_time):
+    request = build_app_resumption_ads_request(video, recheck_ad, outside_interface, start_time, end_time)
+    response = await async_send_request(client=client, **request)
+    return json.loads(response.text)
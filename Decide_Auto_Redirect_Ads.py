@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request
+from utils import send_request, async_send_request
 from Point import PointLocation_Description
 
 
-def Decide_Auto_Redirect_Ads(client, video, ad, landing_page_time, click_time_location):
+def build_auto_redirect_ads_request(video, ad, landing_page_time, click_time_location):
     class AutoRedirectAds(BaseModel):
         auto_redirect_ads: bool = Field(..., description="Whether 'Auto-Redirect Ads' appears or not. ")
         timestamp: str = Field(...,
@@ -85,11 +85,20 @@ def Decide_Auto_Redirect_Ads(client, video, ad, landing_page_time, click_time_lo
 
     content = [video, prompt_decide_auto_redirect_ads]
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def Decide_Auto_Redirect_Ads(client, video, ad, landing_page_time, click_time_location):
+    request = build_auto_redirect_ads_request(video, ad, landing_page_time, click_time_location)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
+async def Decide_Auto_Redirect_Ads_async(client, video, ad, landing_page_time, click_time_location):
+    request = build_auto_redirect_ads_request(video, ad, landing_page_time, click_time_location)
+    response = await async_send_request(client=client, **request)
     return json.loads(response.text)
@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request
+from utils import send_request, async_send_request
 from Bbox import Location, Bbox_Description
 
 
-def Decide_Gesture_Induced(client, video, ad, shake_element):
+def build_gesture_induced_request(video, ad, shake_element):
     class GestureInduced(BaseModel):
         gesture_induced_ad_redirection: bool = Field(..., description="Whether 'Gesture-Induced Ad Redirection' appears or not.")
         timestamp: str = Field(...,
@@ -64,11 +64,20 @@ def Decide_Gesture_Induced(client, video, ad, shake_element):
 
     content = [video, prompt_decide_gesture_induced]
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def Decide_Gesture_Induced(client, video, ad, shake_element):
+    request = build_gesture_induced_request(video, ad, shake_element)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
+async def Decide_Gesture_Induced_async(client, video, ad, shake_element):
+    request = build_gesture_induced_request(video, ad, shake_element)
+    response = await async_send_request(client=client, **request)
     return json.loads(response.text)
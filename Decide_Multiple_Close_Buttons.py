@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request
+from utils import send_request, async_send_request
 from Bbox import Bbox_Description
 
 
-def Decide_Multiple_Close_Buttons(client, video, ad, close_button):
+def build_multiple_close_buttons_request(video, ad, close_button):
     class MultipleCloseButtons(BaseModel):
         multiple_close_buttons: bool = Field(..., description="Whether 'Multiple Close Buttons' appears or not. ")
         timestamp: str = Field(...,
@@ -57,11 +57,20 @@ def Decide_Multiple_Close_Buttons(client, video, ad, close_button):
 
     content = [video, prompt_decide_multiple_cloase_buttons]
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def Decide_Multiple_Close_Buttons(client, video, ad, close_button):
+    request = build_multiple_close_buttons_request(video, ad, close_button)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
+async def Decide_Multiple_Close_Buttons_async(client, video, ad, close_button):
+    request = build_multiple_close_buttons_request(video, ad, close_button)
+    response = await async_send_request(client=client, **request)
     return json.loads(response.text)
@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request, time_to_seconds
+from utils import send_request, async_send_request, time_to_seconds
 from Bbox import Bbox_Description
 
 
-def Decide_Paid_Ad_Removal(client, video, purchase_interface, ad_removal_element, start_time=None, end_time=None):
+def build_paid_ad_removal_request(video, purchase_interface, ad_removal_element, start_time=None, end_time=None):
     class PaidAdRemoval(BaseModel):
         timestamp: str = Field(...,
                                description="The timestamp when the purchase interface appears, should be represented in the format 'mm:ss'.")
@@ -96,13 +96,24 @@ def Decide_Paid_Ad_Removal(client, video, purchase_interface, ad_removal_element
             ]
         )
 
-        response = send_request(
-            client=client,
-            model="gemini-2.5-flash-preview-05-20",
-            contents=content,
-            config=config,
-        )
+        return {
+            "model": "gemini-2.5-flash-preview-05-20",
+            "contents": content,
+            "config": config,
+        }
+
+
+def Decide_Paid_Ad_Removal(client, video, purchase_interface, ad_removal_element, start_time=None, end_time=None):
+    request = build_paid_ad_removal_request(video, purchase_interface, ad_removal_element, start_time, end_time)
+    if request is None:
+        return None
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
-        # print("Decide on Paid Ad Removal:")
-        # print(response.text)
-        return json.loads(response.text)
+async def Decide_Paid_Ad_Removal_async(client, video, purchase_interface, ad_removal_element, start_time=None, end_time=None):
+    request = build_paid_ad_removal_request(video, purchase_interface, ad_removal_element, start_time, end_time)
+    if request is None:
+        return None
+    response = await async_send_request(client=client, **request)
+    return json.loads(response.text)
@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request
+from utils import send_request, async_send_request
 from Bbox import Location, Bbox_Description
 
 
-def Decide_Reward_Based_Ads(client, video, watch_ad_element, reward_element):
+def build_reward_based_ads_request(video, watch_ad_element, reward_element):
     class RewardBasedAds(BaseModel):
         reward_based_ads: bool = Field(..., description="Whether 'Reward-Based Ads' appears or not. ")
         timestamp: str = Field(...,
@@ -86,11 +86,20 @@ def Decide_Reward_Based_Ads(client, video, watch_ad_element, reward_element):
 
     content = [video, prompt_decide_reward_based_ads]
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def Decide_Reward_Based_Ads(client, video, watch_ad_element, reward_element):
+    request = build_reward_based_ads_request(video, watch_ad_element, reward_element)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
+async def Decide_Reward_Based_Ads_async(client, video, watch_ad_element, reward_element):
+    request = build_reward_based_ads_request(video, watch_ad_element, reward_element)
+    response = await async_send_request(client=client, **request)
     return json.loads(response.text)
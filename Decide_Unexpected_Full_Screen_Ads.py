@@ -3,13 +3,13 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request
+from utils import send_request, async_send_request
 from Point import PointLocation_Description
 # from Hover import Hover_Description
 from Bbox import Location, Bbox_Description
 
 
-def Decide_Unexpected_Full_Screen_Ads(client, video, recheck_ads_time, click_time_location, voluntary_ad_trigger_element_time_location, start_time, end_time):
+def build_unexpected_full_screen_ads_request(video, recheck_ads_time, click_time_location, voluntary_ad_trigger_element_time_location, start_time, end_time):
     class UnexpectedFullScreenAds(BaseModel):
         unexpected_full_screen_ads: bool = Field(..., description="Whether 'Unexpected Full-Screen Ads' appears or not.")
         click_time: str = Field(...,
@@ -77,13 +77,20 @@ def Decide_Unexpected_Full_Screen_Ads(client, video, recheck_ads_time, click_tim
 
     content = [video, prompt_decide_unexpected_full_screen_ads]
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def Decide_Unexpected_Full_Screen_Ads(client, video, recheck_ads_time, click_time_location, voluntary_ad_trigger_element_time_location, start_time, end_time):
+    request = build_unexpected_full_screen_ads_request(video, recheck_ads_time, click_time_location, voluntary_ad_trigger_element_time_location, start_time, end_time)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
-    # print("Decide on Unexpected Full-Screen Ads:")
-    # print(response.text)
-    return json.loads(response.text)
\ No newline at end of file
+async def Decide_Unexpected_Full_Screen_Ads_async(client, video, recheck_ads_time, click_time_location, voluntary_ad_trigger_element_time_location, start_time, end_time):
+    request = build_unexpected_full_screen_ads_request(video, recheck_ads_time, click_time_location, voluntary_ad_trigger_element_time_location, start_time, end_time)
+    response = await async_send_request(client=client, **request)
+    return json.loads(response.text)
@@ -1,10 +1,14 @@
 import re
 import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request, generate_part
-from rag import load_database, generate_video_summarize, generate_exemplars_parts
+from utils import send_request, async_send_request, generate_part
+from rag import load_database, generate_video_summarize, generate_video_summarize_async, budget_exemplars_parts, EXEMPLAR_BUDGET
+from exemplar_selection import rerank
+from visual_retriever import VISUAL_RETRIEVER
 
 
 class AdSegment(BaseModel):
@@ -32,7 +36,7 @@ class AdSegment(BaseModel):
 AdSegmentList = list[AdSegment]
 
 
-def detect_ads(client, video):
+def build_ads_request(video):
     prompt_detect_ads = '''
     Context:
         1. You will be analyzing a video segment based on the following information:
@@ -72,24 +76,31 @@ def detect_ads(client, video):
     )
     contents = [video, prompt_detect_ads]
 
-    # Send request with function declarations
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        # contents=[video_file, prompt],
-        contents=contents,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": contents,
+        "config": config,
+    }
+
+
+def detect_ads(client, video):
+    response = send_request(client=client, **build_ads_request(video))
+    return json.loads(response.text)
 
-    # print("Detect Ad:")
-    # print(response.text)
+
+async def detect_ads_async(client, video):
+    response = await async_send_request(client=client, **build_ads_request(video))
     return json.loads(response.text)
 
 
 retriever = load_database()
+# 示例检索方式："summary" 先让 Gemini 总结候选片段再按摘要文本检索；
+# "visual" 在本地用 CLIP 嵌入候选片段的关键帧检索示例关键帧，省去一次总结请求（需要视频的本地路径）
+RETRIEVAL_MODE = "summary"
 
 
-def recheck_ads(client, video, start_time, end_time, full_screen, ad_time):
+def build_recheck_ads_request(video, start_time, end_time, full_screen, ad_time, retriever_result, budget=None):
+    """返回 (请求参数, 示例预算报告)；示例部分按 budget（默认 EXEMPLAR_BUDGET）抽帧、缩放并限制图像数和 token 数"""
     class AdAttribution(BaseModel):
         start_time: str = Field(...,
                                 description=f"The timestamp when the ad starts, should be represented in the format 'mm:ss'. If no ad occurs in provided period, set this attribution to '00:00'.")
@@ -188,9 +199,6 @@ def recheck_ads(client, video, start_time, end_time, full_screen, ad_time):
                 If you revised the end time in Step 3.3 (either backward or forward), you should repeat the entire process from Step 3.3 with the new, updated end time.
     '''
 
-    ad_summarize = generate_video_summarize(client, video, start_time, end_time)
-    retriever_result = retriever.invoke(ad_summarize)
-
     config = types.GenerateContentConfig(
         thinking_config=types.ThinkingConfig(
             include_thoughts=True,
@@ -203,15 +211,72 @@ def recheck_ads(client, video, start_time, end_time, full_screen, ad_time):
         temperature=0.0,
     )
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=types.Content(
-            parts=[generate_part(video.uri, "v"), generate_part(prompt_recheck_ad, "t")] + generate_exemplars_parts(retriever_result),
+    exemplars_parts, exemplar_report = budget_exemplars_parts(retriever_result, budget or EXEMPLAR_BUDGET)
+
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": types.Content(
+            parts=[generate_part(video.uri, "v"), generate_part(prompt_recheck_ad, "t")] + exemplars_parts,
         ),
-        config=config,
-    )
+        "config": config,
+    }, exemplar_report
+
+
+def use_visual_retrieval(video_local_path):
+    return RETRIEVAL_MODE == "visual" and video_local_path is not None
+
+
+def summary_candidates(summaries, fetch_k):
+    """按摘要检索候选示例；Chroma 检索器没有相关度和向量，只保留检索顺序"""
+    if hasattr(retriever, "candidates"):
+        return retriever.candidates(summaries, fetch_k)
+    return [[(doc, None, None) for doc in docs] for docs in retriever.batch(summaries)]
+
+
+def retrieve_exemplars(client, video, windows, video_local_path=None, max_workers=8, budget=None):
+    """
+    为同一视频的多个候选片段 [(start_time, end_time)] 一次检索示例，返回 [(ad_summarize, retriever_result)]。
+    摘要模式下各片段的总结请求并行发出，全部返回后用一次 batch 检索；视觉模式下所有片段的关键帧合并为一次查询。
+    每个片段先取 budget.fetch_k 个候选，再按 MMR 重排保留 budget.max_exemplars 个。
+    """
+    budget = budget or EXEMPLAR_BUDGET
+    if not windows:
+        return []
+    if use_visual_retrieval(video_local_path):
+        summaries = [None] * len(windows)
+        candidates = VISUAL_RETRIEVER.load().candidates(video_local_path, windows, budget.fetch_k)
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(windows))) as executor:
+            summaries = list(executor.map(lambda window: generate_video_summarize(client, video, *window), windows))
+        candidates = summary_candidates(summaries, budget.fetch_k)
+    return [(summary, rerank(window_candidates, budget)) for summary, window_candidates in zip(summaries, candidates)]
+
+
+def recheck_ads(client, video, start_time, end_time, full_screen, ad_time, video_local_path=None, exemplars=None):
+    """
+    exemplars 为 retrieve_exemplars 已取得的 (ad_summarize, retriever_result)，给出时不再单独检索。
+    返回 (复查结果, ad_summarize, retriever_result, 示例预算报告)。
+    """
+    if exemplars is None:
+        exemplars = retrieve_exemplars(client, video, [(start_time, end_time)], video_local_path)[0]
+    ad_summarize, retriever_result = exemplars
+
+    request, exemplar_report = build_recheck_ads_request(video, start_time, end_time, full_screen, ad_time, retriever_result)
+    response = send_request(client=client, **request)
+
+    return json.loads(response.text), ad_summarize, retriever_result, exemplar_report
+
+
+async def recheck_ads_async(client, video, start_time, end_time, full_screen, ad_time, video_local_path=None):
+    if use_visual_retrieval(video_local_path):
+        # 取帧和 CLIP 推理在线程中进行，不阻塞事件循环
+        ad_summarize, retriever_result = (await asyncio.to_thread(retrieve_exemplars, client, video, [(start_time, end_time)], video_local_path))[0]
+    else:
+        ad_summarize = await generate_video_summarize_async(client, video, start_time, end_time)
+        candidates = await asyncio.to_thread(summary_candidates, [ad_summarize], EXEMPLAR_BUDGET.fetch_k)
+        retriever_result = rerank(candidates[0], EXEMPLAR_BUDGET)
+
+    request, exemplar_report = build_recheck_ads_request(video, start_time, end_time, full_screen, ad_time, retriever_result)
+    response = await async_send_request(client=client, **request)
 
-    # print("Recheck Ad:")
-    # print(response.text)
-    return json.loads(response.text), ad_summarize, retriever_result
\ No newline at end of file
+    return json.loads(response.text), ad_summarize, retriever_result, exemplar_report
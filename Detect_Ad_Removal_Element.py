@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request, time_to_seconds
+from utils import send_request, async_send_request, time_to_seconds
 from Bbox import Location, Bbox_Description
 
 
-def detect_ad_removal_element_time_location(client, video, start_time=None, end_time=None):
+def build_ad_removal_element_time_location_request(video, start_time=None, end_time=None):
     class AdRemovalElement(BaseModel):
         timestamp: str = Field(...,
                             description="The timestamp at which the 'Ad Removal UI Element' appears, should be represented in the format 'mm:ss'.")
@@ -96,13 +96,24 @@ def detect_ad_removal_element_time_location(client, video, start_time=None, end_
             ]
         )
 
-        response = send_request(
-            client=client,
-            model="gemini-2.5-flash-preview-05-20",
-            contents=content,
-            config=config,
-        )
+        return {
+            "model": "gemini-2.5-flash-preview-05-20",
+            "contents": content,
+            "config": config,
+        }
+
+
+def detect_ad_removal_element_time_location(client, video, start_time=None, end_time=None):
+    request = build_ad_removal_element_time_location_request(video, start_time, end_time)
+    if request is None:
+        return None
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
-        # print("Detect Ad Removal Text:")
-        # print(response.text)
-        return json.loads(response.text)
+async def detect_ad_removal_element_time_location_async(client, video, start_time=None, end_time=None):
+    request = build_ad_removal_element_time_location_request(video, start_time, end_time)
+    if request is None:
+        return None
+    response = await async_send_request(client=client, **request)
+    return json.loads(response.text)
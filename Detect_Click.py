@@ -1,13 +1,20 @@
 import re
 import json
+import threading
+from concurrent.futures import Future
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request, time_to_seconds
+from utils import send_request, async_send_request, time_to_seconds, seconds_to_mmss
 from Point import PointLocation, PointLocation_Description
+from Analyze_Red_Circle import detect_clicks_local
 
 
-def detect_click_time_location(client, video, start_time=None, end_time=None):
+# 有本地视频时先用本地光标追踪检测点击，找不到光标时再请求 Gemini
+LOCAL_CLICK_TRACKER = True
+
+
+def build_click_time_location_request(video, start_time=None, end_time=None):
     class Click(BaseModel):
         start_timestamp: str = Field(...,
                                description="The timestamp at which user starts to click the mouse, accurate to the millsecond and in the format 'mm:ss:xx'.")
@@ -87,13 +94,177 @@ def detect_click_time_location(client, video, start_time=None, end_time=None):
             ]
         )
 
-        response = send_request(
-            client=client,
-            model="gemini-2.5-flash-preview-05-20",
-            contents=content,
-            config=config,
-        )
+        return {
+            "model": "gemini-2.5-flash-preview-05-20",
+            "contents": content,
+            "config": config,
+        }
+
+
+def detect_click_time_location(client, video, start_time=None, end_time=None):
+    request = build_click_time_location_request(video, start_time, end_time)
+    if request is None:
+        return None
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
+
+async def detect_click_time_location_async(client, video, start_time=None, end_time=None):
+    request = build_click_time_location_request(video, start_time, end_time)
+    if request is None:
+        return None
+    response = await async_send_request(client=client, **request)
+    return json.loads(response.text)
+
+
+def click_seconds(timestamp):
+    """把 'mm:ss:xx' / 'mm:ss' 形式的点击时间转为秒数（保留小数部分）"""
+    parts = timestamp.strip().split(":")
+    seconds = int(parts[0]) * 60 + int(parts[1])
+    if len(parts) == 3:
+        seconds += int(parts[2]) / 10 ** len(parts[2])
+    return seconds
+
+
+def subtract_intervals(start, end, intervals):
+    """返回 [start, end] 中未被 intervals 覆盖的部分"""
+    gaps = []
+    cursor = start
+    for s, e in sorted(intervals):
+        if e <= cursor or s >= end:
+            continue
+        if s > cursor:
+            gaps.append((cursor, s))
+        cursor = max(cursor, e)
+    if cursor < end:
+        gaps.append((cursor, end))
+    return gaps
+
+
+class ClickTimeline:
+    """
+    单个视频的点击时间线：已检测过的时间区间及其中的点击事件。
+    查询一个时间窗时只为尚未覆盖的部分发送请求，结果按时间合并入索引，再从索引中截取该时间窗内的点击。
+    与正在进行的请求重叠的部分会等待其结果，而不是重复请求。
+    给出 local_path 时优先在本地追踪光标，只有本地找不到光标的区间才请求 Gemini。
+    """
+
+    # 相邻请求边界上同一次点击可能被检测两次，起始时间相差不超过该值视为同一次点击
+    DUPLICATE_SECONDS = 0.1
+
+    def __init__(self, video, local_path=None):
+        self.video = video
+        self.local_path = local_path
+        self.lock = threading.Lock()
+        self.covered = []
+        self.pending = []
+        # [(起始秒数, 点击事件)]，按起始秒数排序
+        self.events = []
+        self.requests = 0
+        self.local_requests = 0
+        self.requested_seconds = 0
+        self.queried_seconds = 0
+
+    def cover(self, client, start, end):
+        while True:
+            with self.lock:
+                gaps = subtract_intervals(start, end, self.covered + [(s, e) for s, e, _ in self.pending])
+                waits = [future for s, e, future in self.pending if s < end and e > start]
+                mine = [(s, e, Future()) for s, e in gaps]
+                self.pending.extend(mine)
+
+            for i, (s, e, future) in enumerate(mine):
+                try:
+                    self.detect(client, s, e, future)
+                except Exception as error:
+                    # 其余尚未请求的区间同样以失败结束，等待它们的调用方会在下一轮重新请求
+                    with self.lock:
+                        for rest in mine[i + 1:]:
+                            self.pending.remove(rest)
+                    for _, _, rest_future in mine[i + 1:]:
+                        rest_future.set_exception(error)
+                    raise
+
+            # 其它调用方负责的区间失败时，下一轮由本调用方重新请求
+            failed = False
+            for future in waits:
+                try:
+                    future.result()
+                except Exception as e:
+                    failed = True
+            if not failed:
+                return
+
+    def detect_local(self, start, end):
+        if not (LOCAL_CLICK_TRACKER and self.local_path):
+            return None
+        try:
+            return detect_clicks_local(self.local_path, seconds_to_mmss(start), seconds_to_mmss(end))
+        except Exception as e:
+            print(f"Local click tracking failed on {self.local_path}, fall back to Gemini. Detail: {e}")
+            return None
+
+    def detect(self, client, start, end, future):
+        try:
+            clicks = self.detect_local(start, end)
+            local = clicks is not None
+            if not local:
+                clicks = detect_click_time_location(client, self.video, seconds_to_mmss(start), seconds_to_mmss(end)) or []
+        except Exception as e:
+            with self.lock:
+                self.pending.remove((start, end, future))
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            for click in clicks:
+                try:
+                    at = click_seconds(click["start_timestamp"])
+                except Exception as e:
+                    at = start
+                if any(abs(at - other) <= self.DUPLICATE_SECONDS for other, _ in self.events):
+                    continue
+                self.events.append((at, click))
+            self.events.sort(key=lambda event: event[0])
+            self.covered.append((start, end))
+            self.pending.remove((start, end, future))
+            self.requests += 1
+            self.local_requests += local
+            self.requested_seconds += end - start
+        future.set_result(None)
+
+    def query(self, client, start_time, end_time):
+        start, end = time_to_seconds(start_time), time_to_seconds(end_time)
+        self.cover(client, start, end)
+        with self.lock:
+            self.queried_seconds += end - start
+            return [click for at, click in self.events if start <= at <= end]
+
+    def stats(self):
+        with self.lock:
+            return {"requests": self.requests, "local_requests": self.local_requests,
+                    "requested_seconds": self.requested_seconds, "queried_seconds": self.queried_seconds}
+
+
+CLICK_TIMELINES = {}
+CLICK_TIMELINES_LOCK = threading.Lock()
+
+
+def get_click_timeline(video, local_path=None):
+    with CLICK_TIMELINES_LOCK:
+        if video.uri not in CLICK_TIMELINES:
+            CLICK_TIMELINES[video.uri] = ClickTimeline(video, local_path)
+        return CLICK_TIMELINES[video.uri]
+
+
+def release_click_timeline(video):
+    with CLICK_TIMELINES_LOCK:
+        timeline = CLICK_TIMELINES.pop(video.uri, None)
+    return timeline.stats() if timeline else None
+
 
-        # print("Detect Click:")
-        # print(response.text)
-        return json.loads(response.text)
+def detect_click_time_location_cached(client, video, start_time=None, end_time=None):
+    """与 detect_click_time_location 相同，但同一视频上重叠的时间窗只请求一次"""
+    if not (start_time and end_time):
+        return None
+    return get_click_timeline(video).query(client, start_time, end_time)
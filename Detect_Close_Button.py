@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request, time_to_seconds
+from utils import send_request, async_send_request, time_to_seconds
 from Bbox import Location, Bbox_Description
 
 
-def detect_close_button_time_location(client, video, start_time=None, end_time=None):
+def build_close_button_time_location_request(video, start_time=None, end_time=None):
     class CloseButton(BaseModel):
         close_button: bool = Field(..., description="Decide whether a 'close button' occurs or not.")
         timestamp: str = Field(...,
@@ -92,11 +92,20 @@ def detect_close_button_time_location(client, video, start_time=None, end_time=N
         ]
     )
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def detect_close_button_time_location(client, video, start_time=None, end_time=None):
+    request = build_close_button_time_location_request(video, start_time, end_time)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
+async def detect_close_button_time_location_async(client, video, start_time=None, end_time=None):
+    request = build_close_button_time_location_request(video, start_time, end_time)
+    response = await async_send_request(client=client, **request)
     return json.loads(response.text)
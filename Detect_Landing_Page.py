@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request
+from utils import send_request, async_send_request
 from Bbox import Location
 
 
-def detect_landing_page_time(client, video, start_time=None, end_time=None):
+def build_landing_page_time_request(video, start_time=None, end_time=None):
     class LandingPage(BaseModel):
         landing_page: bool = Field(..., description="Decide whether a 'landing page' occurs or not.")
         timestamp: str = Field(...,
@@ -68,11 +68,20 @@ def detect_landing_page_time(client, video, start_time=None, end_time=None):
 
     content = [video, prompt_detect_landing_page]
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def detect_landing_page_time(client, video, start_time=None, end_time=None):
+    request = build_landing_page_time_request(video, start_time, end_time)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
+async def detect_landing_page_time_async(client, video, start_time=None, end_time=None):
+    request = build_landing_page_time_request(video, start_time, end_time)
+    response = await async_send_request(client=client, **request)
     return json.loads(response.text)
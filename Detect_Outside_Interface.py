@@ -4,10 +4,10 @@ from pydantic import BaseModel, Field
 from google.genai import types
 from typing import Literal
 
-from utils import send_request, time_to_seconds, seconds_to_mmss
+from utils import send_request, async_send_request, time_to_seconds, seconds_to_mmss
 
 
-def detect_outside_interface(client, video, start_time=None, end_time=None):
+def build_outside_interface_request(video, start_time=None, end_time=None):
     class Outside_Interface(BaseModel):
         go_outside: bool = Field(..., description="Whether the user gets out of the app or not.")
         # outside_interface_type: Literal["Home Screen", "Control Center", "Notification Center", "Browser", "App Switcher", "Others"] = Field(..., description="The interface type, should be in one of the following strings: 'Home Screen', 'Control Center', 'Notification Center', 'Browser', 'App Switcher', 'Others'.")
@@ -82,13 +82,24 @@ def detect_outside_interface(client, video, start_time=None, end_time=None):
 
         content = [video, prompt_detect_outside_interface]
 
-        response = send_request(
-            client=client,
-            model="gemini-2.5-flash-preview-05-20",
-            contents=content,
-            config=config,
-        )
+        return {
+            "model": "gemini-2.5-flash-preview-05-20",
+            "contents": content,
+            "config": config,
+        }
+
+
+def detect_outside_interface(client, video, start_time=None, end_time=None):
+    request = build_outside_interface_request(video, start_time, end_time)
+    if request is None:
+        return None
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
-        # print("Check Outside Interface:")
-        # print(response.text)
-        return json.loads(response.text)
\ No newline at end of file
+async def detect_outside_interface_async(client, video, start_time=None, end_time=None):
+    request = build_outside_interface_request(video, start_time, end_time)
+    if request is None:
+        return None
+    response = await async_send_request(client=client, **request)
+    return json.loads(response.text)
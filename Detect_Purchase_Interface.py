@@ -3,10 +3,10 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request
+from utils import send_request, async_send_request
 
 
-def detect_purchase_interface(client, video):
+def build_purchase_interface_request(video):
     class PurchaseInterface(BaseModel):
         timestamp: str = Field(...,
                             description="The timestamp when the purchase interface appears, should be represented in the format 'mm:ss'.")
@@ -70,14 +70,20 @@ def detect_purchase_interface(client, video):
 
     contents = [video, prompt_detect_purchase_interface]
 
-    # Send request with function declarations
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=contents,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": contents,
+        "config": config,
+    }
+
+
+def detect_purchase_interface(client, video):
+    request = build_purchase_interface_request(video)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
-    # print("Detect Purchase Interfaces:")
-    # print(response.text)
+async def detect_purchase_interface_async(client, video):
+    request = build_purchase_interface_request(video)
+    response = await async_send_request(client=client, **request)
     return json.loads(response.text)
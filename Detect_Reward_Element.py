@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request
+from utils import send_request, async_send_request
 from Bbox import Location, Bbox_Description
 
 
-def detect_reward_element_time_location(client, video, start_time=None, end_time=None):
+def build_reward_element_time_location_request(video, start_time=None, end_time=None):
     class RewardElement(BaseModel):
         timestamp: str = Field(...,
                                description="The timestamp at which the element (text, icon, et al.) displaying rewards to the user, such as unlocking more app features or offering in-game currency or items. Should be represented in the format 'mm:ss'.")
@@ -70,11 +70,20 @@ def detect_reward_element_time_location(client, video, start_time=None, end_time
 
     content = [video, prompt_detect_reward_element]
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def detect_reward_element_time_location(client, video, start_time=None, end_time=None):
+    request = build_reward_element_time_location_request(video, start_time, end_time)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
+async def detect_reward_element_time_location_async(client, video, start_time=None, end_time=None):
+    request = build_reward_element_time_location_request(video, start_time, end_time)
+    response = await async_send_request(client=client, **request)
     return json.loads(response.text)
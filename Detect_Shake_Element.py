@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request, time_to_seconds
+from utils import send_request, async_send_request, time_to_seconds
 from Bbox import Location, Bbox_Description
 
 
-def detect_shake_element_time_location(client, video, start_time=None, end_time=None):
+def build_shake_element_time_location_request(video, start_time=None, end_time=None):
     class ShakeElement(BaseModel):
         timestamp: str = Field(...,
                                description="The timestamp at which the element (text, icon, et al.) suggesting the user shake their phones appears, should be represented in the format 'mm:ss'.")
@@ -70,11 +70,20 @@ def detect_shake_element_time_location(client, video, start_time=None, end_time=
 
     content = [video, prompt_detect_shake_element]
 
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def detect_shake_element_time_location(client, video, start_time=None, end_time=None):
+    request = build_shake_element_time_location_request(video, start_time, end_time)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
+async def detect_shake_element_time_location_async(client, video, start_time=None, end_time=None):
+    request = build_shake_element_time_location_request(video, start_time, end_time)
+    response = await async_send_request(client=client, **request)
     return json.loads(response.text)
@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request, time_to_seconds
+from utils import send_request, async_send_request, time_to_seconds
 from Bbox import Location, Bbox_Description
 
 
-def detect_voluntary_ad_trigger_element_time_location(client, video, start_time=None, end_time=None):
+def build_voluntary_ad_trigger_element_time_location_request(video, start_time=None, end_time=None):
     class VoluntaryAdTriggerElement(BaseModel):
         timestamp: str = Field(...,
                                description="The timestamp at which the element (text, icon, et al.) implying or suggesting users to watch ads appears, should be represented in the format 'mm:ss'.")
@@ -89,14 +89,11 @@ def detect_voluntary_ad_trigger_element_time_location(client, video, start_time=
             ]
         )
 
-        response = send_request(
-            client=client,
-            model="gemini-2.5-flash-preview-05-20",
-            contents=content,
-            config=config,
-        )
-
-        return json.loads(response.text)
+        return {
+            "model": "gemini-2.5-flash-preview-05-20",
+            "contents": content,
+            "config": config,
+        }
 
     else:
         # prompt_detect_watch_ad_element = '''
@@ -146,11 +143,20 @@ def detect_voluntary_ad_trigger_element_time_location(client, video, start_time=
 
         content = [video, prompt_detect_voluntary_ad_trigger_element]
 
-        response = send_request(
-            client=client,
-            model="gemini-2.5-flash-preview-05-20",
-            contents=content,
-            config=config,
-        )
+        return {
+            "model": "gemini-2.5-flash-preview-05-20",
+            "contents": content,
+            "config": config,
+        }
+
+
+def detect_voluntary_ad_trigger_element_time_location(client, video, start_time=None, end_time=None):
+    request = build_voluntary_ad_trigger_element_time_location_request(video, start_time, end_time)
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
-        return json.loads(response.text)
+async def detect_voluntary_ad_trigger_element_time_location_async(client, video, start_time=None, end_time=None):
+    request = build_voluntary_ad_trigger_element_time_location_request(video, start_time, end_time)
+    response = await async_send_request(client=client, **request)
+    return json.loads(response.text)
@@ -3,11 +3,11 @@ import json
 from pydantic import BaseModel, Field
 from google.genai import types
 
-from utils import send_request, time_to_seconds
+from utils import send_request, async_send_request, time_to_seconds
 from Bbox import Location
 
 
-def detect_watch_ad_icon_time_location(client, video, start_time=None, end_time=None):
+def build_watch_ad_icon_time_location_request(video, start_time=None, end_time=None):
     class WatchAdIcon(BaseModel):
         timestamp: str = Field(...,
                                description="The timestamp at which the icon implying or suggesting users to watch ads appears, should be represented in the format 'mm:ss'.")
@@ -63,13 +63,24 @@ def detect_watch_ad_icon_time_location(client, video, start_time=None, end_time=
             ]
         )
 
-        response = send_request(
-            client=client,
-            model="gemini-2.5-flash-preview-05-20",
-            contents=content,
-            config=config,
-        )
+        return {
+            "model": "gemini-2.5-flash-preview-05-20",
+            "contents": content,
+            "config": config,
+        }
+
+
+def detect_watch_ad_icon_time_location(client, video, start_time=None, end_time=None):
+    request = build_watch_ad_icon_time_location_request(video, start_time, end_time)
+    if request is None:
+        return None
+    response = send_request(client=client, **request)
+    return json.loads(response.text)
+
 
-        # print("Detect Watch Ad Icon:")
-        # print(response.text)
-        return json.loads(response.text)
\ No newline at end of file
+async def detect_watch_ad_icon_time_location_async(client, video, start_time=None, end_time=None):
+    request = build_watch_ad_icon_time_location_request(video, start_time, end_time)
+    if request is None:
+        return None
+    response = await async_send_request(client=client, **request)
+    return json.loads(response.text)
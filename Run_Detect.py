@@ -2,10 +2,10 @@ import json
 from moviepy import VideoFileClip
 
 from utils import time_to_seconds, seconds_to_mmss, dump_upload_files, get_client, upload_file
-from Detect_Ad import detect_ads, recheck_ads
+from Detect_Ad import detect_ads, recheck_ads, retrieve_exemplars
 from Detect_Outside_Interface import detect_outside_interface
 from Decide_App_Resumption_Ads import Decide_App_Resumption_Ads
-from Detect_Click import detect_click_time_location
+from Detect_Click import detect_click_time_location_cached, get_click_timeline, release_click_timeline
 # from Detect_Hover import detect_hover_time_location
 # from Detect_Watch_Ad_Text import detect_watch_ad_text_time_location
 # from Detect_Watch_Ad_Icon import detect_watch_ad_icon_time_location
@@ -24,9 +24,221 @@ from Decide_Multiple_Close_Buttons import Decide_Multiple_Close_Buttons
 from Detect_Purchase_Interface import detect_purchase_interface
 from Detect_Ad_Removal_Element import detect_ad_removal_element_time_location
 from Decide_Paid_Ad_Removal import Decide_Paid_Ad_Removal
+from stage_graph import StageGraph
 
 
-def run_detect(client, video, video_duration, available_dp):
+def run_detect(client, video, video_duration, available_dp, max_workers=8, timing=None, video_local_path=None):
+    """
+    以阶段图并发执行各检测阶段：各广告的后续检查、整段视频的奖励元素 / 购买界面检测，以及同一时间窗内的兄弟检测器互不等待。
+    全部阶段结束后按原先的顺序组装 result_dict；timing 为 dict 时写入关键路径等耗时统计。
+    给出 video_local_path 时点击检测在本地完成，Gemini 只作为找不到光标时的备用。
+    """
+    graph = StageGraph(max_workers=max_workers)
+    get_click_timeline(video, video_local_path)
+
+    # 时间段是否近似覆盖另一个
+    def is_approximately_covered(a_start, a_end, b_start, b_end, tolerance=3):
+        """是否 a 被 b 覆盖（带容差）"""
+        return (
+                b_start <= a_start + tolerance and
+                b_end >= a_end - tolerance
+        )
+
+    def redirection_window(recheck_ads_time, landing_page_time):
+        start_time = seconds_to_mmss(max(time_to_seconds(recheck_ads_time["start_time"]), time_to_seconds(landing_page_time["timestamp"]) - 2))
+        end_time = seconds_to_mmss(max(time_to_seconds(start_time) + 1, time_to_seconds(landing_page_time["timestamp"])))
+        return start_time, end_time
+
+    def purchase_window(purchase_interface):
+        timestamp = purchase_interface["timestamp"]
+        start_time = seconds_to_mmss(max(0, time_to_seconds(timestamp) - 3))
+        end_time = seconds_to_mmss(min(video_duration, time_to_seconds(timestamp) + 3))
+        return start_time, end_time
+
+    def detect_ads_stage():
+        ads_time = detect_ads(client, video)
+        # 所有广告的示例一次检索，之后每个广告的复查互不依赖
+        windows = [(ad["start_timestamp"], ad["end_timestamp"]) for ad in ads_time]
+        graph.add("exemplars", lambda _: retrieve_exemplars(client, video, windows, video_local_path), "ads")
+        recheck_stages = [add_recheck_stage(i, ad) for i, ad in enumerate(ads_time)]
+        graph.add("further check", further_check_stage, "ads", *recheck_stages)
+        return ads_time
+
+    def add_recheck_stage(i, ad):
+        return graph.add(f"recheck:{i}", lambda _, exemplars: recheck_ads(client, video, ad["start_timestamp"], ad["end_timestamp"], ad["full_screen"], ad, video_local_path, exemplars[i]), "ads", "exemplars")
+
+    def further_check_stage(ads_time, *recheck_results):
+        further_check = {}
+        for ad, (recheck_ads_time, ad_summarize, retriever_results, exemplar_report) in zip(ads_time, recheck_results):
+            further_check[ad["start_timestamp"]] = {
+                'Recheck Ad': {
+                    'Parameter': [ad["start_timestamp"], ad["end_timestamp"]],
+                    'ad_summarize': ad_summarize,
+                    'retriever_results': [json.loads(retriever_result) for retriever_result in retriever_results],
+                    'exemplar_budget': exemplar_report,
+                    'Result': recheck_ads_time
+                },
+            }
+
+        # 所有广告时间段（统一格式）
+        all_segments = []  # [(start_dt, end_dt)]
+        for ad_check in further_check.values():
+            rechecked_times = ad_check["Recheck Ad"]["Result"]  # List of [start, end]
+            all_segments.append((time_to_seconds(rechecked_times["start_time"]), time_to_seconds(rechecked_times["end_time"]), rechecked_times["full_screen"]))
+
+        # 去重逻辑
+        keep_segments = []
+
+        for i, (start_i, end_i, full_screen_i) in enumerate(all_segments):
+            duration_i = end_i - start_i
+            is_covered = False
+
+            if full_screen_i:
+                for j, (start_j, end_j, full_screen_j) in enumerate(all_segments):
+                    if i == j:
+                        continue
+                    if not full_screen_j:
+                        continue
+                    duration_j = end_j - start_j
+
+                    # 检查是否近似被覆盖
+                    if is_approximately_covered(start_i, end_i, start_j, end_j):
+                        if duration_j >= duration_i:
+                            is_covered = True
+                            break
+
+            if not is_covered and not (start_i == "00:00" and end_i == "00:00"):
+                keep_segments.append(i)
+
+        for i, ad_check in enumerate(further_check.values()):
+            ad_check['Recheck Ad']['Not Covered'] = False
+            if i in keep_segments:
+                ad_check['Recheck Ad']['Not Covered'] = True
+
+        for i, ad in enumerate(ads_time):
+            ad_check = further_check[ad["start_timestamp"]]
+            recheck_ads_time = ad_check['Recheck Ad']['Result']
+            if not ad_check["Recheck Ad"]["Not Covered"]:
+                continue
+            if recheck_ads_time["start_time"] == "00:00" and recheck_ads_time["end_time"] == "00:00":
+                continue
+            if recheck_ads_time["start_time"] == recheck_ads_time["end_time"]:
+                continue
+            add_ad_stages(f"ad:{i}:", recheck_ads_time)
+
+        return further_check
+
+    def add_ad_stages(prefix, recheck_ads_time):
+        """为一个保留下来的广告添加各暗模式的检测阶段；所有阶段都依赖 further check，彼此之间只按数据依赖等待"""
+        start_time = recheck_ads_time["start_time"]
+        end_time = recheck_ads_time["end_time"]
+        full_screen = bool(recheck_ads_time["full_screen"])
+
+        if "App Resumption Ads" in available_dp and full_screen:
+            def app_resumption_ads(_, outside_interface_time):
+                if bool(outside_interface_time["go_outside"]) and time_to_seconds(outside_interface_time["go_outside_time"]) > 0:
+                    return Decide_App_Resumption_Ads(client, video, recheck_ads_time, outside_interface_time,
+                                                     outside_interface_time["go_outside_time"], end_time)
+                return None
+
+            graph.add(prefix + "outside interface", lambda _: detect_outside_interface(client, video, end_time=start_time), "further check")
+            graph.add(prefix + "app resumption ads", app_resumption_ads, "further check", prefix + "outside interface")
+
+        before_start_time = seconds_to_mmss(max(0, time_to_seconds(start_time) - 3))
+        check_unexpected = "Unexpected Full-Screen Ads" in available_dp and full_screen and time_to_seconds(before_start_time) > 0
+        check_closure = "Ad Closure Failure" in available_dp and full_screen
+        check_close_buttons = "Multiple Close Buttons" in available_dp or "Ad Without Exit Option" in available_dp
+
+        # 先对各分支已知的点击时间窗的并集做一次点击检测，各分支再从点击时间线中截取自己的时间窗
+        click_deps = ["further check"]
+        if check_unexpected or check_closure:
+            clicks_start = before_start_time if check_unexpected else start_time
+            clicks_end = end_time if check_closure else start_time
+            click_deps.append(graph.add(prefix + "clicks", lambda _: detect_click_time_location_cached(client, video, clicks_start, clicks_end), "further check"))
+
+        if check_unexpected:
+            graph.add(prefix + "click before ad", lambda *_: detect_click_time_location_cached(client, video, before_start_time, start_time), *click_deps)
+            graph.add(prefix + "voluntary ad trigger element",
+                      lambda _: detect_voluntary_ad_trigger_element_time_location(client, video, before_start_time, start_time), "further check")
+            graph.add(prefix + "unexpected full-screen ads",
+                      lambda _, click_time_location, voluntary_ad_trigger_element_time_location: Decide_Unexpected_Full_Screen_Ads(
+                          client, video, recheck_ads_time, click_time_location, voluntary_ad_trigger_element_time_location, before_start_time, end_time),
+                      "further check", prefix + "click before ad", prefix + "voluntary ad trigger element")
+
+        if "Auto-Redirect Ads" in available_dp and full_screen:
+            def click_before_redirection(_, landing_page_time, *__):
+                if landing_page_time["landing_page"]:
+                    return detect_click_time_location_cached(client, video, *redirection_window(recheck_ads_time, landing_page_time))
+                return None
+
+            def auto_redirect_ads(_, landing_page_time, click_time):
+                if landing_page_time["landing_page"]:
+                    return Decide_Auto_Redirect_Ads(client, video, recheck_ads_time, landing_page_time, click_time)
+                return None
+
+            graph.add(prefix + "landing page", lambda _: detect_landing_page_time(client, video, start_time, end_time), "further check")
+            graph.add(prefix + "click before redirection", click_before_redirection, "further check", prefix + "landing page", *click_deps[1:])
+            graph.add(prefix + "auto-redirect ads", auto_redirect_ads, "further check", prefix + "landing page", prefix + "click before redirection")
+
+        # Ad Closure Failure 与 Multiple Close Buttons / Ad Without Exit Option 共用同一次关闭按钮检测
+        if check_closure or check_close_buttons:
+            graph.add(prefix + "close button", lambda _: detect_close_button_time_location(client, video, start_time, end_time), "further check")
+
+        if check_closure:
+            graph.add(prefix + "click", lambda *_: detect_click_time_location_cached(client, video, start_time, end_time), *click_deps)
+            graph.add(prefix + "ad closure failure",
+                      lambda _, close_button_time_location, click_time_location: Decide_Ad_Closure_Failure(
+                          client, video, recheck_ads_time, close_button_time_location, click_time_location),
+                      "further check", prefix + "close button", prefix + "click")
+
+        if "Gesture-Induced Ad Redirection" in available_dp and full_screen:
+            graph.add(prefix + "shake element", lambda _: detect_shake_element_time_location(client, video, start_time, end_time), "further check")
+            graph.add(prefix + "gesture-induced ad redirection",
+                      lambda _, shake_element_time_location: Decide_Gesture_Induced(client, video, recheck_ads_time, shake_element_time_location),
+                      "further check", prefix + "shake element")
+
+        if check_close_buttons:
+            graph.add(prefix + "ad without exit option",
+                      lambda _, close_button_time_location: Decide_Ad_Without_Exit_Option(client, video, recheck_ads_time, close_button_time_location),
+                      "further check", prefix + "close button")
+            graph.add(prefix + "multiple close buttons",
+                      lambda _, close_button_time_location: Decide_Multiple_Close_Buttons(client, video, recheck_ads_time, close_button_time_location),
+                      "further check", prefix + "close button")
+
+    def detect_purchase_interface_stage():
+        purchase_interface_time = detect_purchase_interface(client, video)
+        for j, purchase_interface in enumerate(purchase_interface_time):
+            add_purchase_stages(f"purchase:{j}:", purchase_interface)
+        return purchase_interface_time
+
+    def add_purchase_stages(prefix, purchase_interface):
+        start_time, end_time = purchase_window(purchase_interface)
+        graph.add(prefix + "ad removal element",
+                  lambda _: detect_ad_removal_element_time_location(client, video, start_time, end_time), "purchase interface")
+        graph.add(prefix + "paid ad removal",
+                  lambda _, ad_removal_element_time_location: Decide_Paid_Ad_Removal(
+                      client, video, purchase_interface, ad_removal_element_time_location, start_time, end_time),
+                  "purchase interface", prefix + "ad removal element")
+
+    graph.add("ads", detect_ads_stage)
+    if "Reward-Based Ads" in available_dp:
+        graph.add("voluntary ad trigger element", lambda: detect_voluntary_ad_trigger_element_time_location(client, video))
+        graph.add("reward element", lambda: detect_reward_element_time_location(client, video))
+        graph.add("reward-based ads",
+                  lambda voluntary_ad_trigger_element_time_location, reward_element_time_location: Decide_Reward_Based_Ads(
+                      client, video, voluntary_ad_trigger_element_time_location, reward_element_time_location),
+                  "voluntary ad trigger element", "reward element")
+    if "Paid Ad Removal" in available_dp:
+        graph.add("purchase interface", detect_purchase_interface_stage)
+
+    try:
+        graph.run()
+    finally:
+        click_stats = release_click_timeline(video)
+    if timing is not None:
+        timing.update(graph.stats())
+        timing["clicks"] = click_stats
+
     result_dict = {"prediction": {}}
 
     result_dict["prediction"]["App Resumption Ads"] = {"video-level": False, 'instance-level': []}
@@ -39,95 +251,26 @@ def run_detect(client, video, video_duration, available_dp):
     result_dict["prediction"]["Multiple Close Buttons"] = {"video-level": False, 'instance-level': []}
     result_dict["prediction"]["Paid Ad Removal"] = {"video-level": False, 'instance-level': []}
 
-    ads_time = detect_ads(client, video)
+    ads_time = graph.result("ads")
     result_dict['Ad'] = {'Result': ads_time}
+    result_dict['Ad']['Further Check'] = graph.result("further check")
 
-    result_dict['Ad']['Further Check'] = {}
-    for ad in ads_time:
-        result_timestamp = start_time = ad["start_timestamp"]
-        end_time = ad["end_timestamp"]
-        full_screen = ad["full_screen"]
-        recheck_ads_time, ad_summarize, retriever_results = recheck_ads(client, video, start_time, end_time, full_screen, ad)
-        result_dict["Ad"]['Further Check'][result_timestamp] = {
-            'Recheck Ad': {
-                'Parameter': [start_time, end_time],
-                'ad_summarize': ad_summarize,
-                'retriever_results': [json.loads(retriever_result) for retriever_result in retriever_results],
-                'Result': recheck_ads_time
-            },
-        }
-
-    # 时间段是否近似覆盖另一个
-    def is_approximately_covered(a_start, a_end, b_start, b_end, tolerance=3):
-        """是否 a 被 b 覆盖（带容差）"""
-        return (
-                b_start <= a_start + tolerance and
-                b_end >= a_end - tolerance
-        )
+    for i, ad in enumerate(ads_time):
+        prefix = f"ad:{i}:"
+        further_check = result_dict["Ad"]["Further Check"][ad["start_timestamp"]]
+        recheck_ads_time = further_check['Recheck Ad']['Result']
+        start_time = recheck_ads_time["start_time"]
+        end_time = recheck_ads_time["end_time"]
 
-    # 所有广告时间段（统一格式）
-    all_segments = []  # [(start_dt, end_dt)]
-    for ad_check in result_dict["Ad"]["Further Check"].values():
-        rechecked_times = ad_check["Recheck Ad"]["Result"]  # List of [start, end]
-        all_segments.append((time_to_seconds(rechecked_times["start_time"]), time_to_seconds(rechecked_times["end_time"]), rechecked_times["full_screen"]))
-
-    # 去重逻辑
-    keep_segments = []
-
-    for i, (start_i, end_i, full_screen_i) in enumerate(all_segments):
-        duration_i = end_i - start_i
-        is_covered = False
-
-        if full_screen_i:
-            for j, (start_j, end_j, full_screen_j) in enumerate(all_segments):
-                if i == j:
-                    continue
-                if not full_screen_j:
-                    continue
-                duration_j = end_j - start_j
-
-                # 检查是否近似被覆盖
-                if is_approximately_covered(start_i, end_i, start_j, end_j):
-                    if duration_j >= duration_i:
-                        is_covered = True
-                        break
-
-        if not is_covered and not (start_i == "00:00" and end_i == "00:00"):
-            keep_segments.append(i)
-
-    for i, ad_check in enumerate(result_dict["Ad"]["Further Check"].values()):
-        ad_check['Recheck Ad']['Not Covered'] = False
-        if i in keep_segments:
-            ad_check['Recheck Ad']['Not Covered'] = True
-
-    for ad in ads_time:
-        result_timestamp = ad["start_timestamp"]
-        recheck_ads_time = result_dict["Ad"]["Further Check"][result_timestamp]['Recheck Ad']['Result']
-
-        if not result_dict["Ad"]["Further Check"][result_timestamp]["Recheck Ad"]["Not Covered"]:
-            continue
-
-        if recheck_ads_time["start_time"] == "00:00" and recheck_ads_time["end_time"] == "00:00":
-            continue
-
-        if recheck_ads_time["start_time"] == recheck_ads_time["end_time"]:
-            continue
-
-        if "App Resumption Ads" in available_dp and bool(recheck_ads_time["full_screen"]):
-            start_time = recheck_ads_time["start_time"]
-            end_time = recheck_ads_time["end_time"]
-            outside_interface_time = detect_outside_interface(client, video, end_time=start_time)
-            result_dict["Ad"]['Further Check'][result_timestamp].update({
+        if prefix + "outside interface" in graph.results:
+            outside_interface_time = graph.result(prefix + "outside interface")
+            further_check.update({
                 'Outside Interface': {'Parameter': ['end_time=' + start_time], 'Result': outside_interface_time}
             })
-            if bool(outside_interface_time["go_outside"]) and time_to_seconds(
-                    outside_interface_time["go_outside_time"]) > 0:
-                start_time = outside_interface_time["go_outside_time"]
-                # Detect "App Resumption Ads"
-                App_Resumption_Ads = Decide_App_Resumption_Ads(client, video, recheck_ads_time, outside_interface_time,
-                                                               start_time, end_time)
-                result_dict["Ad"]['Further Check'][result_timestamp].update({
-                    'App Resumption Ads': {'Parameter': [start_time, end_time], 'Result': App_Resumption_Ads}
+            App_Resumption_Ads = graph.result(prefix + "app resumption ads")
+            if App_Resumption_Ads is not None:
+                further_check.update({
+                    'App Resumption Ads': {'Parameter': [outside_interface_time["go_outside_time"], end_time], 'Result': App_Resumption_Ads}
                 })
 
                 if App_Resumption_Ads["app_resumption_ads"]:
@@ -135,38 +278,15 @@ def run_detect(client, video, video_duration, available_dp):
                     result_dict["prediction"]["App Resumption Ads"]["instance-level"].append(
                         App_Resumption_Ads["ad_start_time"])
 
-        start_time = seconds_to_mmss(max(0, time_to_seconds(recheck_ads_time["start_time"]) - 3))
-        end_time = recheck_ads_time["end_time"]
-        if "Unexpected Full-Screen Ads" in available_dp and bool(recheck_ads_time["full_screen"]) and time_to_seconds(
-                start_time) > 0:
-            click_time_location = detect_click_time_location(client, video, start_time, recheck_ads_time["start_time"])
-            # hover_time_location = detect_hover_time_location(client, video, start_time, recheck_ads_time["start_time"])
-            # watch_ad_icon_time_location = detect_watch_ad_icon_time_location(client, video, start_time,
-            #                                                                  recheck_ads_time["start_time"])
-            # watch_ad_text_time_location = detect_watch_ad_text_time_location(client, video, start_time,
-            #                                                                  recheck_ads_time["start_time"])
-            voluntary_ad_trigger_element_time_location = detect_voluntary_ad_trigger_element_time_location(client, video, start_time, recheck_ads_time["start_time"])
-            # Detect "Unexpected Full-Screen Ads"
-            Unexpected_Full_Screen_Ads = Decide_Unexpected_Full_Screen_Ads(client, video, recheck_ads_time,
-                                                                           click_time_location,
-                                                                           # hover_time_location,
-                                                                           # watch_ad_icon_time_location,
-                                                                           # watch_ad_text_time_location,
-                                                                           voluntary_ad_trigger_element_time_location,
-                                                                           start_time,
-                                                                           end_time)
-            result_dict["Ad"]['Further Check'][result_timestamp].update({
-                'Click before Ad': {'Parameter': [start_time, recheck_ads_time["start_time"]],
-                                    'Result': click_time_location},
-                # 'Hover before Ad': {'Parameter': [start_time, recheck_ads_time["start_time"]],
-                #                     'Result': hover_time_location},
-                # 'Watch Ad Icon': {'Parameter': [start_time, recheck_ads_time["start_time"]],
-                #                   'Result': watch_ad_icon_time_location},
-                # 'Watch Ad Text': {'Parameter': [start_time, recheck_ads_time["start_time"]],
-                #                   'Result': watch_ad_text_time_location},
-                'Voluntary Ad Trigger Element': {'Parameter': [start_time, recheck_ads_time["start_time"]],
-                                                 'Result': voluntary_ad_trigger_element_time_location},
-                'Unexpected Full-Screen Ads': {'Parameter': [start_time, end_time],
+        if prefix + "unexpected full-screen ads" in graph.results:
+            before_start_time = seconds_to_mmss(max(0, time_to_seconds(start_time) - 3))
+            Unexpected_Full_Screen_Ads = graph.result(prefix + "unexpected full-screen ads")
+            further_check.update({
+                'Click before Ad': {'Parameter': [before_start_time, start_time],
+                                    'Result': graph.result(prefix + "click before ad")},
+                'Voluntary Ad Trigger Element': {'Parameter': [before_start_time, start_time],
+                                                 'Result': graph.result(prefix + "voluntary ad trigger element")},
+                'Unexpected Full-Screen Ads': {'Parameter': [before_start_time, end_time],
                                                'Result': Unexpected_Full_Screen_Ads},
             })
 
@@ -174,27 +294,21 @@ def run_detect(client, video, video_duration, available_dp):
                 result_dict["prediction"]["Unexpected Full-Screen Ads"]["video-level"] = True
                 result_dict["prediction"]["Unexpected Full-Screen Ads"]["instance-level"].append(Unexpected_Full_Screen_Ads["ad_start_time"])
 
-        if "Auto-Redirect Ads" in available_dp and recheck_ads_time["full_screen"]:
-            start_time = recheck_ads_time["start_time"]
-            end_time = recheck_ads_time["end_time"]
-
-            landing_page_time = detect_landing_page_time(client, video, start_time, end_time)
-            result_dict["Ad"]["Further Check"][result_timestamp].update({
+        if prefix + "landing page" in graph.results:
+            landing_page_time = graph.result(prefix + "landing page")
+            further_check.update({
                 'redirection': {
                     'landing page': landing_page_time
                 }
             })
 
             if landing_page_time["landing_page"]:
-                start_time = seconds_to_mmss(max(time_to_seconds(start_time), time_to_seconds(landing_page_time["timestamp"]) - 2))
-                end_time = seconds_to_mmss(max(time_to_seconds(start_time) + 1, time_to_seconds(landing_page_time["timestamp"])))
-                click_time = detect_click_time_location(client, video, start_time, end_time)
-                result_dict["Ad"]["Further Check"][result_timestamp]["redirection"].update({
-                    'click before redirection': click_time
+                further_check["redirection"].update({
+                    'click before redirection': graph.result(prefix + "click before redirection")
                 })
 
-                Auto_Redirect_Ads = Decide_Auto_Redirect_Ads(client, video, recheck_ads_time, landing_page_time, click_time)
-                result_dict["Ad"]["Further Check"][result_timestamp]["redirection"].update({
+                Auto_Redirect_Ads = graph.result(prefix + "auto-redirect ads")
+                further_check["redirection"].update({
                     'Auto-Redirect Ads': Auto_Redirect_Ads
                 })
 
@@ -202,25 +316,20 @@ def run_detect(client, video, video_duration, available_dp):
                     result_dict["prediction"]["Auto-Redirect Ads"]["video-level"] = True
                     result_dict["prediction"]["Auto-Redirect Ads"]["instance-level"].append(Auto_Redirect_Ads["timestamp"])
 
-        close_button = False
-        if "Ad Closure Failure" in available_dp and recheck_ads_time["full_screen"]:
-            start_time = recheck_ads_time["start_time"]
-            end_time = recheck_ads_time["end_time"]
-            close_button_time_location = detect_close_button_time_location(client, video, start_time, end_time)
-            close_button = True
-            result_dict["Ad"]["Further Check"][result_timestamp].update({
+        close_button_time_location = graph.result(prefix + "close button")
+        if prefix + "ad closure failure" in graph.results:
+            further_check.update({
                 'closure failure': {
                     'close button': close_button_time_location
                 }
             })
 
-            click_time_location = detect_click_time_location(client, video, start_time, end_time)
-            result_dict["Ad"]["Further Check"][result_timestamp]["closure failure"].update({
-                'click': click_time_location
+            further_check["closure failure"].update({
+                'click': graph.result(prefix + "click")
             })
 
-            Ad_Closure_Failures = Decide_Ad_Closure_Failure(client, video, recheck_ads_time, close_button_time_location, click_time_location)
-            result_dict["Ad"]["Further Check"][result_timestamp]["closure failure"].update({
+            Ad_Closure_Failures = graph.result(prefix + "ad closure failure")
+            further_check["closure failure"].update({
                 'Ad Closure Failure': Ad_Closure_Failures
             })
 
@@ -229,18 +338,15 @@ def run_detect(client, video, video_duration, available_dp):
                     result_dict["prediction"]["Ad Closure Failure"]["video-level"] = True
                     result_dict["prediction"]["Ad Closure Failure"]["instance-level"].append(Ad_Closure_Failure["timestamp"])
 
-        if "Gesture-Induced Ad Redirection" in available_dp and recheck_ads_time["full_screen"]:
-            start_time = recheck_ads_time["start_time"]
-            end_time = recheck_ads_time["end_time"]
-            shake_element_time_location = detect_shake_element_time_location(client, video, start_time, end_time)
-            result_dict["Ad"]["Further Check"][result_timestamp].update({
+        if prefix + "gesture-induced ad redirection" in graph.results:
+            further_check.update({
                 'gesture induced': {
-                    'shake element': shake_element_time_location
+                    'shake element': graph.result(prefix + "shake element")
                 }
             })
 
-            Gesture_Induced_Ad_Redirection = Decide_Gesture_Induced(client, video, recheck_ads_time, shake_element_time_location)
-            result_dict["Ad"]["Further Check"][result_timestamp]["gesture induced"].update({
+            Gesture_Induced_Ad_Redirection = graph.result(prefix + "gesture-induced ad redirection")
+            further_check["gesture induced"].update({
                 'Gesture-Induced Ad Redirection': Gesture_Induced_Ad_Redirection
             })
 
@@ -248,19 +354,15 @@ def run_detect(client, video, video_duration, available_dp):
                 result_dict["prediction"]["Gesture-Induced Ad Redirection"]["video-level"] = True
                 result_dict["prediction"]["Gesture-Induced Ad Redirection"]["instance-level"].append(Gesture_Induced_Ad_Redirection["timestamp"])
 
-        if "Multiple Close Buttons" in available_dp or "Ad Without Exit Option" in available_dp:
-            start_time = recheck_ads_time["start_time"]
-            end_time = recheck_ads_time["end_time"]
-            if not close_button:
-                close_button_time_location = detect_close_button_time_location(client, video, start_time, end_time)
-            result_dict["Ad"]["Further Check"][result_timestamp].update({
+        if prefix + "multiple close buttons" in graph.results:
+            further_check.update({
                 'multiple (or no) close button': {
                     'close button': close_button_time_location
                 }
             })
 
-            Ad_Without_Exit_Option = Decide_Ad_Without_Exit_Option(client, video, recheck_ads_time, close_button_time_location)
-            result_dict["Ad"]["Further Check"][result_timestamp]['multiple (or no) close button'].update({
+            Ad_Without_Exit_Option = graph.result(prefix + "ad without exit option")
+            further_check['multiple (or no) close button'].update({
                 'Ad Without Exit Option': Ad_Without_Exit_Option
             })
 
@@ -268,8 +370,8 @@ def run_detect(client, video, video_duration, available_dp):
                 result_dict["prediction"]["Ad Without Exit Option"]["video-level"] = True
                 result_dict["prediction"]["Ad Without Exit Option"]["instance-level"].append(Ad_Without_Exit_Option["timestamp"])
 
-            Multiple_Close_Buttons = Decide_Multiple_Close_Buttons(client, video, recheck_ads_time, close_button_time_location)
-            result_dict["Ad"]["Further Check"][result_timestamp]['multiple (or no) close button'].update({
+            Multiple_Close_Buttons = graph.result(prefix + "multiple close buttons")
+            further_check['multiple (or no) close button'].update({
                 'Multiple_Close_Buttons': Multiple_Close_Buttons
             })
 
@@ -278,13 +380,10 @@ def run_detect(client, video, video_duration, available_dp):
                 result_dict["prediction"]["Multiple Close Buttons"]["instance-level"].append(Multiple_Close_Buttons["timestamp"])
 
     if "Reward-Based Ads" in available_dp:
-        voluntary_ad_trigger_element_time_location = detect_voluntary_ad_trigger_element_time_location(client, video)
-        result_dict['voluntary_ad_trigger_element'] = {'Result': voluntary_ad_trigger_element_time_location}
-
-        reward_element_time_location = detect_reward_element_time_location(client, video)
-        result_dict['reward_element'] = {'Result': reward_element_time_location}
+        result_dict['voluntary_ad_trigger_element'] = {'Result': graph.result("voluntary ad trigger element")}
+        result_dict['reward_element'] = {'Result': graph.result("reward element")}
 
-        Reward_Based_Ads = Decide_Reward_Based_Ads(client, video, voluntary_ad_trigger_element_time_location, reward_element_time_location)
+        Reward_Based_Ads = graph.result("reward-based ads")
         result_dict["Reward-Based Ads"] = {'Result': Reward_Based_Ads}
 
         for Reward_Based_Ad in Reward_Based_Ads:
@@ -293,18 +392,15 @@ def run_detect(client, video, video_duration, available_dp):
                 result_dict["prediction"]["Reward-Based Ads"]["instance-level"].append(Reward_Based_Ad["timestamp"])
 
     if "Paid Ad Removal" in available_dp:
-        purchase_interface_time = detect_purchase_interface(client, video)
+        purchase_interface_time = graph.result("purchase interface")
         result_dict["purchase_interface"] = {'Result': purchase_interface_time}
 
-        for purchase_interface in purchase_interface_time:
+        for j, purchase_interface in enumerate(purchase_interface_time):
             timestamp = purchase_interface["timestamp"]
-            start_time = seconds_to_mmss(max(0, time_to_seconds(timestamp) - 3))
-            end_time = seconds_to_mmss(min(video_duration, time_to_seconds(timestamp) + 3))
-            ad_removal_element_time_location = detect_ad_removal_element_time_location(client, video, start_time, end_time)
-            # Detect "Paid Ad Removal"
-            Paid_Ad_Removal = Decide_Paid_Ad_Removal(client, video, purchase_interface, ad_removal_element_time_location, start_time, end_time)
+            start_time, end_time = purchase_window(purchase_interface)
+            Paid_Ad_Removal = graph.result(f"purchase:{j}:paid ad removal")
             result_dict["purchase_interface"][timestamp] = {
-                'Ad Removal Element': {'Parameter': [start_time, end_time], 'Result': ad_removal_element_time_location},
+                'Ad Removal Element': {'Parameter': [start_time, end_time], 'Result': graph.result(f"purchase:{j}:ad removal element")},
                 'Paid Ad Removal': {'Parameter': [start_time, end_time], 'Result': Paid_Ad_Removal},
             }
 
@@ -325,6 +421,10 @@ def upload_file_and_run_detect(video_local_path, available_dp):
     video_file = upload_file(client, video_local_path)
     dump_upload_files()
 
+    return detect_uploaded(client, video_file, video_local_path, available_dp)
+
+
+def detect_uploaded(client, video_file, video_local_path, available_dp):
     video_local_info = VideoFileClip(video_local_path)
     video_duration = int(video_local_info.duration)
 
@@ -332,4 +432,15 @@ def upload_file_and_run_detect(video_local_path, available_dp):
     #     return run_detect(client, video_file)
     # except Exception as e:
     #     return {'broken_client': True, 'error_information': traceback.format_exc()}
-    return run_detect(client, video_file, video_duration, available_dp)
+    timing = {}
+    result_dict = run_detect(client, video_file, video_duration, available_dp, timing=timing, video_local_path=video_local_path)
+    print(f"[Timing] {video_local_path}: {timing['stages']} stages, makespan {timing['makespan']}s, "
+          f"stage time {timing['stage_seconds']}s, critical path {timing['critical_path']}, clicks {timing['clicks']}")
+    return result_dict
+
+
+def run_detect_on_staged(staged, available_dp):
+    """供 upload_pipeline.pipelined 使用：视频已由后台上传线程上传并处于 ACTIVE"""
+    if staged.error:
+        raise staged.error
+    return detect_uploaded(staged.client, staged.video_file, staged.local_path, available_dp)
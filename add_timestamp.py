@@ -2,6 +2,33 @@ import cv2
 import glob
 import os
 
+def stamp_frame(frame, frame_idx, fps):
+    """在帧的右下角写入 "Frame: N | Time: x.xxs"，validate_7_2 使用的 frameid 视频以此标注帧号"""
+    height, width = frame.shape[:2]
+
+    # 计算时间戳（秒）
+    time_in_sec = frame_idx / fps
+    timestamp = f"{time_in_sec:.2f}s"
+
+    # 准备文字
+    text = f"Frame: {frame_idx} | Time: {timestamp}"
+
+    # 设置文字位置（右下角）
+    font = cv2.FONT_HERSHEY_SIMPLEX
+    scale = 1.4
+    thickness = 4
+    color = (0, 255, 255)  # 黄色高亮
+    text_size, _ = cv2.getTextSize(text, font, scale, thickness)
+    x = width - text_size[0] - 10
+    y = height - 10
+
+    # 添加阴影背景（可选）
+    cv2.rectangle(frame, (x - 5, y - text_size[1] - 5), (x + text_size[0] + 5, y + 5), (0, 0, 0), -1)
+
+    # 绘制文字
+    cv2.putText(frame, text, (x, y), font, scale, color, thickness, cv2.LINE_AA)
+
+
 def process_video(input_file, output_file):
 
     # 打开视频文件
@@ -25,27 +52,7 @@ def process_video(input_file, output_file):
         if not ret:
             break
 
-        # 计算时间戳（秒）
-        time_in_sec = frame_idx / fps
-        timestamp = f"{time_in_sec:.2f}s"
-
-        # 准备文字
-        text = f"Frame: {frame_idx} | Time: {timestamp}"
-
-        # 设置文字位置（右下角）
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        scale = 1.4
-        thickness = 4
-        color = (0, 255, 255)  # 黄色高亮
-        text_size, _ = cv2.getTextSize(text, font, scale, thickness)
-        x = width - text_size[0] - 10
-        y = height - 10
-
-        # 添加阴影背景（可选）
-        cv2.rectangle(frame, (x - 5, y - text_size[1] - 5), (x + text_size[0] + 5, y + 5), (0, 0, 0), -1)
-
-        # 绘制文字
-        cv2.putText(frame, text, (x, y), font, scale, color, thickness, cv2.LINE_AA)
+        stamp_frame(frame, frame_idx, fps)
 
         # 写入新视频
         out.write(frame)
@@ -0,0 +1,66 @@
+"""
+对比原先逐帧启动 ffmpeg（定位 -> 解码 -> PNG 编码 -> PIL 解码）的取帧方式与 frame_sampler.sample_frames 的单次解码方式。
+输出两种方式的耗时、每秒取帧数，以及同一时间戳上两者像素的平均差异。
+"""
+import io
+import time
+import argparse
+
+import ffmpeg
+import numpy as np
+from PIL import Image
+
+from frame_sampler import sample_frames
+
+
+def extract_frame_png(video_path, timestamp_sec):
+    """原 rag.extract_frame_ffmpeg 的做法"""
+    out, _ = (
+        ffmpeg
+        .input(video_path, ss=timestamp_sec)
+        .output('pipe:', vframes=1, format='image2pipe', vcodec='png')
+        .run(capture_stdout=True, capture_stderr=True)
+    )
+    return Image.open(io.BytesIO(out))
+
+
+def run_legacy(video_path, start_sec, end_sec, interval):
+    frames = []
+    for t in np.arange(start_sec, end_sec, interval):
+        frames.append(np.asarray(extract_frame_png(video_path, t).convert("RGB")))
+    return frames
+
+
+def run_sampler(video_path, start_sec, end_sec, interval):
+    return [frame for _, frame in sample_frames(video_path, start_sec, end_sec, interval)]
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("video", help="Video to sample")
+    parser.add_argument("--start", type=float, default=0.0, help="Start of the range in seconds")
+    parser.add_argument("--end", type=float, default=60.0, help="End of the range in seconds")
+    parser.add_argument("--interval", type=float, default=0.5, help="Seconds between sampled frames")
+    args = parser.parse_args()
+
+    legacy, legacy_seconds = timed(run_legacy, args.video, args.start, args.end, args.interval)
+    sampled, sampler_seconds = timed(run_sampler, args.video, args.start, args.end, args.interval)
+
+    for name, frames, seconds in (("per-frame ffmpeg + PNG", legacy, legacy_seconds), ("frame_sampler", sampled, sampler_seconds)):
+        print(f"{name:>24}: {len(frames)} frames in {seconds:.2f}s ({len(frames) / seconds if seconds else 0.0:.1f} frames/s)")
+    print(f"{'speedup':>24}: {legacy_seconds / sampler_seconds if sampler_seconds else 0.0:.1f}x")
+
+    pairs = list(zip(legacy, sampled))
+    if pairs:
+        diffs = [np.abs(a.astype(np.int16) - b.astype(np.int16)).mean() for a, b in pairs if a.shape == b.shape]
+        print(f"{'mean abs pixel diff':>24}: {np.mean(diffs) if diffs else float('nan'):.2f} (max {max(diffs, default=float('nan')):.2f}, {len(pairs) - len(diffs)} shape mismatches)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+对比旧的全局 STATUS_LOCK 方案与 UploadRegistry 在多线程下的吞吐量。
+每次操作模拟一次 upload_file：查询记录 -> 远程确认文件状态（用 sleep 模拟网络往返）-> 一部分需要重新登记 -> dump_upload_files。
+"""
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from upload_registry import UploadRegistry
+
+
+def make_uploads(num_entries):
+    return {f"E:\\videos\\{i}.mp4": {"cloud_name": f"files/{i:08x}"} for i in range(num_entries)}
+
+
+class LegacyRegistry:
+    """原 utils.py 的做法：远程确认和所有 key 的文件写入都在同一把全局锁内完成"""
+
+    def __init__(self, keys, root, num_entries):
+        self.root = root
+        self.lock = threading.Lock()
+        self.uploads = {key: make_uploads(num_entries) for key in keys}
+
+    def upload_file(self, key, local_path, latency, reupload):
+        with self.lock:
+            if local_path in self.uploads[key]:
+                time.sleep(latency)
+                if reupload:
+                    self.uploads[key].pop(local_path)
+        if reupload:
+            with self.lock:
+                self.uploads[key][local_path] = {"cloud_name": f"files/{random.getrandbits(32):08x}"}
+                with open(os.path.join(self.root, f"{key}.json"), "w") as f:
+                    json.dump(self.uploads[key], f, indent=4)
+
+    def dump_upload_files(self):
+        with self.lock:
+            for key, uploads in self.uploads.items():
+                with open(os.path.join(self.root, f"{key}.json"), "w") as f:
+                    json.dump(uploads, f, indent=4)
+
+
+class NewRegistry:
+    def __init__(self, keys, root, num_entries):
+        for key in keys:
+            with open(os.path.join(root, f"{key}.json"), "w") as f:
+                json.dump(make_uploads(num_entries), f)
+        self.registry = UploadRegistry(keys, root=root)
+
+    def upload_file(self, key, local_path, latency, reupload):
+        uploaded = self.registry.get(key, local_path)
+        if uploaded:
+            time.sleep(latency)
+            if reupload:
+                self.registry.pop(key, local_path, uploaded["cloud_name"])
+        if reupload:
+            self.registry.set(key, local_path, {"cloud_name": f"files/{random.getrandbits(32):08x}"})
+            self.registry.persist(key)
+
+    def dump_upload_files(self):
+        self.registry.flush()
+
+
+def run(registry_cls, keys, num_threads, num_ops, latency, reupload_ratio, num_entries):
+    with tempfile.TemporaryDirectory() as root:
+        registry = registry_cls(keys, root, num_entries)
+
+        def one_op(i):
+            rng = random.Random(i)
+            key = rng.choice(keys)
+            local_path = f"E:\\videos\\{rng.randrange(num_entries)}.mp4"
+            registry.upload_file(key, local_path, latency, rng.random() < reupload_ratio)
+            registry.dump_upload_files()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=num_threads) as executor:
+            list(executor.map(one_op, range(num_ops)))
+        return num_ops / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--ops', type=int, default=400)
+    parser.add_argument('--latency', type=float, default=0.05, help="simulated files.get round-trip in seconds")
+    parser.add_argument('--reupload', type=float, default=0.2)
+    parser.add_argument('--keys', type=int, default=25)
+    parser.add_argument('--entries', type=int, default=200, help="upload records per key")
+    args = parser.parse_args()
+
+    keys = [f"key{i:02d}" for i in range(args.keys)]
+    print(f"{'threads':>8} {'legacy ops/s':>14} {'registry ops/s':>16} {'speedup':>9}")
+    for num_threads in args.threads:
+        legacy = run(LegacyRegistry, keys, num_threads, args.ops, args.latency, args.reupload, args.entries)
+        new = run(NewRegistry, keys, num_threads, args.ops, args.latency, args.reupload, args.entries)
+        print(f"{num_threads:>8} {legacy:>14.1f} {new:>16.1f} {new / legacy:>8.1f}x")
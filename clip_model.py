@@ -1,51 +1,142 @@
-import ffmpeg
 from PIL import Image
-import io
 import torch
 from utils import time_to_seconds
+from frame_sampler import sample_frames, sample_count
 import numpy as np
 import tqdm
+import threading
 
 import clip
 
 
-def extract_frame_ffmpeg(video_path, timestamp_sec):
-    # 调用 ffmpeg-python 提取图像数据并读取到内存中
-    out, _ = (
-        ffmpeg
-        .input(video_path, ss=timestamp_sec)
-        .output('pipe:', vframes=1, format='image2pipe', vcodec='png')
-        .run(capture_stdout=True, capture_stderr=True)
-    )
-    return Image.open(io.BytesIO(out))
+DEFAULT_MODEL = "ViT-B/32"
+# 每批送入 encode_image 的帧数；同一模型同时只有一批在推理，显存/内存占用以此为上限
+BATCH_SIZE = 32
+# CPU 推理使用的线程数；None 表示沿用 torch / onnxruntime 的默认值
+CPU_THREADS = None
+# "torch"：原始 FP32 模型；"onnx"：clip_onnx 导出的 int8 量化模型（仅 CPU）
+BACKEND = "torch"
 
 
-def extract_clip_embeddings_from_segment(video_path, start_time, end_time, frame_interval=1.0):
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model, preprocess = clip.load("ViT-B/32", device=device)
+def default_device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
 
+
+class ClipModel:
+    def __init__(self, name, device):
+        self.name = name
+        self.device = device
+        self.model = None
+        self.preprocess = None
+        # load_lock 保证只加载一次，infer_lock 使同一模型同时只有一批在推理
+        self.load_lock = threading.Lock()
+        self.infer_lock = threading.Lock()
+
+    def load(self):
+        with self.load_lock:
+            if self.model is None:
+                self.model, self.preprocess = clip.load(self.name, device=self.device)
+                self.model.eval()
+        return self
+
+    @property
+    def dim(self):
+        return self.model.visual.output_dim
+
+    def encode_batch(self, tensors):
+        batch = torch.stack(tensors).to(self.device)
+        with self.infer_lock, torch.no_grad():
+            return self.model.encode_image(batch).float().cpu().numpy()
+
+    def encode(self, images, batch_size=BATCH_SIZE):
+        """
+        images 为 RGB 数组（HxWx3 uint8）或 PIL 图像的可迭代对象，可以是生成器；
+        边读取边按 batch_size 分批编码，返回 (N, D) 的 float32 矩阵。
+        """
+        results = []
+        tensors = []
+        for image in images:
+            if not isinstance(image, Image.Image):
+                image = Image.fromarray(image)
+            tensors.append(self.preprocess(image))
+            if len(tensors) == batch_size:
+                results.append(self.encode_batch(tensors))
+                tensors = []
+        if tensors:
+            results.append(self.encode_batch(tensors))
+        if not results:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.concatenate(results)
+
+
+class ClipRegistry:
+    """
+    进程内的 CLIP 模型表：每个 (模型名, 设备, 后端) 只加载一次，多个线程共享。
+    不同模型可以并行加载；同一模型的并发加载请求等待同一次加载完成。
+    """
+
+    def __init__(self, cpu_threads=CPU_THREADS, backend=BACKEND):
+        self.lock = threading.Lock()
+        self.models = {}
+        self.cpu_threads = cpu_threads
+        self.backend = backend
+
+    def get(self, name=DEFAULT_MODEL, device=None, backend=None):
+        backend = backend or self.backend
+        device = "cpu" if backend == "onnx" else device or default_device()
+        with self.lock:
+            entry = self.models.get((name, device, backend))
+            if entry is None:
+                if backend == "onnx":
+                    from clip_onnx import OnnxClipModel
+                    entry = OnnxClipModel(name, cpu_threads=self.cpu_threads)
+                else:
+                    if device == "cpu" and self.cpu_threads:
+                        torch.set_num_threads(self.cpu_threads)
+                    entry = ClipModel(name, device)
+                self.models[(name, device, backend)] = entry
+        return entry.load()
+
+    def set_backend(self, backend):
+        if backend not in ("torch", "onnx"):
+            raise ValueError(f"Unknown CLIP backend {backend}")
+        with self.lock:
+            self.backend = backend
+
+    def set_cpu_threads(self, cpu_threads):
+        with self.lock:
+            self.cpu_threads = cpu_threads
+        if cpu_threads:
+            torch.set_num_threads(cpu_threads)
+
+
+CLIP_MODELS = ClipRegistry()
+
+
+def encode_images(images, name=DEFAULT_MODEL, batch_size=BATCH_SIZE, device=None, backend=None):
+    """用共享的 CLIP 模型批量编码图像，返回 (N, D) 矩阵"""
+    return CLIP_MODELS.get(name, device, backend).encode(images, batch_size)
+
+
+def extract_clip_embeddings_from_segment(video_path, start_time, end_time, frame_interval=1.0, batch_size=BATCH_SIZE):
     start_sec = time_to_seconds(start_time)
     end_sec = time_to_seconds(end_time)
 
-    timestamps = np.arange(start_sec, end_sec, frame_interval)
-
-    embeddings = []
     frames = []
     frame_times = []
 
-    for t in tqdm(timestamps, desc="Extracting frames via ffmpeg"):
+    def images():
+        # 整段只解码一次，逐帧取出 RGB 数组；取帧失败时保留已取到的帧
+        samples = sample_frames(video_path, start_sec, end_sec, frame_interval)
         try:
-            img = extract_frame_ffmpeg(video_path, t)
-            # img.save(f"temp/{t}.jpg", format="JPEG")
-            image_tensor = preprocess(img).unsqueeze(0).to(device)
-            with torch.no_grad():
-                embedding = model.encode_image(image_tensor)
-                embedding = embedding.cpu().numpy()[0]
-                embeddings.append(embedding)
+            for t, frame in tqdm.tqdm(samples, total=sample_count(start_sec, end_sec, frame_interval), desc="Extracting frames via ffmpeg"):
+                img = Image.fromarray(frame)
+                # img.save(f"temp/{t}.jpg", format="JPEG")
                 frames.append(img)
                 frame_times.append(t)
+                yield img
         except Exception as e:
-            print(f"[WARN] Failed at {t:.2f}s: {e}")
-            continue
+            print(f"[WARN] Frame sampling failed after {len(frame_times)} frames: {e}")
 
+    embeddings = encode_images(images(), batch_size=batch_size)
     return embeddings, frames, frame_times
@@ -0,0 +1,189 @@
+"""
+CLIP 图像编码器的 ONNX Runtime 后端（CPU, int8 动态量化）。
+
+    python clip_onnx.py export               # 导出 FP32 ONNX 并量化为 int8
+    python clip_onnx.py parity --video ...   # 与 torch 的嵌入比较余弦偏差
+    python clip_onnx.py benchmark --video ...
+
+导出和量化需要 torch / onnx；推理只依赖 onnxruntime、PIL 和 numpy。
+"""
+import os
+import time
+import argparse
+import threading
+
+import numpy as np
+from PIL import Image
+
+import clip_model
+from clip_model import DEFAULT_MODEL, BATCH_SIZE
+
+
+ONNX_ROOT = os.path.join("local_database", "clip_onnx")
+INPUT_RESOLUTION = 224
+CLIP_MEAN = np.array([0.48145466, 0.4578275, 0.40821073], dtype=np.float32).reshape(3, 1, 1)
+CLIP_STD = np.array([0.26862954, 0.26130258, 0.27577711], dtype=np.float32).reshape(3, 1, 1)
+
+
+def onnx_path(name=DEFAULT_MODEL, quantized=True):
+    stem = name.replace("/", "-").replace("@", "-")
+    return os.path.join(ONNX_ROOT, f"{stem}{'-int8' if quantized else ''}.onnx")
+
+
+def preprocess(image, n_px=INPUT_RESOLUTION):
+    """
+    与 CLIP 的 torchvision 预处理一致（短边双三次缩放到 n_px、居中裁剪、归一化），不依赖 torch。
+    返回 (3, n_px, n_px) 的 float32 数组。
+    """
+    if not isinstance(image, Image.Image):
+        image = Image.fromarray(image)
+    width, height = image.size
+    if width <= height:
+        size = (n_px, int(n_px * height / width))
+    else:
+        size = (int(n_px * width / height), n_px)
+    image = image.resize(size, Image.BICUBIC)
+    left = int(round((size[0] - n_px) / 2.0))
+    top = int(round((size[1] - n_px) / 2.0))
+    image = image.crop((left, top, left + n_px, top + n_px)).convert("RGB")
+
+    array = np.asarray(image, dtype=np.float32).transpose(2, 0, 1) / 255.0
+    return (array - CLIP_MEAN) / CLIP_STD
+
+
+class OnnxClipModel:
+    """接口与 clip_model.ClipModel 相同：encode(images, batch_size) -> (N, D)"""
+
+    def __init__(self, name, path=None, cpu_threads=None):
+        self.name = name
+        self.device = "cpu"
+        self.path = path or onnx_path(name)
+        self.cpu_threads = cpu_threads
+        self.session = None
+        self.load_lock = threading.Lock()
+        self.infer_lock = threading.Lock()
+
+    def load(self):
+        with self.load_lock:
+            if self.session is None:
+                import onnxruntime as ort
+
+                if not os.path.exists(self.path):
+                    raise FileNotFoundError(f"{self.path} not found, run `python clip_onnx.py export --model {self.name}` first.")
+                options = ort.SessionOptions()
+                options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+                if self.cpu_threads:
+                    options.intra_op_num_threads = self.cpu_threads
+                self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+                self.input_name = self.session.get_inputs()[0].name
+        return self
+
+    @property
+    def dim(self):
+        return self.session.get_outputs()[0].shape[-1]
+
+    def encode_batch(self, arrays):
+        with self.infer_lock:
+            return self.session.run(None, {self.input_name: np.stack(arrays)})[0].astype(np.float32)
+
+    def encode(self, images, batch_size=BATCH_SIZE):
+        results = []
+        arrays = []
+        for image in images:
+            arrays.append(preprocess(image))
+            if len(arrays) == batch_size:
+                results.append(self.encode_batch(arrays))
+                arrays = []
+        if arrays:
+            results.append(self.encode_batch(arrays))
+        if not results:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.concatenate(results)
+
+
+def export(name=DEFAULT_MODEL, opset=17):
+    """把 torch CLIP 的图像编码器导出为 FP32 ONNX（batch 维可变），再动态量化为 int8（MatMul/Gemm 权重）"""
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    model = clip_model.CLIP_MODELS.get(name, "cpu", backend="torch").model.float()
+    fp32_path, int8_path = onnx_path(name, quantized=False), onnx_path(name)
+    os.makedirs(ONNX_ROOT, exist_ok=True)
+
+    dummy = torch.randn(1, 3, INPUT_RESOLUTION, INPUT_RESOLUTION)
+    with torch.no_grad():
+        torch.onnx.export(
+            model.visual, dummy, fp32_path,
+            input_names=["image"], output_names=["embedding"],
+            dynamic_axes={"image": {0: "batch"}, "embedding": {0: "batch"}},
+            opset_version=opset, dynamo=False,
+        )
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    print(f"Exported {fp32_path} ({os.path.getsize(fp32_path) / 2 ** 20:.1f} MB) -> {int8_path} ({os.path.getsize(int8_path) / 2 ** 20:.1f} MB)")
+    return int8_path
+
+
+def sample_video_frames(video, start, end, interval):
+    from frame_sampler import sample_frames
+
+    return [frame for _, frame in sample_frames(video, start, end, interval)]
+
+
+def cosine_rows(a, b):
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return (a * b).sum(axis=1)
+
+
+def parity(frames, name=DEFAULT_MODEL, batch_size=BATCH_SIZE):
+    """分别用 torch FP32 与 ONNX int8 编码同一批帧，报告逐帧余弦相似度及相邻帧相似度（语义变化判定所用）的偏差"""
+    reference = clip_model.encode_images(frames, name, batch_size, device="cpu", backend="torch")
+    quantized = clip_model.encode_images(frames, name, batch_size, backend="onnx")
+    cosine = cosine_rows(reference, quantized)
+    report = {
+        "frames": len(frames),
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+    }
+    if len(frames) > 1:
+        drift = np.abs(cosine_rows(reference[1:], reference[:-1]) - cosine_rows(quantized[1:], quantized[:-1]))
+        report["adjacent_similarity_drift_max"] = float(drift.max())
+    return report
+
+
+def benchmark(frames, name=DEFAULT_MODEL, batch_size=BATCH_SIZE, repeat=3):
+    """返回 {后端: 每秒编码帧数}（取 repeat 次中最快的一次，模型加载不计入）"""
+    result = {}
+    for backend in ("torch", "onnx"):
+        clip_model.CLIP_MODELS.get(name, "cpu", backend)
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            clip_model.encode_images(frames, name, batch_size, device="cpu", backend=backend)
+            seconds = time.perf_counter() - start
+            best = seconds if best is None else min(best, seconds)
+        result[backend] = round(len(frames) / best, 1)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=["export", "parity", "benchmark"])
+    parser.add_argument("--model", default=DEFAULT_MODEL)
+    parser.add_argument("--video", help="Video whose frames are used for parity / benchmark")
+    parser.add_argument("--start", type=float, default=0.0)
+    parser.add_argument("--end", type=float, default=60.0)
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads for both backends")
+    args = parser.parse_args()
+
+    clip_model.CLIP_MODELS.set_cpu_threads(args.threads)
+    if args.command == "export":
+        export(args.model)
+    else:
+        frames = sample_video_frames(args.video, args.start, args.end, args.interval)
+        if args.command == "parity":
+            print(parity(frames, args.model, args.batch_size))
+        else:
+            print(benchmark(frames, args.model, args.batch_size))
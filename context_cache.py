@@ -0,0 +1,218 @@
+import time
+import asyncio
+import threading
+from contextlib import nullcontext
+from concurrent.futures import Future
+
+from google.genai import types
+
+
+class ContextCache:
+    """
+    Gemini 显式上下文缓存：同一视频在同一 key、同一模型下只创建一次 cached content，
+    之后各阶段的请求只发送各自的提示词，并通过 config.cached_content 引用缓存中的视频。
+    只处理"完整视频 + 文本"形式的请求；带 VideoMetadata 剪辑区间的请求每次看到的片段不同，保持原样发送。
+    """
+
+    def __init__(self, ttl=900, refresh_margin=60, enabled=True, rate_limiter=None, scheduler=None):
+        self.ttl = ttl
+        # 创建缓存与 generate_content 一样计入 (key, model) 的限速，并由调度器统计在途请求和错误
+        self.rate_limiter = rate_limiter
+        self.scheduler = scheduler
+        self.refresh_margin = refresh_margin
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        # (云端文件名, key, model) -> {"name", "expire", "client"}
+        self.entries = {}
+        self.flights = {}
+        # 创建时被拒绝（400，如视频太短达不到最小 token 数）的 (云端文件名, model)，不再尝试
+        self.uncacheable = set()
+        # (云端文件名, model) -> 引用缓存的请求失败次数
+        self.failures = {}
+        self.created = 0
+        self.hits = 0
+        self.cached_tokens = 0
+        self.prompt_tokens = 0
+
+    def split(self, contents):
+        """拆出开头的整段视频，返回 (云端文件名, 视频 Part, 其余内容)；不适用时返回 None"""
+        if isinstance(contents, (list, tuple)) and len(contents) > 1 and isinstance(contents[0], types.File):
+            video = contents[0]
+            part = types.Part(file_data=types.FileData(file_uri=video.uri, mime_type=video.mime_type or 'video/mp4'))
+            return video.name, part, list(contents[1:])
+        if isinstance(contents, types.Content) and contents.parts and len(contents.parts) > 1:
+            part = contents.parts[0]
+            if part.file_data and not part.video_metadata and "files/" in part.file_data.file_uri:
+                uri = part.file_data.file_uri
+                return uri[uri.index("files/"):], part, types.Content(role=contents.role or "user", parts=contents.parts[1:])
+        return None
+
+    def usable(self, config):
+        # 使用 cached_content 时请求中不能再带 system_instruction / tools
+        return config is None or not (config.system_instruction or config.tools or config.tool_config or config.cached_content)
+
+    def lookup(self, ident):
+        with self.lock:
+            entry = self.entries.get(ident)
+            if entry and entry["expire"] - time.time() > self.refresh_margin:
+                self.hits += 1
+                return entry["name"]
+        return None
+
+    def join(self, ident):
+        with self.lock:
+            future = self.flights.get(ident)
+            if future is not None:
+                return future, False
+            future = Future()
+            self.flights[ident] = future
+            return future, True
+
+    def finish(self, ident, future, client, cache=None, error=None):
+        with self.lock:
+            self.flights.pop(ident, None)
+            if cache is not None:
+                expire = cache.expire_time.timestamp() if cache.expire_time else time.time() + self.ttl
+                self.entries[ident] = {"name": cache.name, "expire": expire, "client": client}
+                self.created += 1
+            elif getattr(error, 'code', None) == 400:
+                self.uncacheable.add((ident[0], ident[2]))
+        future.set_result(cache.name if cache is not None else None)
+
+    def create_config(self, cloud_name, part):
+        return types.CreateCachedContentConfig(
+            contents=[types.Content(role="user", parts=[part])],
+            ttl=f"{self.ttl}s",
+            display_name=cloud_name,
+        )
+
+    def plan(self, key, model, contents, config):
+        if not self.enabled or not self.usable(config):
+            return None
+        split = self.split(contents)
+        if split is None:
+            return None
+        cloud_name, part, rest = split
+        if (cloud_name, model) in self.uncacheable:
+            return None
+        return (cloud_name, key, model), part, rest
+
+    def create(self, client, ident, part):
+        key, model = ident[1], ident[2]
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(key, model)
+        with self.scheduler.track(key) if self.scheduler is not None else nullcontext():
+            return client.caches.create(model=model, config=self.create_config(ident[0], part))
+
+    async def create_async(self, client, ident, part):
+        key, model = ident[1], ident[2]
+        if self.rate_limiter is not None:
+            await self.rate_limiter.acquire_async(key, model)
+        with self.scheduler.track(key) if self.scheduler is not None else nullcontext():
+            return await client.aio.caches.create(model=model, config=self.create_config(ident[0], part))
+
+    def attach(self, name, rest, config):
+        if config is None:
+            return rest, types.GenerateContentConfig(cached_content=name)
+        return rest, config.model_copy(update={"cached_content": name})
+
+    def prepare(self, client, key, model, contents, config):
+        """返回实际发送的 (contents, config)；能使用上下文缓存时把视频替换为缓存引用"""
+        plan = self.plan(key, model, contents, config)
+        if plan is None:
+            return contents, config
+        ident, part, rest = plan
+
+        name = self.lookup(ident)
+        if name is None:
+            future, leader = self.join(ident)
+            if leader:
+                try:
+                    cache = self.create(client, ident, part)
+                    error = None
+                except Exception as e:
+                    print(f'Context cache unavailable for {ident[0]} on {model}: {e}')
+                    cache, error = None, e
+                self.finish(ident, future, client, cache, error)
+            name = future.result()
+        if name is None:
+            return contents, config
+        return self.attach(name, rest, config)
+
+    async def prepare_async(self, client, key, model, contents, config):
+        plan = self.plan(key, model, contents, config)
+        if plan is None:
+            return contents, config
+        ident, part, rest = plan
+
+        name = self.lookup(ident)
+        if name is None:
+            future, leader = self.join(ident)
+            if leader:
+                try:
+                    cache = await self.create_async(client, ident, part)
+                    error = None
+                except Exception as e:
+                    print(f'Context cache unavailable for {ident[0]} on {model}: {e}')
+                    cache, error = None, e
+                self.finish(ident, future, client, cache, error)
+                name = future.result()
+            else:
+                name = await asyncio.wrap_future(future)
+        if name is None:
+            return contents, config
+        return self.attach(name, rest, config)
+
+    def failed(self, config, e):
+        """
+        引用缓存的请求失败时调用。缓存已过期或被删除（403/404）时丢弃该条目，下次重新创建；
+        请求参数不被接受（400）或反复失败时，该视频在该模型上不再使用缓存。返回 True 表示应立即重试。
+        只处理错误信息提到缓存内容的错误，其余错误（如 key 失效、配额）交给常规的错误处理。
+        """
+        name = config.cached_content if config is not None else None
+        code = getattr(e, 'code', None)
+        if not name or code not in (400, 403, 404) or not self.refers_to_cache(name, e):
+            return False
+        with self.lock:
+            for ident, entry in list(self.entries.items()):
+                if entry["name"] == name:
+                    self.entries.pop(ident)
+                    failures = self.failures.get((ident[0], ident[2]), 0) + 1
+                    self.failures[(ident[0], ident[2])] = failures
+                    if code == 400 or failures >= 2:
+                        self.uncacheable.add((ident[0], ident[2]))
+        return True
+
+    def refers_to_cache(self, name, e):
+        message = str(e).lower()
+        return name.lower() in message or "cachedcontent" in message or "cached content" in message
+
+    def observe(self, response):
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        with self.lock:
+            self.cached_tokens += usage.cached_content_token_count or 0
+            self.prompt_tokens += usage.prompt_token_count or 0
+
+    def clear(self):
+        """删除本进程创建的全部缓存，避免在 TTL 到期前继续计费"""
+        with self.lock:
+            entries = list(self.entries.values())
+            self.entries.clear()
+        for entry in entries:
+            try:
+                entry["client"].caches.delete(name=entry["name"])
+            except Exception as e:
+                pass
+
+    def stats(self):
+        with self.lock:
+            return {
+                "created": self.created,
+                "hits": self.hits,
+                "uncacheable": len(self.uncacheable),
+                "cached_tokens": self.cached_tokens,
+                "prompt_tokens": self.prompt_tokens,
+                "cached_ratio": self.cached_tokens / self.prompt_tokens if self.prompt_tokens else 0.0,
+            }
@@ -0,0 +1,63 @@
+import os
+import json
+import array
+import sqlite3
+import hashlib
+import threading
+
+
+class EmbeddingCache:
+    """
+    文本嵌入的磁盘缓存（{root}/embeddings.sqlite3），键为 (model, task_type, 文本) 的哈希，向量按 float64 原样保存。
+    重建索引或重复的检索查询不会再次请求同一段文本的嵌入。
+    """
+
+    def __init__(self, root, enabled=True):
+        self.root = root
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, "embeddings.sqlite3"), check_same_thread=False)
+        with self.lock:
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self.conn.commit()
+
+    def make_key(self, model, task_type, text):
+        return hashlib.sha256(json.dumps([model, task_type, text], ensure_ascii=False).encode("utf-8")).hexdigest()
+
+    def get_many(self, model, task_type, texts):
+        """返回 {文本: 向量}，只包含命中的文本"""
+        if not self.enabled:
+            return {}
+        keys = {self.make_key(model, task_type, text): text for text in texts}
+        found = {}
+        key_list = list(keys)
+        with self.lock:
+            # SQLite 单条语句的参数个数有限，分批查询
+            for i in range(0, len(key_list), 500):
+                chunk = key_list[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[keys[key]] = array.array("d", blob).tolist()
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, model, task_type, texts, vectors):
+        if not self.enabled:
+            return
+        rows = [(self.make_key(model, task_type, text), array.array("d", vector).tobytes()) for text, vector in zip(texts, vectors)]
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)", rows)
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,174 @@
+import os
+import json
+import math
+import threading
+
+import cv2
+import numpy as np
+
+from clip_model import CLIP_MODELS, DEFAULT_MODEL, BATCH_SIZE
+from frame_sampler import sample_frames
+from utils import UPLOAD_MANAGER
+
+
+STORE_ROOT = os.path.join("local_database", "frame_embeddings")
+
+
+def video_duration(video_path):
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        frame_count = cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        return frame_count / fps if fps else 0.0
+    finally:
+        cap.release()
+
+
+class FrameEmbeddingStore:
+    """
+    一个视频在某个模型、后端和采样间隔下的帧嵌入，保存在 {root}/{内容哈希}/{模型}-{后端}-{间隔}s/：
+    embeddings.f16 为 (容量, D) 的 float16 内存映射矩阵，第 k 行是时间戳 k * interval 处的帧；
+    covered.npy 记录哪些行已计算。读取时只计算缺失的行，其余直接从映射文件中读出。
+    """
+
+    def __init__(self, root, video_path, model, backend, interval):
+        self.root = root
+        self.video_path = video_path
+        self.model = model
+        self.backend = backend
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.matrix = None
+        self.covered = None
+        self.dim = None
+        self.hit_rows = 0
+        self.computed_rows = 0
+        self.open()
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def open(self):
+        meta_path = self.path("meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        covered = np.load(self.path("covered.npy"))
+        self.dim = meta["dim"]
+        self.covered = covered
+        self.matrix = np.memmap(self.path("embeddings.f16"), dtype=np.float16, mode="r+", shape=(len(covered), self.dim))
+
+    def create(self, capacity, dim):
+        os.makedirs(self.root, exist_ok=True)
+        self.dim = dim
+        self.covered = np.zeros(capacity, dtype=bool)
+        self.matrix = np.memmap(self.path("embeddings.f16"), dtype=np.float16, mode="w+", shape=(capacity, dim))
+        with open(self.path("meta.json"), "w") as f:
+            json.dump({"video": self.video_path, "model": self.model, "backend": self.backend, "interval": self.interval, "dim": dim}, f, indent=4)
+        self.persist_coverage()
+
+    def grow(self, capacity):
+        """时长估计偏小时扩大映射文件"""
+        self.matrix.flush()
+        del self.matrix
+        with open(self.path("embeddings.f16"), "r+b") as f:
+            f.truncate(capacity * self.dim * 2)
+        self.covered = np.concatenate([self.covered, np.zeros(capacity - len(self.covered), dtype=bool)])
+        self.matrix = np.memmap(self.path("embeddings.f16"), dtype=np.float16, mode="r+", shape=(capacity, self.dim))
+
+    def persist_coverage(self):
+        # 先写入行再原子替换覆盖表，中断时最多重算这部分行
+        tmp_path = self.path("covered.tmp.npy")
+        np.save(tmp_path, self.covered)
+        os.replace(tmp_path, self.path("covered.npy"))
+
+    def grid(self, start_sec, end_sec):
+        """[start_sec, end_sec) 内落在 k * interval 网格上的行号"""
+        first = math.ceil(start_sec / self.interval - 1e-6)
+        last = math.ceil(end_sec / self.interval - 1e-6)
+        return np.arange(first, max(first, last))
+
+    def compute(self, first, last, batch_size):
+        """计算第 first..last 行（含），返回 (已取到帧的行号, 嵌入)"""
+        rows = []
+
+        def images():
+            start = first * self.interval
+            for i, (_, frame) in enumerate(sample_frames(self.video_path, start, (last + 0.5) * self.interval, self.interval)):
+                rows.append(first + i)
+                yield frame
+
+        embeddings = CLIP_MODELS.get(self.model, backend=self.backend).encode(images(), batch_size)
+        return np.array(rows, dtype=np.int64), embeddings
+
+    def read(self, start_sec, end_sec, batch_size=BATCH_SIZE):
+        """
+        返回 [start_sec, end_sec) 内的 (时间戳, (N, D) float32 嵌入)；缺失的行按连续区间一次取帧、批量编码后写入。
+        视频结尾处取不到帧的行不会出现在结果中。
+        """
+        indices = self.grid(start_sec, end_sec)
+        if len(indices) == 0:
+            return np.zeros(0), np.zeros((0, self.dim or 0), dtype=np.float32)
+
+        with self.lock:
+            if self.matrix is not None and indices[-1] >= len(self.covered):
+                self.grow(int(indices[-1]) + 1)
+            missing = indices if self.matrix is None else indices[~self.covered[indices]]
+            self.hit_rows += len(indices) - len(missing)
+
+            if len(missing):
+                # 缺失的行合并为连续区间，每个区间只启动一次取帧
+                breaks = np.flatnonzero(np.diff(missing) > 1)
+                for run in np.split(missing, breaks + 1):
+                    rows, embeddings = self.compute(int(run[0]), int(run[-1]), batch_size)
+                    if len(rows) == 0:
+                        continue
+                    if self.matrix is None:
+                        capacity = max(int(indices[-1]) + 1, math.ceil(video_duration(self.video_path) / self.interval) + 1)
+                        self.create(capacity, embeddings.shape[1])
+                    self.matrix[rows] = embeddings.astype(np.float16)
+                    self.covered[rows] = True
+                    self.computed_rows += len(rows)
+                if self.matrix is not None:
+                    self.matrix.flush()
+                    self.persist_coverage()
+
+            if self.matrix is None:
+                return np.zeros(0), np.zeros((0, 0), dtype=np.float32)
+            indices = indices[indices < len(self.covered)]
+            indices = indices[self.covered[indices]]
+            return indices * self.interval, np.asarray(self.matrix[indices], dtype=np.float32)
+
+    def stats(self):
+        with self.lock:
+            return {"hit_rows": self.hit_rows, "computed_rows": self.computed_rows, "stored_rows": int(self.covered.sum()) if self.covered is not None else 0}
+
+
+class EmbeddingStores:
+    """进程内每个 (视频内容, 模型, 后端, 间隔) 只打开一个 FrameEmbeddingStore，多个线程共享"""
+
+    def __init__(self, root=STORE_ROOT):
+        self.root = root
+        self.lock = threading.Lock()
+        self.stores = {}
+
+    def get(self, video_path, interval, model=DEFAULT_MODEL, backend=None):
+        backend = backend or CLIP_MODELS.backend
+        digest = UPLOAD_MANAGER.digest(video_path)
+        key = (digest, model, backend, interval)
+        with self.lock:
+            store = self.stores.get(key)
+            if store is None:
+                name = f"{model.replace('/', '-')}-{backend}-{interval:g}s"
+                store = FrameEmbeddingStore(os.path.join(self.root, digest, name), video_path, model, backend, interval)
+                self.stores[key] = store
+        return store
+
+
+EMBEDDING_STORES = EmbeddingStores()
+
+
+def segment_embeddings(video_path, start_sec, end_sec, interval, model=DEFAULT_MODEL, backend=None):
+    """返回视频 [start_sec, end_sec) 内每 interval 秒一帧的 (时间戳, 嵌入)，已计算过的部分直接读取"""
+    return EMBEDDING_STORES.get(video_path, interval, model, backend).read(start_sec, end_sec)
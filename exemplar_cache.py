@@ -0,0 +1,73 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+
+# frames 为按顺序排列的关键帧 JPEG 字节；parts 为可直接放进请求的 Part；tokens 为每帧图像的 token 数
+ExemplarParts = namedtuple("ExemplarParts", ["frames", "parts", "size", "tokens"])
+
+
+class ExemplarCache:
+    """
+    进程内的示例 Part 缓存，键为示例 id（文档 JSON 的哈希；缩小后的关键帧以 (id, 长边) 为键），按最近使用淘汰，总字节数不超过 max_bytes。
+    未命中时在锁外调用 loader 读取，不同示例的加载可以并行；同一示例并发未命中时各自加载，结果相同。
+    """
+
+    def __init__(self, max_bytes=512 * 1024 ** 2):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, loader):
+        """loader() 返回 (frames, parts, 除关键帧外的字节数, tokens)"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        frames, parts, extra_size, tokens = loader()
+        entry = ExemplarParts(frames, parts, sum(len(frame) for frame in frames) + extra_size, tokens)
+        self.put(key, entry)
+        return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old.size
+            # 单个示例超过上限时不缓存
+            if entry.size > self.max_bytes:
+                return
+            self.entries[key] = entry
+            self.total_bytes += entry.size
+            while self.total_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.total_bytes -= evicted.size
+                self.evictions += 1
+
+    def full(self):
+        with self.lock:
+            return self.total_bytes >= self.max_bytes
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
@@ -0,0 +1,111 @@
+import io
+import math
+
+import numpy as np
+from PIL import Image
+
+
+# Gemini 的图像计费：两边都不超过 384 像素按 258 个 token；更大的图像按 768x768 的图块切分，每块 258 个 token
+IMAGE_TILE_TOKENS = 258
+SMALL_IMAGE_SIDE = 384
+IMAGE_TILE_SIDE = 768
+# 本地没有分词器，文本按每 4 个字符 1 个 token 估算
+CHARS_PER_TOKEN = 4
+
+
+class ExemplarBudget:
+    """
+    每次复查请求中示例部分的预算：
+    先从检索结果中取 fetch_k 个候选，按 MMR 重排后最多保留 max_exemplars 个；
+    每个示例最多均匀抽取 frames_per_exemplar 帧，长边超过 max_side 的关键帧先缩小（None 表示不缩放）；
+    所有示例合计不超过 max_images 张图像和 max_tokens 个 token（图像按计费规则计算，文本为估算）。
+    """
+
+    def __init__(self, max_exemplars=4, fetch_k=8, frames_per_exemplar=8, max_images=24, max_tokens=8192,
+                 max_side=IMAGE_TILE_SIDE, mmr_lambda=0.7):
+        self.max_exemplars = max_exemplars
+        self.fetch_k = fetch_k
+        self.frames_per_exemplar = frames_per_exemplar
+        self.max_images = max_images
+        self.max_tokens = max_tokens
+        self.max_side = max_side
+        self.mmr_lambda = mmr_lambda
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def image_tokens(width, height):
+    if width <= SMALL_IMAGE_SIDE and height <= SMALL_IMAGE_SIDE:
+        return IMAGE_TILE_TOKENS
+    return math.ceil(width / IMAGE_TILE_SIDE) * math.ceil(height / IMAGE_TILE_SIDE) * IMAGE_TILE_TOKENS
+
+
+def jpeg_tokens(frame):
+    """只读取 JPEG 头部得到尺寸"""
+    with Image.open(io.BytesIO(frame)) as image:
+        return image_tokens(*image.size)
+
+
+def text_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def downscale_jpeg(frame, max_side):
+    """长边超过 max_side 时等比缩小并重新编码，否则原样返回"""
+    with Image.open(io.BytesIO(frame)) as image:
+        if max(image.size) <= max_side:
+            return frame
+        scale = max_side / max(image.size)
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        buffer = io.BytesIO()
+        image.convert("RGB").resize(size, Image.LANCZOS).save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+
+def subsample(count, n):
+    """从 count 帧中均匀取 n 帧的下标，n >= 2 时总包含首尾帧"""
+    if n >= count:
+        return list(range(count))
+    if n <= 0:
+        return []
+    if n == 1:
+        return [0]
+    return sorted(set(np.round(np.linspace(0, count - 1, n)).astype(int).tolist()))
+
+
+def mmr(relevance, vectors, k, mmr_lambda=0.7):
+    """
+    最大边际相关性：每次选 mmr_lambda * 相关度 - (1 - mmr_lambda) * 与已选结果的最大相似度 最高的候选。
+    relevance 为 (N,) 相关度，vectors 为 (N, D) 单位向量；返回选中的下标，按选中顺序排列。
+    """
+    relevance = np.asarray(relevance, dtype=np.float32)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    k = min(k, len(relevance))
+    if k == 0:
+        return []
+    similarity = vectors @ vectors.T
+    selected = [int(np.argmax(relevance))]
+    # 每个候选与已选结果的最大相似度
+    redundancy = similarity[selected[0]].copy()
+    while len(selected) < k:
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores[selected] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        redundancy = np.maximum(redundancy, similarity[best])
+    return selected
+
+
+def rerank(candidates, budget):
+    """
+    candidates 为按检索顺序排列的 [(文档 JSON, 相关度, 单位向量)]；没有相关度或向量时（例如 Chroma 检索器）保持原顺序。
+    返回最多 budget.max_exemplars 个文档。
+    """
+    if not candidates:
+        return []
+    if any(relevance is None or vector is None for _, relevance, vector in candidates):
+        return [doc for doc, _, _ in candidates[:budget.max_exemplars]]
+    order = mmr([relevance for _, relevance, _ in candidates], np.stack([vector for _, _, vector in candidates]),
+                budget.max_exemplars, budget.mmr_lambda)
+    return [candidates[i][0] for i in order]
@@ -0,0 +1,171 @@
+import os
+import json
+import threading
+
+import faiss
+import numpy as np
+
+from keyframes import normalize
+
+
+# HNSW 每个节点的邻居数、建图和搜索时的候选队列长度；efSearch 越大召回越高、查询越慢
+HNSW_M = 32
+EF_CONSTRUCTION = 200
+EF_SEARCH = 128
+
+
+class FaissIndex:
+    """
+    磁盘上的余弦相似度索引，保存在 {root}/：vectors.npy 为单位化的 (N, D) float32 向量，
+    meta.json 记录每行的 id（可重复，例如同一示例的多个关键帧）及索引参数，index.faiss 由向量构建。
+    kind="flat" 为精确搜索；kind="hnsw" 为 HNSW 近似搜索，数万条向量时查询仍在毫秒级。
+    """
+
+    def __init__(self, root, kind="hnsw", m=HNSW_M, ef_construction=EF_CONSTRUCTION, ef_search=EF_SEARCH):
+        if kind not in ("flat", "hnsw"):
+            raise ValueError(f"Unknown FAISS index kind {kind}")
+        self.root = root
+        self.kind = kind
+        self.m = m
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.lock = threading.Lock()
+        self.index = None
+        self.vectors = None
+        self.ids = []
+        self.open()
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def open(self):
+        meta_path = self.path("meta.json")
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        vectors = np.load(self.path("vectors.npy"))
+        if len(vectors) != len(meta["ids"]):
+            return False
+        self.vectors = vectors
+        self.ids = meta["ids"]
+        if meta["kind"] == self.kind and meta["m"] == self.m:
+            self.index = faiss.read_index(self.path("index.faiss"))
+            self.set_ef_search()
+        else:
+            # 索引类型或参数变了，向量仍可用，直接重建
+            self.build()
+        return True
+
+    def save(self):
+        os.makedirs(self.root, exist_ok=True)
+        np.save(self.path("vectors.npy"), self.vectors)
+        faiss.write_index(self.index, self.path("index.faiss"))
+        # meta.json 最后原子替换；保存中断导致行数与向量不一致时，open 会丢弃整个索引
+        tmp_path = self.path("meta.tmp.json")
+        with open(tmp_path, "w") as f:
+            json.dump({"kind": self.kind, "m": self.m, "dim": self.dim, "ids": self.ids}, f)
+        os.replace(tmp_path, self.path("meta.json"))
+
+    @property
+    def dim(self):
+        return self.vectors.shape[1] if self.vectors is not None else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def set_ef_search(self):
+        if self.kind == "hnsw":
+            self.index.hnsw.efSearch = self.ef_search
+
+    def new_index(self, dim):
+        if self.kind == "flat":
+            return faiss.IndexFlatIP(dim)
+        index = faiss.IndexHNSWFlat(dim, self.m, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = self.ef_construction
+        return index
+
+    def build(self):
+        self.index = self.new_index(self.vectors.shape[1])
+        self.set_ef_search()
+        if len(self.vectors):
+            self.index.add(self.vectors)
+
+    def add(self, ids, vectors):
+        """追加向量，不保存；HNSW 与 Flat 都支持增量添加"""
+        vectors = normalize(np.atleast_2d(vectors))
+        if len(ids) != len(vectors):
+            raise ValueError("ids and vectors must have the same length.")
+        if len(vectors) == 0:
+            return
+        with self.lock:
+            if self.vectors is None:
+                self.vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+                self.build()
+            self.vectors = np.concatenate([self.vectors, vectors])
+            self.ids = self.ids + list(ids)
+            self.index.add(vectors)
+
+    def remove(self, ids):
+        """删除这些 id 的所有行，不保存；HNSW 不支持删除，按剩余向量重建"""
+        ids = set(ids)
+        with self.lock:
+            keep = [i for i, row_id in enumerate(self.ids) if row_id not in ids]
+            if len(keep) == len(self.ids):
+                return
+            self.vectors = self.vectors[keep]
+            self.ids = [self.ids[i] for i in keep]
+            self.build()
+
+    def clear(self):
+        with self.lock:
+            self.index = None
+            self.vectors = None
+            self.ids = []
+
+    def persist(self):
+        with self.lock:
+            if self.vectors is not None:
+                self.save()
+
+    def search(self, queries, k):
+        """
+        批量查询，queries 为 (Q, D) 或单个向量；返回 Q 个 [(行 id, 相似度)] 列表，按相似度降序。
+        """
+        queries = normalize(np.atleast_2d(queries))
+        if self.index is None or len(self) == 0:
+            return [[] for _ in queries]
+        k = min(k, len(self))
+        similarities, rows = self.index.search(queries, k)
+        return [
+            [(self.ids[row], sim) for sim, row in zip(sims.tolist(), hits.tolist()) if row >= 0]
+            for sims, hits in zip(similarities, rows)
+        ]
+
+    def id_vectors(self, ids):
+        """每个 id 所有行的平均方向（单位向量），(len(ids), D)；一个 id 只有一行时就是该行向量"""
+        with self.lock:
+            rows = {}
+            for row, row_id in enumerate(self.ids):
+                rows.setdefault(row_id, []).append(row)
+            return normalize(np.stack([self.vectors[rows[row_id]].mean(axis=0) for row_id in ids]))
+
+    def brute_force(self, queries, k):
+        """精确的 top-k 行号，(Q, k)"""
+        queries = normalize(np.atleast_2d(queries))
+        k = min(k, len(self))
+        scores = queries @ self.vectors.T
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+        return np.take_along_axis(top, order, axis=1)
+
+    def recall(self, queries, k):
+        """近似结果对精确 top-k 行的召回率；flat 索引总是 1.0"""
+        queries = normalize(np.atleast_2d(queries))
+        if len(self) == 0 or len(queries) == 0:
+            return 1.0
+        k = min(k, len(self))
+        _, rows = self.index.search(queries, k)
+        exact = self.brute_force(queries, k)
+        found = sum(len(set(approx.tolist()) & set(truth.tolist())) for approx, truth in zip(rows, exact))
+        return found / exact.size
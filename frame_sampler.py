@@ -0,0 +1,85 @@
+from fractions import Fraction
+
+import ffmpeg
+import numpy as np
+
+
+def frame_size(video_path):
+    """用 ffprobe 得到显示尺寸 (宽, 高)：按旋转信息转正，并把非方形像素换算为方形像素"""
+    try:
+        streams = ffmpeg.probe(video_path, select_streams='v:0')["streams"]
+    except ffmpeg.Error as e:
+        raise IOError(f"Cannot open video {video_path}: {e.stderr.decode(errors='replace').strip()}")
+    if not streams:
+        raise IOError(f"No video stream in {video_path}")
+    stream = streams[0]
+    width, height = int(stream["width"]), int(stream["height"])
+
+    sar = stream.get("sample_aspect_ratio", "1:1")
+    num, den = (int(x) for x in sar.split(":")) if ":" in sar else (1, 1)
+    if num > 0 and den > 0 and num != den:
+        width = round(width * num / den)
+
+    rotation = stream.get("tags", {}).get("rotate")
+    for side_data in stream.get("side_data_list", []):
+        rotation = side_data.get("rotation", rotation)
+    if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+    return width, height
+
+
+def sample_count(start_sec, end_sec, interval):
+    """与 np.arange(start_sec, end_sec, interval) 的长度一致"""
+    return len(np.arange(start_sec, end_sec, interval))
+
+
+def sample_frames(video_path, start_sec, end_sec, interval=1.0, size=None):
+    """
+    只启动一个 ffmpeg 进程：从 start_sec 处定位一次，连续解码到 end_sec，用 fps 滤镜每 interval 秒取一帧，
+    以 rgb24 原始像素经管道读出。输出总是显式缩放到 size（默认为 frame_size 的显示尺寸），保证每帧的字节数与 (宽, 高) 一致。依次产出 (时间戳秒, HxWx3 uint8 RGB 数组)，时间戳与
+    np.arange(start_sec, end_sec, interval) 一致；
+    fps 滤镜按 round='up' 取每个时间戳处（含）之后的第一帧，与逐个时间戳单独定位取帧的结果相同。
+    视频在 end_sec 之前结束时产出的帧会少于时间戳数；ffmpeg 出错或读到不完整的帧时抛出 IOError（附 ffmpeg 的错误输出）。
+
+    :param size: 可选的 (宽, 高)，由 ffmpeg 在解码端直接缩放
+    """
+    total = sample_count(start_sec, end_sec, interval)
+    if total == 0:
+        return
+    width, height = size or frame_size(video_path)
+    rate = Fraction(1 / interval).limit_denominator(1000)
+
+    process = (
+        ffmpeg.input(video_path, ss=start_sec, t=end_sec - start_sec)
+        .filter('fps', fps=f"{rate.numerator}/{rate.denominator}", round='up')
+        .filter('scale', width, height)
+        .filter('setsar', 1)
+        .output('pipe:', format='rawvideo', pix_fmt='rgb24', vframes=total)
+        .global_args('-loglevel', 'error')
+        .run_async(pipe_stdout=True, pipe_stderr=True)
+    )
+
+    frame_bytes = width * height * 3
+    try:
+        for i in range(total):
+            data = process.stdout.read(frame_bytes)
+            if len(data) < frame_bytes:
+                _, stderr = process.communicate()
+                if data or process.returncode != 0:
+                    raise IOError(f"ffmpeg failed on {video_path} at frame {i} ({len(data)}/{frame_bytes} bytes, "
+                                  f"exit code {process.returncode}): {stderr.decode(errors='replace').strip()}")
+                # 视频在 end_sec 之前结束
+                return
+            yield start_sec + i * interval, np.frombuffer(data, np.uint8).reshape(height, width, 3)
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+        process.kill()
+        process.wait()
+
+
+def sample_frame(video_path, timestamp_sec, size=None):
+    """取单独一帧（RGB 数组）；连续取多帧时请使用 sample_frames"""
+    for _, frame in sample_frames(video_path, timestamp_sec, timestamp_sec + 1, 1.0, size):
+        return frame
+    raise ValueError(f"No frame at {timestamp_sec}s in {video_path}")
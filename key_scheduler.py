@@ -0,0 +1,129 @@
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+
+# 指数滑动平均的权重，越大越看重最近的请求
+EWMA_ALPHA = 0.2
+# 新 key 在还没有任何观测时假定的延迟（秒）
+DEFAULT_LATENCY = 30.0
+# 得分不超过最优值 (1 + PICK_MARGIN) 倍的 key 视为同样合适，在其中随机挑选，避免空闲时总是选中同一个 key
+PICK_MARGIN = 0.2
+# pick 选中 key 后到请求真正开始（track）前的预约时长；期间该 key 按多一个在途请求计分
+RESERVATION_SECONDS = 60.0
+
+
+class KeyHealth:
+    def __init__(self):
+        self.in_flight = 0
+        # 已被 pick 选中、尚未开始的请求的过期时间
+        self.reservations = []
+        self.latency = DEFAULT_LATENCY
+        self.rate_429 = 0.0
+        self.rate_500 = 0.0
+        self.completed = 0
+
+    def observe(self, latency, error_code):
+        self.completed += 1
+        if error_code is None:
+            self.latency = (1 - EWMA_ALPHA) * self.latency + EWMA_ALPHA * latency
+        self.rate_429 = (1 - EWMA_ALPHA) * self.rate_429 + EWMA_ALPHA * (error_code == 429)
+        self.rate_500 = (1 - EWMA_ALPHA) * self.rate_500 + EWMA_ALPHA * (error_code is not None and error_code >= 500)
+
+    def load(self):
+        now = time.monotonic()
+        self.reservations = [expire for expire in self.reservations if expire > now]
+        return self.in_flight + len(self.reservations)
+
+
+class KeyScheduler:
+    """
+    按请求（而不是按视频）为每次调用挑选 key：在持有所需文件的候选 key 中，选择
+    在途请求数、近期延迟、429/5xx 比例、限速等待时间和当日剩余配额综合得分最低的一个。
+    免费 key 全部不可用时才会使用付费 key，且付费 key 每天的请求数不超过 paid_daily_budget。
+    """
+
+    def __init__(self, free_keys, paid_keys, rate_limiter, paid_daily_budget=500):
+        self.free_keys = list(free_keys)
+        self.paid_keys = list(paid_keys)
+        self.rate_limiter = rate_limiter
+        self.paid_daily_budget = paid_daily_budget
+        self.enabled = True
+        self.health = {key: KeyHealth() for key in self.free_keys + self.paid_keys}
+        self.lock = threading.Lock()
+        self.paid_used = 0
+        self.paid_day = time.strftime("%Y-%m-%d")
+
+    def score(self, key, model):
+        wait, remaining = self.rate_limiter.peek(key, model)
+        if remaining <= 0:
+            return None
+        health = self.health[key]
+        penalty = 1 + 4 * health.rate_429 + 2 * health.rate_500
+        return wait + (health.load() + 1) * health.latency * penalty / remaining
+
+    def paid_budget_left(self):
+        # 调用方需持有 self.lock
+        today = time.strftime("%Y-%m-%d")
+        if today != self.paid_day:
+            self.paid_day = today
+            self.paid_used = 0
+        return self.paid_used < self.paid_daily_budget
+
+    def pick(self, candidates, model):
+        """
+        从 candidates 中挑选最合适的 key；没有可用 key 时返回 None。
+        选中的 key 会被预约，紧接着的几次 pick 会把它当作多一个在途请求，连续调用因此分散到不同 key。
+        """
+        with self.lock:
+            tiers = [[key for key in candidates if key in self.free_keys]]
+            if self.paid_budget_left():
+                tiers.append([key for key in candidates if key in self.paid_keys])
+
+            for tier in tiers:
+                scored = [(self.score(key, model), key) for key in tier]
+                scored = [(score, key) for score, key in scored if score is not None]
+                if scored:
+                    best = min(score for score, _ in scored)
+                    key = random.choice([key for score, key in scored if score <= best * (1 + PICK_MARGIN)])
+                    self.health[key].reservations.append(time.monotonic() + RESERVATION_SECONDS)
+                    return key
+        return None
+
+    @contextmanager
+    def track(self, key, observe=True):
+        """
+        包裹一次请求，记录在途数量、延迟和错误码，并消耗该 key 最早的一个预约。
+        observe=False 时只计入在途数量（例如上传文件），不影响延迟和错误率的统计。
+        """
+        with self.lock:
+            health = self.health[key]
+            if health.reservations:
+                health.reservations.remove(min(health.reservations))
+            health.in_flight += 1
+            if key in self.paid_keys:
+                self.paid_budget_left()
+                self.paid_used += 1
+        start = time.monotonic()
+        error_code = None
+        try:
+            yield
+        except Exception as e:
+            error_code = getattr(e, 'code', None) or 500
+            raise
+        finally:
+            with self.lock:
+                self.health[key].in_flight -= 1
+                if observe:
+                    self.health[key].observe(time.monotonic() - start, error_code)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "paid_used_today": self.paid_used,
+                "paid_daily_budget": self.paid_daily_budget,
+                "keys": {key: {"in_flight": h.in_flight, "reserved": len(h.reservations), "latency": round(h.latency, 2), "rate_429": round(h.rate_429, 3),
+                               "rate_500": round(h.rate_500, 3), "completed": h.completed}
+                         for key, h in self.health.items()},
+            }
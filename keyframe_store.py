@@ -0,0 +1,212 @@
+import os
+import glob
+import json
+import mmap
+import argparse
+import threading
+
+
+class KeyframeStore:
+    """
+    示例关键帧的打包存储，目录 {root}/ 下只有两个文件：
+    keyframes-{代}.bin 为所有关键帧 JPEG 字节依次拼接的数据文件，通过 mmap 随机读取；
+    index.json 记录数据文件名以及每个示例的 [(偏移, 长度, 时间戳)]，按顺序排列。
+    改写一个示例时先把新帧追加到数据文件末尾，再原子替换 index.json，读者看到的总是完整的旧版本或新版本；
+    被替换的旧字节留在数据文件中，由 compact() 写入新一代数据文件后回收。
+    """
+
+    def __init__(self, root, legacy_dir=None):
+        self.root = root
+        # 旧版每帧一个 {i}-{时间戳}.jpg 的目录；打包存储还不存在时首次打开会整体导入
+        self.legacy_dir = legacy_dir
+        self.lock = threading.Lock()
+        self.opened = False
+        self.data_name = None
+        self.exemplars = {}
+        self.data = None
+        self.mm = None
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def ensure_open(self):
+        # 调用方需持有 self.lock
+        if self.opened:
+            return
+        index_path = self.path("index.json")
+        if os.path.exists(index_path):
+            with open(index_path, "r") as f:
+                index = json.load(f)
+            self.data_name = index["data"]
+            self.exemplars = index["exemplars"]
+            self.open_data()
+            self.opened = True
+            return
+        os.makedirs(self.root, exist_ok=True)
+        self.data_name = "keyframes-0.bin"
+        self.exemplars = {}
+        open(self.path(self.data_name), "ab").close()
+        self.open_data()
+        self.opened = True
+        if self.legacy_dir and os.path.isdir(self.legacy_dir):
+            imported = self.import_directory(self.legacy_dir)
+            print(f"Imported {imported} exemplars into keyframe store {self.root}.")
+        else:
+            self.write_index()
+
+    def open_data(self):
+        self.close_data()
+        self.data = open(self.path(self.data_name), "r+b")
+        size = os.fstat(self.data.fileno()).st_size
+        # 空文件不能映射
+        self.mm = mmap.mmap(self.data.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+
+    def close_data(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+        if self.data is not None:
+            self.data.close()
+            self.data = None
+
+    def write_index(self):
+        tmp_path = self.path("index.tmp.json")
+        with open(tmp_path, "w") as f:
+            json.dump({"data": self.data_name, "exemplars": self.exemplars}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path("index.json"))
+
+    def append(self, frames):
+        """把帧追加到数据文件末尾并落盘，返回 [(偏移, 长度)]；调用方需持有 self.lock"""
+        self.data.seek(0, os.SEEK_END)
+        offset = self.data.tell()
+        entries = []
+        for frame in frames:
+            self.data.write(frame)
+            entries.append((offset, len(frame)))
+            offset += len(frame)
+        self.data.flush()
+        os.fsync(self.data.fileno())
+        return entries
+
+    def put(self, key, frames, timestamps):
+        """原子地改写示例 key 的全部关键帧（JPEG 字节）及其时间戳"""
+        with self.lock:
+            self.ensure_open()
+            self.put_locked(key, frames, timestamps)
+            self.write_index()
+            self.open_data()
+
+    def put_locked(self, key, frames, timestamps):
+        entries = self.append(frames)
+        self.exemplars[key] = [[offset, length, timestamp] for (offset, length), timestamp in zip(entries, timestamps)]
+
+    def delete(self, key):
+        with self.lock:
+            self.ensure_open()
+            if self.exemplars.pop(key, None) is not None:
+                self.write_index()
+
+    def keys(self):
+        with self.lock:
+            self.ensure_open()
+            return list(self.exemplars)
+
+    def __contains__(self, key):
+        with self.lock:
+            self.ensure_open()
+            return key in self.exemplars
+
+    def timestamps(self, key):
+        with self.lock:
+            self.ensure_open()
+            return [timestamp for _, _, timestamp in self.exemplars.get(key, [])]
+
+    def get(self, key, i):
+        """示例 key 的第 i 帧"""
+        with self.lock:
+            self.ensure_open()
+            offset, length, _ = self.exemplars[key][i]
+            return self.mm[offset:offset + length]
+
+    def frames(self, key):
+        """示例 key 按顺序的全部关键帧；不存在时返回空列表"""
+        with self.lock:
+            self.ensure_open()
+            return [self.mm[offset:offset + length] for offset, length, _ in self.exemplars.get(key, [])]
+
+    def stats(self):
+        with self.lock:
+            self.ensure_open()
+            live = sum(length for entries in self.exemplars.values() for _, length, _ in entries)
+            size = os.path.getsize(self.path(self.data_name))
+            return {"exemplars": len(self.exemplars), "frames": sum(len(entries) for entries in self.exemplars.values()),
+                    "live_bytes": live, "file_bytes": size}
+
+    def compact(self):
+        """把仍在使用的帧写入新一代数据文件，替换索引后删除旧文件；返回回收的字节数"""
+        with self.lock:
+            self.ensure_open()
+            old_name = self.data_name
+            old_size = os.path.getsize(self.path(old_name))
+            generation = int(old_name.split("-")[1].split(".")[0]) + 1
+            new_name = f"keyframes-{generation}.bin"
+            exemplars = {}
+            with open(self.path(new_name), "wb") as f:
+                offset = 0
+                for key, entries in self.exemplars.items():
+                    exemplars[key] = []
+                    for old_offset, length, timestamp in entries:
+                        f.write(self.mm[old_offset:old_offset + length])
+                        exemplars[key].append([offset, length, timestamp])
+                        offset += length
+                f.flush()
+                os.fsync(f.fileno())
+            self.data_name = new_name
+            self.exemplars = exemplars
+            self.write_index()
+            self.open_data()
+            os.remove(self.path(old_name))
+            return old_size - offset
+
+    def import_directory(self, legacy_dir):
+        """导入旧版目录（每个示例一个子目录，帧文件名为 {i}-{时间戳}.jpg），只写一次索引；调用方需持有 self.lock"""
+        count = 0
+        for exemplar_dir in sorted(glob.glob(os.path.join(legacy_dir, "*"))):
+            if not os.path.isdir(exemplar_dir):
+                continue
+            paths = sorted(glob.glob(os.path.join(exemplar_dir, "*")), key=lambda path: int(os.path.basename(path).split('-')[0]))
+            frames = []
+            for path in paths:
+                with open(path, "rb") as f:
+                    frames.append(f.read())
+            # 文件名中的时间戳经过 sanitize，"mm:ss" 中的冒号被替换成了下划线
+            timestamps = [os.path.splitext(os.path.basename(path))[0].split('-', 1)[1].replace('_', ':') for path in paths]
+            self.put_locked(os.path.basename(exemplar_dir), frames, timestamps)
+            count += 1
+        self.write_index()
+        self.open_data()
+        return count
+
+    def close(self):
+        with self.lock:
+            self.close_data()
+            self.opened = False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("root", help="keyframe store directory")
+    parser.add_argument("--import-dir", default=None, help="legacy keyframe directory to import into an existing store")
+    parser.add_argument("--compact", action="store_true", help="drop bytes of rewritten exemplars")
+    args = parser.parse_args()
+
+    store = KeyframeStore(args.root)
+    if args.import_dir:
+        with store.lock:
+            store.ensure_open()
+            print(f"Imported {store.import_directory(args.import_dir)} exemplars.")
+    if args.compact:
+        print(f"Reclaimed {store.compact()} bytes.")
+    print(store.stats())
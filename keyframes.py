@@ -0,0 +1,77 @@
+import numpy as np
+
+
+# 累积漂移模式下每次向后比较的帧数
+DRIFT_BLOCK = 512
+
+
+def normalize(embeddings):
+    """按行归一化为单位向量（float32），零向量保持为零"""
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def adjacent_similarity(unit):
+    """第 i 项为第 i 帧与第 i + 1 帧的余弦相似度，长度 N - 1"""
+    return np.einsum("ij,ij->i", unit[:-1], unit[1:])
+
+
+def window_similarity(unit, window):
+    """第 i 项为第 i + 1 帧与其前 window 帧均值方向的余弦相似度（不足 window 帧时取已有的帧），长度 N - 1"""
+    # 前缀和用 float64，长视频中相减时不丢精度
+    cumsum = np.vstack([np.zeros((1, unit.shape[1])), np.cumsum(unit, axis=0, dtype=np.float64)])
+    ends = np.arange(1, len(unit))
+    starts = np.maximum(0, ends - window)
+    means = normalize(cumsum[ends] - cumsum[starts])
+    return np.einsum("ij,ij->i", means, unit[1:])
+
+
+def cumulative_changes(unit, threshold):
+    """以最近一个关键帧为锚点，找第一帧与锚点的相似度低于 1 - threshold 的位置；循环次数等于关键帧数"""
+    indices = [0]
+    anchor = 0
+    position = 1
+    while position < len(unit):
+        block = unit[position:position + DRIFT_BLOCK]
+        below = np.flatnonzero(block @ unit[anchor] < 1 - threshold)
+        if len(below) == 0:
+            position += len(block)
+            continue
+        anchor = position + int(below[0])
+        indices.append(anchor)
+        position = anchor + 1
+    return np.array(indices, dtype=np.int64)
+
+
+def detect_changes(embeddings, threshold=0.3, mode="adjacent", window=4):
+    """
+    返回语义变化帧的下标数组（首帧总是关键帧）。
+    mode="adjacent"：与前一帧的相似度低于 1 - threshold；
+    mode="window"：与前 window 帧平均方向的相似度低于 1 - threshold，对逐帧缓慢的过渡更不敏感；
+    mode="cumulative"：与上一个关键帧的相似度低于 1 - threshold，能捕捉逐帧很小但累积明显的变化。
+    """
+    if len(embeddings) == 0:
+        return np.zeros(0, dtype=np.int64)
+    unit = normalize(embeddings)
+    if mode == "cumulative":
+        return cumulative_changes(unit, threshold)
+    if mode == "adjacent":
+        similarity = adjacent_similarity(unit)
+    elif mode == "window":
+        similarity = window_similarity(unit, window)
+    else:
+        raise ValueError(f"Unknown change detection mode {mode}")
+    return np.concatenate([[0], np.flatnonzero(similarity < 1 - threshold) + 1]).astype(np.int64)
+
+
+def select_keyframes(frame_times, embeddings, threshold=0.3, mode="adjacent", window=4):
+    """返回 (关键帧下标数组, 关键帧时间戳数组)"""
+    indices = detect_changes(embeddings, threshold, mode, window)
+    return indices, np.asarray(frame_times)[indices]
+
+
+def format_mmss(seconds):
+    """秒数数组 -> ["mm:ss"]，与 utils.seconds_to_mmss(int(秒)) 相同"""
+    seconds = np.asarray(seconds).astype(np.int64)
+    return [f"{m:02d}:{s:02d}" for m, s in zip((seconds // 60).tolist(), (seconds % 60).tolist())]
@@ -0,0 +1,134 @@
+import os
+import glob
+import time
+import shutil
+import argparse
+import subprocess
+
+import cv2
+
+from Analyze_Red_Circle import CHUNK_SIZE, iter_cursor, ClickSmoother, draw_click, run_batch
+from add_timestamp import stamp_frame
+
+
+# 编码参数：libx264 的 CRF 与 preset；找不到 ffmpeg 时退回 OpenCV 的 mp4v 编码
+FFMPEG = shutil.which("ffmpeg")
+FFMPEG_CRF = 18
+FFMPEG_PRESET = "veryfast"
+
+
+class FFmpegWriter:
+    """把 BGR 帧通过管道写给 ffmpeg 编码，接口与 cv2.VideoWriter 的 write / release 相同"""
+
+    def __init__(self, output_path, fps, width, height):
+        command = [
+            FFMPEG, "-y", "-loglevel", "error",
+            "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", f"{fps}", "-i", "-",
+            "-an", "-c:v", "libx264", "-preset", FFMPEG_PRESET, "-crf", str(FFMPEG_CRF),
+            # yuv420p 要求宽高为偶数
+            "-vf", "pad=ceil(iw/2)*2:ceil(ih/2)*2", "-pix_fmt", "yuv420p",
+            output_path,
+        ]
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        self.process.stdin.write(frame.tobytes())
+
+    def release(self):
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with code {self.process.returncode}")
+
+
+def open_writer(output_path, fps, width, height):
+    if FFMPEG:
+        return FFmpegWriter(output_path, fps, width, height)
+    return cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+
+
+def partial_path(output_path):
+    root, ext = os.path.splitext(output_path)
+    return f"{root}.partial{ext}"
+
+
+def preprocess_video(video_path, output_path, chunk_size=CHUNK_SIZE):
+    """
+    一次解码完成原先 Analyze_Red_Circle.main 与 add_timestamp.process_video 的三遍处理：
+    追踪光标、烧录点击标记、写入帧号时间戳，并只编码一次。
+    先写到 *.partial 文件，成功后原子替换为 output_path，中断后重新运行会从头处理该文件。
+
+    :return: {"video", "frames", "seconds", "fps"}；无法打开视频时返回 None
+    """
+    start = time.monotonic()
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        print(f"错误: 无法打开视频文件 {video_path}")
+        return None
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    tmp_path = partial_path(output_path)
+    writer = open_writer(tmp_path, fps, width, height)
+    smoother = ClickSmoother()
+
+    def emit(ready):
+        for (frame_idx, frame), frame_result in ready:
+            if frame_result and frame_result['click']:
+                draw_click(frame, frame_result)
+            stamp_frame(frame, frame_idx, fps)
+            writer.write(frame)
+
+    frame_idx = 0
+    try:
+        for _, frame, frame_result in iter_cursor(cap, chunk_size=chunk_size):
+            # 帧可能要在 smoother 中暂存，而解码缓冲区会被下一块覆盖
+            emit(smoother.push((frame_idx, frame.copy()), frame_result))
+            frame_idx += 1
+        emit(smoother.flush())
+        writer.release()
+    except BaseException:
+        try:
+            writer.release()
+        except Exception:
+            pass
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        cap.release()
+
+    os.replace(tmp_path, output_path)
+    seconds = time.monotonic() - start
+    return {"video": video_path, "frames": frame_idx, "seconds": round(seconds, 2), "fps": round(frame_idx / seconds, 1) if seconds else 0.0}
+
+
+def process_video(video_path, output_path, chunk_size=CHUNK_SIZE):
+    try:
+        return preprocess_video(video_path, output_path, chunk_size)
+    except Exception as e:
+        print(f"处理 {video_path} 失败: {e}")
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", default='E:\\DarkDetection\\dataset\\syx\\us', help="Directory of raw screen recordings")
+    parser.add_argument("--output", default='E:\\DarkDetection\\dataset\\syx\\frameid\\us', help="Directory for videos with clicks and frame ids stamped")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="Frames decoded and masked per batch")
+    args = parser.parse_args()
+
+    if FFMPEG is None:
+        print("ffmpeg not found, falling back to OpenCV mp4v encoding.")
+
+    jobs = []
+    for video_file in glob.glob(os.path.join(args.input, '*')):
+        if ".partial" in os.path.basename(video_file):
+            continue
+        output_path = os.path.join(args.output, os.path.basename(video_file))
+        # 已完成的文件直接跳过，未完成的 *.partial 会被覆盖重做
+        if not os.path.exists(output_path):
+            jobs.append((video_file, output_path))
+    run_batch(jobs, args.workers, args.chunk_size, process=process_video)
@@ -4,33 +4,55 @@ import pandas as pd
 import glob
 import os
 import cv2
-import torch
-import clip
 from PIL import Image
 from tqdm import tqdm
-from sklearn.metrics.pairwise import cosine_similarity
 import traceback
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 import io
 import argparse
 import re
 import numpy as np
-import ffmpeg
 
-import uuid
+import hashlib
+import asyncio
 from langchain.retrievers.multi_vector import MultiVectorRetriever
-from langchain.storage import InMemoryStore
+from langchain.storage import EncoderBackedStore, LocalFileStore
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from langchain_core.embeddings.embeddings import Embeddings
 from langchain_google_vertexai import VertexAI , ChatVertexAI , VertexAIEmbeddings
 
-from utils import time_to_seconds, get_client, send_request, upload_file, dump_upload_files, generate_part, seconds_to_mmss, get_embed
+from clip_model import CLIP_MODELS
+from embedding_store import segment_embeddings
+from faiss_index import FaissIndex
+from exemplar_cache import ExemplarCache
+from keyframe_store import KeyframeStore
+from exemplar_selection import ExemplarBudget, jpeg_tokens, text_tokens, downscale_jpeg, subsample
+from keyframes import detect_changes, select_keyframes, format_mmss
+from frame_sampler import sample_frame
+from upload_pipeline import pipelined
+from utils import time_to_seconds, get_client, send_request, async_send_request, upload_file, dump_upload_files, generate_part, seconds_to_mmss, embed_texts, EMBED_BATCH_SIZE
 
 
 kf_database = "local_database\\ad\\keyframes"
+# 示例关键帧的打包存储；首次打开时导入 kf_database 中按文件保存的旧关键帧
+KEYFRAME_STORE = KeyframeStore(os.path.join("local_database", "ad", "keyframe_pack"), legacy_dir=kf_database)
+# 摘要向量库与文档库的持久化目录
+RAG_INDEX_DIR = os.path.join("local_database", "rag_summary_index")
+# 摘要向量库："faiss" 为本地 FaissIndex（kind 见 RAG_INDEX_KIND）；"chroma" 为原先的 Chroma + MultiVectorRetriever
+RAG_BACKEND = "faiss"
+# "flat" 精确检索，数万条摘要时每次查询仍只需几毫秒；更大规模可改为 "hnsw"（近似，召回率见 benchmark_faiss_index.py）
+RAG_INDEX_KIND = "flat"
+# 每次检索返回的示例数，与 MultiVectorRetriever 默认的 k 相同
+RAG_TOP_K = 4
+# 关键帧的采样间隔（秒）和“语义变化”阈值；示例与候选片段（visual_retriever）按同一规则选关键帧
+KEYFRAME_INTERVAL = 0.5
+KEYFRAME_THRESHOLD = 0.3
+# 复查请求中示例部分的默认预算
+EXEMPLAR_BUDGET = ExemplarBudget()
+# 示例关键帧和 Part 的内存缓存，按示例 id 淘汰
+EXEMPLAR_CACHE = ExemplarCache(max_bytes=512 * 1024 ** 2)
 
 
 def sanitize(filename: str) -> str:
@@ -39,37 +61,32 @@ def sanitize(filename: str) -> str:
 
 
 class GeminiEmbeddings(Embeddings):
-    def __init__(self, client):
+    def __init__(self, client=None, batch_size=EMBED_BATCH_SIZE, max_workers=8):
         super().__init__()
+        # 请求由 embed_texts 逐批挑选 key，client 仅为兼容旧的调用方式保留
         self.client = client
         self.model_id = "models/text-embedding-004"
+        self.batch_size = batch_size
+        self.max_workers = max_workers
 
     def embed_documents(self, texts: list[str]) -> list[list[float]]:
         """Embed a list of texts (documents)."""
-        embeddings = []
-        for text in texts:
-            response = get_embed(
-                client=self.client,
-                model=self.model_id,
-                contents=text,
-                config=types.EmbedContentConfig(
-                    task_type="RETRIEVAL_DOCUMENT",
-                )
-            )
-            embeddings.append(response)
-        return embeddings
+        return embed_texts(texts, self.model_id, "RETRIEVAL_DOCUMENT", self.batch_size, self.max_workers)
 
     def embed_query(self, text: str) -> list[float]:
         """Embed a single query string."""
-        response = get_embed(
-            client=self.client,
-            model=self.model_id,
-            contents=text,
-            config=types.EmbedContentConfig(
-                task_type="RETRIEVAL_QUERY",
-            )
-        )
-        return response
+        return embed_texts([text], self.model_id, "RETRIEVAL_QUERY")[0]
+
+    def embed_queries(self, texts: list[str]) -> list[list[float]]:
+        """Embed several query strings in one batch."""
+        return embed_texts(texts, self.model_id, "RETRIEVAL_QUERY", self.batch_size, self.max_workers)
+
+
+def image_to_jpeg_bytes(image):
+    """PIL 图像编码为 JPEG 字节，与 image.save("*.jpg") 写出的文件内容相同"""
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG")
+    return buffer.getvalue()
 
 
 def convert_frames_to_jpeg_bytes(frames):
@@ -89,80 +106,29 @@ def convert_frames_to_jpeg_bytes(frames):
     return frame_bytes_list
 
 
-def extract_frame_ffmpeg(video_path, timestamp_sec):
-    # 调用 ffmpeg-python 提取图像数据并读取到内存中
-    out, _ = (
-        ffmpeg
-        .input(video_path, ss=timestamp_sec)
-        .output('pipe:', vframes=1, format='image2pipe', vcodec='png')
-        .run(capture_stdout=True, capture_stderr=True)
-    )
-    return Image.open(io.BytesIO(out))
-
-
-def extract_clip_embeddings_from_segment(video_path, start_time, end_time, frame_interval=1.0):
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model, preprocess = clip.load("ViT-B/32", device=device)
-
-    start_sec = time_to_seconds(start_time)
-    end_sec = time_to_seconds(end_time)
-
-    timestamps = np.arange(start_sec, end_sec, frame_interval)
-
-    embeddings = []
-    frames = []
-    frame_times = []
-
-    for t in tqdm(timestamps, desc="Extracting frames via ffmpeg"):
-        try:
-            img = extract_frame_ffmpeg(video_path, t)
-            # img.save(f"temp/{t}.jpg", format="JPEG")
-            image_tensor = preprocess(img).unsqueeze(0).to(device)
-            with torch.no_grad():
-                embedding = model.encode_image(image_tensor)
-                embedding = embedding.cpu().numpy()[0]
-                embeddings.append(embedding)
-                frames.append(img)
-                frame_times.append(t)
-        except Exception as e:
-            print(f"[WARN] Failed at {t:.2f}s: {e}")
-            continue
-
-    return embeddings, frames, frame_times
-
-
-def detect_semantic_changes(embeddings, threshold=0.3):
+def detect_semantic_changes(embeddings, threshold=0.3, mode="adjacent"):
     """Return indices of semantic change frames"""
-    change_indices = [0]
-    for i in range(1, len(embeddings)):
-        sim = cosine_similarity([embeddings[i - 1]], [embeddings[i]])[0][0]
-        if sim < 1 - threshold:
-            change_indices.append(i)
-    return change_indices
+    return detect_changes(embeddings, threshold, mode).tolist()
 
 
 def extract_key_frames(video, start_time, end_time):
-    frame_interval = 0.5  # 每秒提一帧
-    semantic_threshold = 0.3  # 控制关键帧的“语义变化”敏感度
-
-    embeddings, frames, frame_indices = extract_clip_embeddings_from_segment(
-        video, start_time, end_time, frame_interval
+    # 嵌入按视频内容持久化，已计算过的时间段直接读取，只为缺失的部分取帧编码
+    frame_times, embeddings = segment_embeddings(
+        video, time_to_seconds(start_time), time_to_seconds(end_time), KEYFRAME_INTERVAL
     )
+    if len(embeddings) == 0:
+        return [], []
 
-    keyframe_indices = detect_semantic_changes(embeddings, threshold=semantic_threshold)
+    keyframe_indices, keyframe_times = select_keyframes(frame_times, embeddings, threshold=KEYFRAME_THRESHOLD)
+    keyframe_timestamp = format_mmss(keyframe_times)
 
-    keyframe_timestamp = []
-    for kf_index in keyframe_indices:
-        keyframe_timestamp.append(seconds_to_mmss(time_to_seconds(start_time) + int(frame_interval * kf_index)))
-
-    key_frames = []
-    for idx, i in enumerate(keyframe_indices):
-        key_frames.append(frames[i])
+    # 只需解码被选为关键帧的几帧
+    key_frames = [Image.fromarray(sample_frame(video, t)) for t in keyframe_times]
 
     return key_frames, keyframe_timestamp
 
 
-def generate_video_summarize(client, video, start_time, end_time):
+def build_video_summarize_request(video, start_time, end_time):
     prompt_summarize_video = '''
         Context:
         1. Video: This is a clip of screen recording of a user interacting with an app on an iPhone after connecting a mouse.
@@ -204,14 +170,20 @@ def generate_video_summarize(client, video, start_time, end_time):
         ]
     )
 
-    # Send request with function declarations
-    response = send_request(
-        client=client,
-        model="gemini-2.5-flash-preview-05-20",
-        contents=content,
-        config=config,
-    )
+    return {
+        "model": "gemini-2.5-flash-preview-05-20",
+        "contents": content,
+        "config": config,
+    }
+
+
+def generate_video_summarize(client, video, start_time, end_time):
+    response = send_request(client=client, **build_video_summarize_request(video, start_time, end_time))
+    return response.text
+
 
+async def generate_video_summarize_async(client, video, start_time, end_time):
+    response = await async_send_request(client=client, **build_video_summarize_request(video, start_time, end_time))
     return response.text
 
 
@@ -225,6 +197,18 @@ def upload_file_and_generate_video_summarize(video_local_path, todo):
         return {'broken_file_upload': True, 'error_information': traceback.format_exc()}
     dump_upload_files()
 
+    return summarize_uploaded(client, video_file, video_local_path, todo)
+
+
+def summarize_staged(staged, todo):
+    """供 upload_pipeline.pipelined 使用：视频已由后台上传线程上传并处于 ACTIVE"""
+    if staged.error:
+        error = staged.error
+        return {'broken_file_upload': True, 'error_information': "".join(traceback.format_exception(type(error), error, error.__traceback__))}
+    return summarize_uploaded(staged.client, staged.video_file, staged.local_path, todo)
+
+
+def summarize_uploaded(client, video_file, video_local_path, todo):
     ad_result = []
     for ad in todo:
         start_time = ad["start_time"]
@@ -239,13 +223,8 @@ def upload_file_and_generate_video_summarize(video_local_path, todo):
             ad_result.append({**ad, 'summarize': ad_summarize})
 
             key_frames, kf_timestamp = extract_key_frames(video_local_path, start_time, end_time)
-            key_frames_path = os.path.join(kf_database, sanitize(
-                f"{os.path.basename(video_local_path).split('-')[0]}-{start_time}-{end_time}"))
-            os.makedirs(key_frames_path, exist_ok=True)
-            for file_path in glob.glob(os.path.join(key_frames_path, "*")):
-                os.remove(file_path)
-            for i, kf_ts in enumerate(kf_timestamp):
-                key_frames[i].save(os.path.join(key_frames_path, f"{i}-{sanitize(kf_ts)}.jpg"))
+            # 整个示例的关键帧一次原子改写，不再逐个删除和写入小文件
+            KEYFRAME_STORE.put(exemplar_key(video_local_path, start_time, end_time), [image_to_jpeg_bytes(frame) for frame in key_frames], kf_timestamp)
 
     return {'summarize': ad_result}
 
@@ -287,105 +266,297 @@ def dump_result_file(path, result_dict):
         json.dump(result_dict, f, indent=4)
 
 
-def load_database():
-    def create_multi_vector_retriever(
-            vectorstore, video_summaries, videos
-    ):
-        """
-        Create retriever that indexes summaries, but returns raw videos or images
-        """
-
-        # Initialize the storage layer
-        store = InMemoryStore()
-        id_key = "doc_id"
-
-        # Create the multi-vector retriever
-        retriever = MultiVectorRetriever(
-            vectorstore=vectorstore,
-            docstore=store,
-            id_key=id_key,
-        )
-
-        # Helper function to add documents to the vectorstore and docstore
-        def add_documents(retriever, doc_summaries, doc_contents):
-            doc_ids = [str(uuid.uuid4()) for _ in doc_contents]
-            summary_docs = [
-                Document(page_content=s, metadata={id_key: doc_ids[i]})
-                for i, s in enumerate(doc_summaries)
-            ]
-            retriever.vectorstore.add_documents(summary_docs)
-            retriever.docstore.mset(list(zip(doc_ids, doc_contents)))
-
-        # Add video into the database
-        if video_summaries:
-            add_documents(retriever, video_summaries, videos)
-
-        return retriever
+def summary_records(video_summaries_file):
+    """rag_done_list.json -> {内容哈希: (摘要, 文档 JSON)}；摘要、视频或时间段任一变化都会得到新的键"""
+    records = {}
+    ad_list = json.loads(open(video_summaries_file, "r").read())
+    for video, ads in ad_list.items():
+        for ad in ads["summarize"]:
+            content = json.dumps({'video': video, 'start_time': ad["start_time"], 'end_time': ad["end_time"], 'summarize': ad["summarize"]})
+            records[exemplar_id(content)] = (ad["summarize"], content)
+    return records
+
+
+def open_docstore(index_dir=RAG_INDEX_DIR):
+    # 以文件保存 doc_id -> 文档 JSON，读出时仍是字符串，与原先 InMemoryStore 中的内容一致
+    return EncoderBackedStore(
+        LocalFileStore(os.path.join(index_dir, "docstore")),
+        key_encoder=lambda key: key,
+        value_serializer=lambda value: value.encode("utf-8"),
+        value_deserializer=lambda value: value.decode("utf-8"),
+    )
+
 
+def sync_database(vectorstore, docstore, video_summaries_file="rag_done_list.json"):
+    """
+    把 rag_done_list.json 增量同步到持久化索引：只为新增或内容变化的摘要计算嵌入，删除已不存在的条目。
+    返回 (新增数, 删除数)。
+    """
+    records = summary_records(video_summaries_file)
+    existing = set(vectorstore.get(include=[])["ids"])
+
+    stale = list(existing - records.keys())
+    if stale:
+        vectorstore.delete(ids=stale)
+        docstore.mdelete(stale)
+
+    new_ids = [doc_id for doc_id in records if doc_id not in existing]
+    if new_ids:
+        # 先写文档再写向量，保证检索到的 doc_id 一定能取到文档
+        docstore.mset([(doc_id, records[doc_id][1]) for doc_id in new_ids])
+        summary_docs = [Document(page_content=records[doc_id][0], metadata={"doc_id": doc_id}) for doc_id in new_ids]
+        vectorstore.add_documents(summary_docs, ids=new_ids)
+    return len(new_ids), len(stale)
+
+
+class FaissRetriever:
+    """
+    直接在 FaissIndex 上检索摘要：每行 id 为 doc_id，返回 docstore 中的文档 JSON。
+    invoke / ainvoke / batch 与 MultiVectorRetriever 的用法一致；batch 只发起一次嵌入请求和一次 FAISS 查询。
+    """
+
+    def __init__(self, index, docstore, embedding_function, k=RAG_TOP_K):
+        self.index = index
+        self.docstore = docstore
+        self.embedding_function = embedding_function
+        self.k = k
+
+    def invoke(self, query):
+        return self.batch([query])[0]
+
+    async def ainvoke(self, query):
+        return await asyncio.to_thread(self.invoke, query)
+
+    def batch(self, queries):
+        if not queries:
+            return []
+        hits = self.index.search(np.array(self.embedding_function.embed_queries(queries)), self.k)
+        doc_ids = list(dict.fromkeys(doc_id for row_hits in hits for doc_id, _ in row_hits))
+        docs = dict(zip(doc_ids, self.docstore.mget(doc_ids)))
+        return [[docs[doc_id] for doc_id, _ in row_hits if docs[doc_id] is not None] for row_hits in hits]
+
+    def candidates(self, queries, fetch_k):
+        """每个查询的 [(文档 JSON, 相似度, 摘要单位向量)]，供 exemplar_selection.rerank 做 MMR 重排"""
+        if not queries:
+            return []
+        hits = self.index.search(np.array(self.embedding_function.embed_queries(queries)), fetch_k)
+        doc_ids = list(dict.fromkeys(doc_id for row_hits in hits for doc_id, _ in row_hits))
+        if not doc_ids:
+            return [[] for _ in queries]
+        docs = dict(zip(doc_ids, self.docstore.mget(doc_ids)))
+        vectors = dict(zip(doc_ids, self.index.id_vectors(doc_ids)))
+        return [[(docs[doc_id], sim, vectors[doc_id]) for doc_id, sim in row_hits if docs[doc_id] is not None] for row_hits in hits]
+
+    def recall(self, queries):
+        """HNSW 结果对精确检索的召回率"""
+        return self.index.recall(np.array(self.embedding_function.embed_queries(queries)), self.k)
+
+
+def sync_faiss_database(index, docstore, embedding_function, video_summaries_file="rag_done_list.json"):
+    """与 sync_database 相同的增量同步，向量写入 FaissIndex 并保存到磁盘"""
+    records = summary_records(video_summaries_file)
+    existing = set(index.ids)
+
+    stale = list(existing - records.keys())
+    if stale:
+        index.remove(stale)
+        docstore.mdelete(stale)
+
+    new_ids = [doc_id for doc_id in records if doc_id not in existing]
+    if new_ids:
+        docstore.mset([(doc_id, records[doc_id][1]) for doc_id in new_ids])
+        index.add(new_ids, np.array(embedding_function.embed_documents([records[doc_id][0] for doc_id in new_ids])))
+    if stale or new_ids:
+        index.persist()
+    return len(new_ids), len(stale)
+
+
+def load_database(sync=True, index_dir=RAG_INDEX_DIR, backend=None, kind=None, warm=True):
+    """
+    打开磁盘上的摘要索引并返回检索器：索引摘要，返回视频片段信息。
+    backend="faiss"（默认）返回 FaissRetriever；backend="chroma" 返回 Chroma 上的 MultiVectorRetriever。
+    sync=True 时先增量同步 rag_done_list.json；没有新摘要时不发起任何嵌入请求。
+    warm=True 时在后台把索引中的示例读入 EXEMPLAR_CACHE。
+    """
+    backend = backend or RAG_BACKEND
     embedding_function = GeminiEmbeddings(client=get_client())
+    docstore = open_docstore(index_dir)
+
+    if backend == "faiss":
+        index = FaissIndex(os.path.join(index_dir, "faiss"), kind or RAG_INDEX_KIND)
+        if sync:
+            added, removed = sync_faiss_database(index, docstore, embedding_function)
+            if added or removed:
+                print(f"RAG index synced: {added} added, {removed} removed.")
+        if warm:
+            warm_exemplar_cache([doc for doc in docstore.mget(index.ids) if doc is not None])
+        return FaissRetriever(index, docstore, embedding_function)
+    if backend != "chroma":
+        raise ValueError(f"Unknown RAG backend {backend}")
 
     # The vectorstore to use to index the summaries
     vectorstore = Chroma(
         collection_name="rag_full_screen_ads",
         embedding_function=embedding_function,
+        persist_directory=index_dir,
     )
 
-    videos = []
-    video_summaries = []
+    if sync:
+        added, removed = sync_database(vectorstore, docstore)
+        if added or removed:
+            print(f"RAG index synced: {added} added, {removed} removed.")
 
-    video_summaries_file = "rag_done_list.json"
+    if warm:
+        warm_exemplar_cache([doc for doc in docstore.mget(vectorstore.get(include=[])["ids"]) if doc is not None])
 
-    ad_list = json.loads(open(video_summaries_file, "r").read())
-    for video, ads in ad_list.items():
-        for ad in ads["summarize"]:
-            videos.append(json.dumps({'video': video, 'start_time': ad["start_time"], 'end_time': ad["end_time"], 'summarize': ad["summarize"]}))
-            video_summaries.append(ad["summarize"])
-
-    # Create retriever
-    retriever_multi_vector = create_multi_vector_retriever(
-        vectorstore,
-        video_summaries,
-        videos,
+    # Create the multi-vector retriever
+    retriever = MultiVectorRetriever(
+        vectorstore=vectorstore,
+        docstore=docstore,
+        id_key="doc_id",
     )
 
     # Create RAG chain
     # chain_multimodal_rag = multi_modal_rag_chain(retriever_multi_vector)
 
-    return retriever_multi_vector
+    return retriever
 
 
-def generate_exemplars_parts(query_result):
-    parts = [generate_part('''
+def exemplar_key(video, start_time, end_time):
+    """示例在关键帧存储中的键，与旧版关键帧目录名相同"""
+    return sanitize(f"{os.path.basename(video).split('-')[0]}-{start_time}-{end_time}")
+
+
+def exemplar_keyframes(video, start_time, end_time):
+    """示例广告保存的关键帧（JPEG 字节），按顺序排列"""
+    return KEYFRAME_STORE.frames(exemplar_key(video, start_time, end_time))
+
+
+def exemplar_id(doc):
+    """示例文档 JSON 的内容哈希，与摘要索引中的 doc_id 相同"""
+    return hashlib.sha256(doc.encode("utf-8")).hexdigest()
+
+
+def exemplar_text(frame_count, summarize):
+    return f'''
+            The above {frame_count} images are sampled keyframes from an ad in chronological order. Here is the description of this ad:
+        ''' + summarize
+
+
+def load_exemplar_parts(doc):
+    """从关键帧存储读取一个示例的关键帧，返回 (关键帧字节, Part 列表, 描述文本字节数, 每帧 token 数)"""
+    content = json.loads(doc)
+    video = content["video"]
+    start_time = content["start_time"]
+    end_time = content["end_time"]
+
+    # key_frames = extract_key_frames(video, start_time, end_time)
+    frames = exemplar_keyframes(video, start_time, end_time)
+
+    text = exemplar_text(len(frames), content["summarize"])
+    parts = [generate_part(frame, "i") for frame in frames] + [generate_part(text, "t")]
+    return frames, parts, len(text.encode("utf-8")), [jpeg_tokens(frame) for frame in frames]
+
+
+def exemplar_parts(doc):
+    return EXEMPLAR_CACHE.get(exemplar_id(doc), lambda: load_exemplar_parts(doc))
+
+
+def scaled_exemplar_parts(doc, max_side):
+    """长边缩小到 max_side 以内的关键帧及其图像 Part（不含描述文本），同样由 EXEMPLAR_CACHE 保存"""
+    if max_side is None:
+        return exemplar_parts(doc)
+
+    def load():
+        frames = [downscale_jpeg(frame, max_side) for frame in exemplar_parts(doc).frames]
+        return frames, [generate_part(frame, "i") for frame in frames], 0, [jpeg_tokens(frame) for frame in frames]
+
+    return EXEMPLAR_CACHE.get((exemplar_id(doc), max_side), load)
+
+
+def warm_exemplar_cache(docs):
+    """按顺序预读示例直到缓存写满；在后台线程中运行，不阻塞检索器加载"""
+    def warm():
+        for doc in docs:
+            if EXEMPLAR_CACHE.full():
+                break
+            try:
+                exemplar_parts(doc)
+            except Exception as e:
+                print(f"[WARN] Failed to warm exemplar cache: {e}")
+
+    thread = threading.Thread(target=warm, name="exemplar-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+EXEMPLARS_HEADER = '''
         [Some Exemplars]
         Exemplars: Typically, an ad may consist of multiple interfaces, such as a video, a playable game demo, and a static page summarizing product information in the end of the ad. To accurately identify an ad, you need to detect all interfaces that belong to it. 
         The following exemplars present ads similar to the current one. You should learn from them the typical sequence of interfaces and the content shown in each. Then, use this knowledge to refine your previous conclusion by checking whether the previously identified ad time period missed any interfaces or included inaccurate descriptions.
-    ''', "t")]
+    '''
+EXEMPLARS_FOOTER = "[End of Exemplars]"
+
+
+def generate_exemplars_parts(query_result):
+    parts = [generate_part(EXEMPLARS_HEADER, "t")]
 
+    # 关键帧字节和 Part 由 EXEMPLAR_CACHE 保存，命中时不访问文件系统
     for doc in query_result:
-        content = json.loads(doc)
-        video = content["video"]
-        start_time = content["start_time"]
-        end_time = content["end_time"]
-
-        # key_frames = extract_key_frames(video, start_time, end_time)
-        kf_path_exemplar = os.path.join(kf_database, sanitize(f"{os.path.basename(video).split('-')[0]}-{start_time}-{end_time}"))
-        kf_file_paths = glob.glob(os.path.join(f"{kf_path_exemplar}", "*"))
-        sorted_kf_files = sorted(
-            kf_file_paths,
-            key=lambda path: int(os.path.basename(path).split('-')[0])
-        )
-        for key_frame_path in sorted_kf_files:
-            parts.append(generate_part(open(key_frame_path, "rb").read(), "i"))
-
-        parts.append(generate_part(f'''
-            The above {len(sorted_kf_files)} images are sampled keyframes from an ad in chronological order. Here is the description of this ad:
-        ''' + content["summarize"], "t"))
-
-    parts.append(generate_part("[End of Exemplars]", "t"))
+        parts.extend(exemplar_parts(doc).parts)
+
+    parts.append(generate_part(EXEMPLARS_FOOTER, "t"))
 
     return parts
 
 
+def budget_exemplars_parts(query_result, budget):
+    """
+    在 budget 的图像数和 token 上限内构造示例部分：按 query_result 的顺序（已按 MMR 重排）依次加入示例，
+    每个示例均匀抽取至多 frames_per_exemplar 帧，放不下时减少帧数，一帧也放不下时跳过。
+    返回 (parts, 报告)，报告包含预算以及实际与不设限时的图像数和 token 数。
+    """
+    parts = [generate_part(EXEMPLARS_HEADER, "t")]
+    fixed_tokens = text_tokens(EXEMPLARS_HEADER) + text_tokens(EXEMPLARS_FOOTER)
+    report = {"budget": budget.to_dict(), "candidates": len(query_result), "exemplars": 0, "images": 0,
+              "image_tokens": 0, "text_tokens": fixed_tokens, "unbudgeted_images": 0, "unbudgeted_tokens": fixed_tokens}
+    remaining_images = budget.max_images
+    remaining_tokens = budget.max_tokens - fixed_tokens
+
+    for doc in query_result:
+        full = exemplar_parts(doc)
+        summarize = json.loads(doc)["summarize"]
+        report["unbudgeted_images"] += len(full.frames)
+        report["unbudgeted_tokens"] += sum(full.tokens) + text_tokens(exemplar_text(len(full.frames), summarize))
+        if full.frames and remaining_images <= 0:
+            continue
+
+        scaled = scaled_exemplar_parts(doc, budget.max_side)
+        count = min(len(scaled.frames), budget.frames_per_exemplar, remaining_images)
+        while True:
+            indices = subsample(len(scaled.frames), count)
+            text = exemplar_text(len(indices), summarize)
+            tokens = sum(scaled.tokens[i] for i in indices) + text_tokens(text)
+            if tokens <= remaining_tokens or count <= 1:
+                break
+            count -= 1
+        if tokens > remaining_tokens:
+            continue
+
+        parts.extend(scaled.parts[i] for i in indices)
+        parts.append(generate_part(text, "t"))
+        remaining_images -= len(indices)
+        remaining_tokens -= tokens
+        report["exemplars"] += 1
+        report["images"] += len(indices)
+        report["image_tokens"] += sum(scaled.tokens[i] for i in indices)
+        report["text_tokens"] += text_tokens(text)
+
+    parts.append(generate_part(EXEMPLARS_FOOTER, "t"))
+    report["total_tokens"] = report["image_tokens"] + report["text_tokens"]
+    return parts, report
+
+
 def generate_video_text_embedding_database(args):
     done_list = {}
 
@@ -412,32 +583,30 @@ def generate_video_text_embedding_database(args):
     #         list_need_summary.pop(video)
 
     RESULT_LOCK = threading.Lock()
-    with ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(upload_file_and_generate_video_summarize, video, todo): video for video, todo in
-                   list_need_summary.items()}
-        for future in tqdm(as_completed(futures), total=len(futures)):
-            video = futures[future]
-            print(f'[End] Future on video {video} has done.')
-            try:
-                done_list_this_video = future.result()
-            except Exception as e:
-                # raise
-                print(f"[Error] Future failed on video {video}: {e}")
-                traceback.print_exc()
-                with RESULT_LOCK:
-                    done_list[video] = {"crashed_future": True, "error_info": traceback.format_exc()}
-                    dump_result_file("rag_done_list.json", done_list)
-                continue
-
+    # 后台线程提前上传后续视频，摘要只在已 ACTIVE 的视频上进行
+    results = pipelined(list(list_need_summary), lambda staged: summarize_staged(staged, list_need_summary[staged.local_path]),
+                        upload_workers=args.upload_workers, depth=args.upload_depth, max_workers=args.workers)
+    for video, done_list_this_video, error in tqdm(results, total=len(list_need_summary)):
+        print(f'[End] Future on video {video} has done.')
+        if error is not None:
+            # raise
+            print(f"[Error] Future failed on video {video}: {error}")
+            error_info = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+            print(error_info)
             with RESULT_LOCK:
-                if "broken_client" in done_list_this_video.keys() or "broken_file_upload" in done_list_this_video.keys():
-                    print(f"Gemini cannot respond with this api on video {video}")
-                    done_list[video] = done_list_this_video
-                    dump_result_file("rag_done_list.json", done_list)
-                    continue
+                done_list[video] = {"crashed_future": True, "error_info": error_info}
+                dump_result_file("rag_done_list.json", done_list)
+            continue
 
+        with RESULT_LOCK:
+            if "broken_client" in done_list_this_video.keys() or "broken_file_upload" in done_list_this_video.keys():
+                print(f"Gemini cannot respond with this api on video {video}")
                 done_list[video] = done_list_this_video
                 dump_result_file("rag_done_list.json", done_list)
+                continue
+
+            done_list[video] = done_list_this_video
+            dump_result_file("rag_done_list.json", done_list)
 
 
 def generate_video_embedding_database(args):
@@ -456,7 +625,14 @@ if __name__ == "__main__":
 
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', type=str, default='None')
+    parser.add_argument('--workers', type=int, default=10, help="videos summarized at the same time")
+    parser.add_argument('--upload-workers', type=int, default=4, help="background upload threads")
+    parser.add_argument('--upload-depth', type=int, default=8, help="max videos uploaded ahead of summarization")
+    parser.add_argument('--clip-threads', type=int, default=None, help="CPU threads for CLIP key frame extraction")
+    parser.add_argument('--clip-backend', choices=["torch", "onnx"], default="torch", help="onnx: int8 model exported by clip_onnx.py")
     args = parser.parse_args()
+    CLIP_MODELS.set_cpu_threads(args.clip_threads)
+    CLIP_MODELS.set_backend(args.clip_backend)
 
     generate_video_text_embedding_database(args)
 
@@ -0,0 +1,229 @@
+import time
+import random
+import asyncio
+import threading
+
+from google.genai import types
+
+
+# 各模型的配额（None 表示不限制）。免费 key 与付费 key（Tier 1）分别使用两张表。
+FREE_TIER_LIMITS = {
+    "models/gemini-2.5-flash": {"rpm": 10, "tpm": 250000, "rpd": 250},
+    "gemini-2.5-pro": {"rpm": 5, "tpm": 250000, "rpd": 100},
+    "models/gemini-2.5-flash-lite-preview-06-17": {"rpm": 15, "tpm": 250000, "rpd": 1000},
+    "models/text-embedding-004": {"rpm": 1500, "tpm": None, "rpd": None},
+}
+PAID_TIER_LIMITS = {
+    "models/gemini-2.5-flash": {"rpm": 1000, "tpm": 1000000, "rpd": 10000},
+    "gemini-2.5-pro": {"rpm": 150, "tpm": 2000000, "rpd": 10000},
+    "models/gemini-2.5-flash-lite-preview-06-17": {"rpm": 4000, "tpm": 4000000, "rpd": None},
+    "models/text-embedding-004": {"rpm": 3000, "tpm": None, "rpd": None},
+}
+
+# 退避参数：第 n 次失败后等待 uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** n)) 秒
+BACKOFF_BASE = 2.0
+BACKOFF_CAP = 120.0
+
+# 请求前估算输入 token 数，用于 TPM 预扣：Gemini 视频每帧（默认每秒 1 帧）258 个 token、音频每秒 32 个，
+# 图像每张 258 个；本地没有分词器，文本按每 4 个字符 1 个 token 估算
+FRAME_TOKENS = 258
+AUDIO_TOKENS_PER_SECOND = 32
+IMAGE_TOKENS = 258
+CHARS_PER_TOKEN = 4
+
+
+class TokenBucket:
+    """容量为 capacity、每 period 秒匀速补满的令牌桶。令牌数允许为负，用于事后扣除实际用量。"""
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # 桶满时总是放行，避免单个超过容量的请求被永久阻塞
+        need = min(amount, self.capacity) - self.tokens
+        return max(0.0, need / self.rate)
+
+
+class KeyModelLimit:
+    """一个 (key, model) 组合的 RPM / TPM / RPD 三个令牌桶，以及服务端要求的冷却截止时间。"""
+
+    def __init__(self, limits):
+        self.lock = threading.Lock()
+        self.buckets = {}
+        if limits.get("rpm"):
+            self.buckets["rpm"] = TokenBucket(limits["rpm"], 60)
+        if limits.get("tpm"):
+            self.buckets["tpm"] = TokenBucket(limits["tpm"], 60)
+        if limits.get("rpd"):
+            self.buckets["rpd"] = TokenBucket(limits["rpd"], 86400)
+        self.blocked_until = 0.0
+
+    def reserve(self, tokens):
+        """尝试占用一次请求的额度。成功返回 0，否则返回还需等待的秒数（此时不扣任何额度）。"""
+        with self.lock:
+            now = time.monotonic()
+            cost = {"rpm": 1, "rpd": 1, "tpm": tokens}
+            wait = self.blocked_until - now
+            for name, bucket in self.buckets.items():
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(cost[name]))
+            if wait > 0:
+                return wait
+            for name, bucket in self.buckets.items():
+                bucket.tokens -= cost[name]
+            return 0.0
+
+    def peek(self, tokens=0):
+        """返回 (需等待的秒数, 当日剩余配额比例)，不占用任何额度。没有 RPD 限制时比例为 1。"""
+        with self.lock:
+            now = time.monotonic()
+            cost = {"rpm": 1, "rpd": 1, "tpm": tokens}
+            wait = max(0.0, self.blocked_until - now)
+            for name, bucket in self.buckets.items():
+                bucket.refill(now)
+                wait = max(wait, bucket.wait_time(cost[name]))
+            remaining = 1.0
+            if "rpd" in self.buckets:
+                remaining = max(0.0, self.buckets["rpd"].tokens / self.buckets["rpd"].capacity)
+            return wait, remaining
+
+
+class RateLimiter:
+    def __init__(self, free_keys, paid_keys, free_limits=FREE_TIER_LIMITS, paid_limits=PAID_TIER_LIMITS):
+        self.tiers = {key: free_limits for key in free_keys} | {key: paid_limits for key in paid_keys}
+        self.states = {}
+        self.lock = threading.Lock()
+
+    def state(self, key, model):
+        with self.lock:
+            if (key, model) not in self.states:
+                limits = self.tiers.get(key, {}).get(model, {})
+                self.states[(key, model)] = KeyModelLimit(limits)
+            return self.states[(key, model)]
+
+    def acquire(self, key, model, tokens=0):
+        """阻塞直到 (key, model) 有余量，tokens 为预估的输入 token 数"""
+        state = self.state(key, model)
+        while True:
+            wait = state.reserve(tokens)
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self, key, model, tokens=0):
+        state = self.state(key, model)
+        while True:
+            wait = state.reserve(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def peek(self, key, model, tokens=0):
+        return self.state(key, model).peek(tokens)
+
+    def record_usage(self, key, model, used_tokens, estimated_tokens=0):
+        """请求结束后按 usage_metadata 补扣 TPM 的实际消耗"""
+        state = self.state(key, model)
+        with state.lock:
+            if "tpm" in state.buckets and used_tokens:
+                state.buckets["tpm"].tokens -= used_tokens - estimated_tokens
+
+    def penalize(self, key, model, seconds):
+        """服务端返回 429 时，让 (key, model) 在 seconds 秒内不再放行请求"""
+        state = self.state(key, model)
+        with state.lock:
+            state.blocked_until = max(state.blocked_until, time.monotonic() + seconds)
+            if "rpm" in state.buckets:
+                state.buckets["rpm"].tokens = min(state.buckets["rpm"].tokens, 0)
+
+
+def offset_seconds(offset):
+    """VideoMetadata 中 "12.5s" 形式的偏移"""
+    try:
+        return float(str(offset).rstrip("s"))
+    except ValueError:
+        return None
+
+
+def video_tokens(seconds, fps=None):
+    return int(seconds * (FRAME_TOKENS * (fps or 1) + AUDIO_TOKENS_PER_SECOND))
+
+
+def part_tokens(part):
+    if part.text:
+        return len(part.text) // CHARS_PER_TOKEN + 1
+    if part.inline_data:
+        return IMAGE_TOKENS if (part.inline_data.mime_type or "").startswith("image/") else 0
+    if part.file_data:
+        mime_type = part.file_data.mime_type or ""
+        if mime_type.startswith("image/"):
+            return IMAGE_TOKENS
+        metadata = part.video_metadata
+        if metadata and metadata.start_offset and metadata.end_offset:
+            start, end = offset_seconds(metadata.start_offset), offset_seconds(metadata.end_offset)
+            if start is not None and end is not None:
+                return video_tokens(max(0.0, end - start), metadata.fps)
+    # 没有剪辑区间的整段视频不知道时长，只能在请求结束后按实际用量补扣
+    return 0
+
+
+def estimate_tokens(contents):
+    """粗略估算 generate_content 请求内容的输入 token 数"""
+    if contents is None:
+        return 0
+    if isinstance(contents, str):
+        return len(contents) // CHARS_PER_TOKEN + 1
+    if isinstance(contents, (list, tuple)):
+        return sum(estimate_tokens(item) for item in contents)
+    if isinstance(contents, types.Content):
+        return sum(part_tokens(part) for part in contents.parts or [])
+    if isinstance(contents, types.Part):
+        return part_tokens(contents)
+    if isinstance(contents, types.File):
+        if (contents.mime_type or "").startswith("image/"):
+            return IMAGE_TOKENS
+        duration = (contents.video_metadata or {}).get("videoDuration")
+        seconds = offset_seconds(duration) if duration else None
+        return video_tokens(seconds) if seconds else 0
+    return 0
+
+
+def backoff_delay(attempt, cap=BACKOFF_CAP):
+    """带抖动的指数退避（full jitter）"""
+    return random.uniform(0, min(cap, BACKOFF_BASE * 2 ** attempt))
+
+
+def parse_retry_delay(e):
+    """从 429 错误的 google.rpc.RetryInfo 中读取服务端建议的等待秒数，没有则返回 None"""
+    try:
+        for detail in e.details['error']['details']:
+            if detail.get('@type', '').endswith('RetryInfo'):
+                return float(detail['retryDelay'].rstrip('s'))
+    except Exception:
+        pass
+    return None
+
+
+def parse_quota_id(e):
+    try:
+        for detail in e.details['error']['details']:
+            for violation in detail.get('violations', []):
+                if 'quotaId' in violation:
+                    return violation['quotaId']
+    except Exception:
+        pass
+    return None
+
+
+def usage_tokens(response):
+    try:
+        return response.usage_metadata.total_token_count or 0
+    except Exception:
+        return 0
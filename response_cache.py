@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import types as py_types
+import hashlib
+import threading
+
+from pydantic import BaseModel, TypeAdapter
+from google.genai import types
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+class ResponseCache:
+    """
+    以请求内容为键的 generate_content 响应磁盘缓存。
+    键由视频内容哈希（而不是每个 key 各不相同的文件 URI）、VideoMetadata 中的起止时间和 fps、提示词、
+    response_schema、模型以及采样参数共同决定；超过 max_bytes 时按最近使用时间淘汰。
+    只缓存完整的回答：被截断（finish_reason 不是 STOP）或不符合 response_schema 的回答不写入，读到这样的旧条目时丢弃。
+    """
+
+    def __init__(self, root, max_bytes=2 * 1024 ** 3, enabled=True):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        # 云端文件 URI -> 视频内容哈希
+        self.file_digests = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        os.makedirs(root, exist_ok=True)
+        # 缓存条目 -> [大小, 最近使用时间]
+        self.entries = {}
+        for name in os.listdir(root):
+            if name.endswith(".json"):
+                st = os.stat(os.path.join(root, name))
+                self.entries[name[:-5]] = [st.st_size, st.st_mtime]
+        self.total_bytes = sum(size for size, _ in self.entries.values())
+
+    def register_file(self, video_file, local_path=None, digest=None):
+        """记录上传文件的内容哈希，使同一视频在不同 key / 不同上传下得到相同的缓存键"""
+        digest = digest or getattr(video_file, "sha256_hash", None)
+        if not digest and local_path and os.path.exists(local_path):
+            digest = file_sha256(local_path)
+        if digest:
+            with self.lock:
+                self.file_digests[video_file.uri] = digest
+
+    def canonical(self, obj):
+        if obj is None or isinstance(obj, (str, int, float, bool)):
+            return obj
+        if isinstance(obj, bytes):
+            return {"bytes": hashlib.sha256(obj).hexdigest()}
+        if isinstance(obj, types.File):
+            return {"file": self.file_digests.get(obj.uri, obj.uri)}
+        if isinstance(obj, types.FileData):
+            return {"file": self.file_digests.get(obj.file_uri, obj.file_uri), "mime_type": obj.mime_type}
+        if isinstance(obj, type) and issubclass(obj, BaseModel):
+            return {"schema": obj.model_json_schema()}
+        if isinstance(obj, py_types.GenericAlias):
+            return {"generic": obj.__origin__.__name__, "args": [self.canonical(arg) for arg in obj.__args__]}
+        if isinstance(obj, BaseModel):
+            return {name: self.canonical(getattr(obj, name)) for name in type(obj).model_fields
+                    if getattr(obj, name) is not None}
+        if isinstance(obj, (list, tuple)):
+            return [self.canonical(item) for item in obj]
+        if isinstance(obj, dict):
+            return {str(k): self.canonical(v) for k, v in obj.items()}
+        return repr(obj)
+
+    def make_key(self, model, contents, config):
+        payload = json.dumps({
+            "model": model,
+            "contents": self.canonical(contents),
+            "config": self.canonical(config),
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def valid(self, response, config):
+        """回答完整且能按请求的 JSON 格式 / response_schema 解析"""
+        if not response or not response.text:
+            return False
+        candidates = response.candidates or []
+        if any(candidate.finish_reason not in (None, types.FinishReason.STOP) for candidate in candidates):
+            return False
+        schema = getattr(config, "response_schema", None)
+        try:
+            if isinstance(schema, (type, py_types.GenericAlias)):
+                TypeAdapter(schema).validate_json(response.text)
+            elif schema is not None or getattr(config, "response_mime_type", None) == "application/json":
+                json.loads(response.text)
+        except Exception as e:
+            return False
+        return True
+
+    def path(self, cache_key):
+        return os.path.join(self.root, f"{cache_key}.json")
+
+    def get(self, cache_key, config=None):
+        with self.lock:
+            if cache_key not in self.entries:
+                self.misses += 1
+                return None
+            self.entries[cache_key][1] = time.time()
+        try:
+            with open(self.path(cache_key), "r", encoding="utf-8") as f:
+                response = types.GenerateContentResponse.model_validate(json.load(f))
+        except Exception as e:
+            response = None
+        if response is None or not self.valid(response, config):
+            with self.lock:
+                self.misses += 1
+                self.discard(cache_key)
+            return None
+        with self.lock:
+            self.hits += 1
+        return response
+
+    def put(self, cache_key, response, config=None):
+        """写入缓存；回答不完整或解析失败时不写入，返回 False"""
+        if not self.valid(response, config):
+            return False
+        data = json.dumps(response.model_dump(mode="json", exclude_none=True), ensure_ascii=False)
+        tmp_path = self.path(cache_key) + f".{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path(cache_key))
+
+        with self.lock:
+            if cache_key in self.entries:
+                self.total_bytes -= self.entries[cache_key][0]
+            size = os.path.getsize(self.path(cache_key))
+            self.entries[cache_key] = [size, time.time()]
+            self.total_bytes += size
+
+            if self.total_bytes > self.max_bytes:
+                for old_key in sorted(self.entries, key=lambda k: self.entries[k][1]):
+                    if self.total_bytes <= self.max_bytes:
+                        break
+                    self.discard(old_key)
+                    self.evictions += 1
+        return True
+
+    def discard(self, cache_key):
+        # 调用方需持有 self.lock
+        size, _ = self.entries.pop(cache_key, (0, 0))
+        self.total_bytes -= size
+        try:
+            os.remove(self.path(cache_key))
+        except OSError:
+            pass
+
+    def clear(self):
+        with self.lock:
+            for cache_key in list(self.entries):
+                self.discard(cache_key)
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+            }
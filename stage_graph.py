@@ -0,0 +1,111 @@
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class StageGraph:
+    """
+    以数据依赖描述的阶段图：add(name, fn, *deps) 注册一个节点，依赖全部完成后以依赖的结果为参数在线程池中执行 fn。
+    节点可以在其它节点运行时动态添加（例如检测到广告后再为每个广告展开后续阶段）。
+    run() 等待所有节点结束，记录每个节点的起止时间，可据此得到关键路径。
+    """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self.lock = threading.Lock()
+        self.idle = threading.Condition(self.lock)
+        self.nodes = {}
+        self.results = {}
+        self.timings = {}
+        self.running = 0
+        self.error = None
+        self.executor = None
+        self.started = None
+
+    def add(self, name, fn, *deps):
+        with self.lock:
+            if name in self.nodes:
+                raise ValueError(f"Stage {name} already exists.")
+            self.nodes[name] = (fn, deps)
+            if self.executor is not None:
+                self.submit_ready()
+        return name
+
+    def ready(self, name):
+        _, deps = self.nodes[name]
+        return name not in self.timings and all(dep in self.results for dep in deps)
+
+    def submit_ready(self):
+        # 调用方需持有 self.lock
+        if self.error is not None:
+            return
+        for name in self.nodes:
+            if self.ready(name):
+                self.timings[name] = [time.monotonic() - self.started, None]
+                self.running += 1
+                self.executor.submit(self.execute, name)
+
+    def execute(self, name):
+        fn, deps = self.nodes[name]
+        try:
+            result = fn(*[self.results[dep] for dep in deps])
+        except BaseException as e:
+            with self.lock:
+                self.timings[name][1] = time.monotonic() - self.started
+                if self.error is None:
+                    self.error = e
+                self.running -= 1
+                self.idle.notify_all()
+            return
+
+        with self.lock:
+            self.timings[name][1] = time.monotonic() - self.started
+            self.results[name] = result
+            self.running -= 1
+            self.submit_ready()
+            self.idle.notify_all()
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            with self.lock:
+                self.executor = executor
+                self.started = time.monotonic()
+                self.submit_ready()
+                while self.running:
+                    self.idle.wait()
+                self.executor = None
+
+        if self.error is not None:
+            raise self.error
+        blocked = [name for name in self.nodes if name not in self.results]
+        if blocked:
+            raise RuntimeError(f"Stages never became ready: {blocked}")
+        return self.results
+
+    def result(self, name, default=None):
+        return self.results.get(name, default)
+
+    def critical_path(self):
+        """从最后结束的节点沿"最晚完成的依赖"回溯，返回 [(name, 耗时秒数)]"""
+        finished = {name: t for name, t in self.timings.items() if t[1] is not None}
+        if not finished:
+            return []
+        path = []
+        name = max(finished, key=lambda n: finished[n][1])
+        while name is not None:
+            start, end = finished[name]
+            path.append((name, round(end - start, 2)))
+            deps = [dep for dep in self.nodes[name][1] if dep in finished]
+            name = max(deps, key=lambda n: finished[n][1]) if deps else None
+        return path[::-1]
+
+    def stats(self):
+        finished = [t for t in self.timings.values() if t[1] is not None]
+        makespan = max((end for _, end in finished), default=0.0)
+        busy = sum(end - start for start, end in finished)
+        return {
+            "stages": len(finished),
+            "makespan": round(makespan, 2),
+            "stage_seconds": round(busy, 2),
+            "critical_path": self.critical_path(),
+        }
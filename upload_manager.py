@@ -0,0 +1,127 @@
+import os
+import asyncio
+import threading
+from datetime import datetime, timezone, timedelta
+from concurrent.futures import Future
+
+from response_cache import file_sha256
+
+
+# 距离过期不足该时长的云端副本不再视为可用（Gemini 文件保存 48 小时）
+EXPIRY_MARGIN = timedelta(hours=1)
+
+
+class UploadManager:
+    """
+    以视频内容哈希为键管理上传：
+    同一 (内容, key) 同时只有一次上传在进行，其余调用方共享同一个 Future（同步与异步调用方共用）；
+    并记录哪些 key 已持有 ACTIVE 副本或正在上传，供 get_client / route_request 优先选用，避免重复上传。
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.lock = threading.Lock()
+        # (内容哈希, key) -> 正在进行的上传
+        self.flights = {}
+        # 本地路径 -> ((文件大小, 修改时间), 内容哈希)
+        self.digests = {}
+        self.coalesced = 0
+
+    def digest(self, local_path):
+        """计算视频内容哈希；文件大小和修改时间不变时直接复用上次的结果"""
+        path = os.path.abspath(local_path)
+        st = os.stat(path)
+        stamp = (st.st_size, st.st_mtime_ns)
+        with self.lock:
+            cached = self.digests.get(path)
+        if cached and cached[0] == stamp:
+            return cached[1]
+        digest = file_sha256(path)
+        with self.lock:
+            self.digests[path] = (stamp, digest)
+        return digest
+
+    def resolve(self, local_path):
+        """返回内容哈希，并把旧版以本地路径为键的上传记录迁移到该哈希下"""
+        digest = self.digest(local_path)
+        self.registry.migrate(local_path, digest)
+        return digest
+
+    def active_holders(self, digest):
+        """返回 {key: 记录}，仅包含已处于 ACTIVE 且未临近过期的副本"""
+        deadline = datetime.now(timezone.utc) + EXPIRY_MARGIN
+        result = {}
+        for key, info in self.registry.holders(digest).items():
+            if info.get("state") != "ACTIVE":
+                continue
+            expiration = info.get("expiration_time")
+            if expiration and datetime.fromisoformat(expiration) <= deadline:
+                continue
+            result[key] = info
+        return result
+
+    def uploading(self, digest):
+        with self.lock:
+            return [key for d, key in self.flights if d == digest]
+
+    def holders(self, digest):
+        """已持有 ACTIVE 副本或正在上传该内容的 key"""
+        return set(self.active_holders(digest)) | set(self.uploading(digest))
+
+    def join(self, key, digest):
+        """返回 (future, 是否由本调用方负责上传)"""
+        with self.lock:
+            future = self.flights.get((digest, key))
+            if future is not None:
+                self.coalesced += 1
+                return future, False
+            future = Future()
+            self.flights[(digest, key)] = future
+            return future, True
+
+    def finish(self, key, digest, future, result=None, error=None):
+        with self.lock:
+            self.flights.pop((digest, key), None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def single_flight(self, key, digest, upload):
+        future, leader = self.join(key, digest)
+        if not leader:
+            return future.result()
+        try:
+            video_file = upload()
+        except BaseException as e:
+            self.finish(key, digest, future, error=e)
+            raise
+        self.finish(key, digest, future, result=video_file)
+        return video_file
+
+    async def single_flight_async(self, key, digest, upload):
+        future, leader = self.join(key, digest)
+        if not leader:
+            return await asyncio.wrap_future(future)
+        try:
+            video_file = await upload()
+        except BaseException as e:
+            self.finish(key, digest, future, error=e)
+            raise
+        self.finish(key, digest, future, result=video_file)
+        return video_file
+
+    def stats(self):
+        with self.lock:
+            return {"in_flight": len(self.flights), "coalesced": self.coalesced, "hashed_files": len(self.digests)}
+
+
+def file_record(video_file, local_path):
+    """由云端文件生成一条上传记录"""
+    expiration = getattr(video_file, "expiration_time", None)
+    return {
+        "cloud_name": video_file.name,
+        "local_path": local_path,
+        "state": video_file.state.name if video_file.state else None,
+        "expiration_time": expiration.isoformat() if expiration else None,
+    }
@@ -0,0 +1,134 @@
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from utils import get_client, get_key_from_client, upload_file
+
+
+class StagedVideo:
+    def __init__(self, local_path, client=None, video_file=None, error=None, upload_seconds=0.0):
+        self.local_path = local_path
+        self.client = client
+        self.key = get_key_from_client(client) if client is not None else None
+        self.video_file = video_file
+        self.error = error
+        self.upload_seconds = upload_seconds
+
+
+class UploadPipeline:
+    """
+    上传与检测流水线中的生产者：upload_workers 个线程按顺序为后续视频选 key、上传并等待 ACTIVE。
+    每次选 key 都会在调度器中预约，上传期间计入在途数量，并行的上传因此落在不同 key 上，之后的检测也随文件分散。
+    已上传（或正在上传）但尚未被检测取走的视频最多 depth 个，检测跟不上时上传线程会停下等待（背压）。
+    """
+
+    def __init__(self, local_paths, upload_workers=4, depth=8):
+        self.total = len(local_paths)
+        self.pending = queue.Queue()
+        for local_path in local_paths:
+            self.pending.put(local_path)
+        self.staged = queue.Queue()
+        self.slots = threading.Semaphore(max(1, depth))
+        self.closed = threading.Event()
+        self.lock = threading.Lock()
+        self.upload_seconds = 0.0
+        self.wait_seconds = 0.0
+        # key -> 上传到该 key 的视频数
+        self.key_counts = {}
+        self.threads = [threading.Thread(target=self.uploader, daemon=True) for _ in range(max(1, upload_workers))]
+
+    def __enter__(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.closed.set()
+
+    def uploader(self):
+        while not self.closed.is_set():
+            # 先占一个名额再取任务，保证提前上传的数量不超过 depth
+            if not self.slots.acquire(timeout=1):
+                continue
+            try:
+                local_path = self.pending.get_nowait()
+            except queue.Empty:
+                self.slots.release()
+                return
+
+            start = time.monotonic()
+            try:
+                client = get_client(local_path=local_path)
+                staged = StagedVideo(local_path, client, upload_file(client, local_path))
+            except Exception as e:
+                staged = StagedVideo(local_path, error=e)
+            staged.upload_seconds = time.monotonic() - start
+            with self.lock:
+                self.upload_seconds += staged.upload_seconds
+                if staged.key is not None:
+                    self.key_counts[staged.key] = self.key_counts.get(staged.key, 0) + 1
+            self.staged.put(staged)
+
+    def get(self):
+        """
+        取出下一个已就绪的视频；没有就绪视频时阻塞，阻塞时间即未被隐藏的上传时间。
+        流水线关闭后返回 None，正在等待的检测线程随之退出。
+        """
+        start = time.monotonic()
+        while True:
+            try:
+                staged = self.staged.get(timeout=1)
+                break
+            except queue.Empty:
+                if self.closed.is_set():
+                    return None
+        self.slots.release()
+        with self.lock:
+            self.wait_seconds += time.monotonic() - start
+        return staged
+
+    def stats(self):
+        with self.lock:
+            return {
+                "videos": self.total,
+                "upload_seconds": round(self.upload_seconds, 1),
+                "consumer_wait_seconds": round(self.wait_seconds, 1),
+                "hidden_ratio": round(1 - self.wait_seconds / self.upload_seconds, 3) if self.upload_seconds else 0.0,
+                "keys": len(self.key_counts),
+                "max_key_share": round(max(self.key_counts.values()) / sum(self.key_counts.values()), 3) if self.key_counts else 0.0,
+            }
+
+    def concentrated(self):
+        """多个线程并行上传了多个视频，却全部落在同一个 key 上"""
+        with self.lock:
+            return len(self.threads) > 1 and sum(self.key_counts.values()) > 1 and len(self.key_counts) == 1
+
+
+def pipelined(local_paths, work, upload_workers=4, depth=8, max_workers=10):
+    """
+    对 local_paths 中的每个视频执行 work(staged)，上传与检测重叠进行。
+    按完成顺序产出 (local_path, result, error)；上传失败时 staged.error 不为空，由 work 自行处理。
+    """
+    with UploadPipeline(local_paths, upload_workers, depth) as pipeline, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        def consume():
+            staged = pipeline.get()
+            if staged is None:
+                return None
+            try:
+                return staged.local_path, work(staged), None
+            except Exception as e:
+                return staged.local_path, None, e
+
+        futures = [executor.submit(consume) for _ in range(pipeline.total)]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+            print(f"Upload pipeline: {pipeline.stats()}")
+            if pipeline.concentrated():
+                print(f"Upload pipeline: all uploads landed on key {next(iter(pipeline.key_counts))}; check key availability.")
+        finally:
+            # 调用方提前退出（异常、Ctrl-C 或 break）时停止上传，取消尚未开始的检测，等待中的检测线程也会退出；
+            # 只有已经在检测中的视频会执行完
+            pipeline.closed.set()
+            executor.shutdown(wait=False, cancel_futures=True)
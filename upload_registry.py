@@ -0,0 +1,126 @@
+import os
+import json
+import threading
+
+
+class KeyUploads:
+    def __init__(self, uploads):
+        # lock 只保护内存中的记录，write_lock 串行化同一个 key 的文件写入，两者互不阻塞
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.uploads = uploads
+        self.version = 0
+        self.written_version = 0
+
+
+class UploadRegistry:
+    """
+    每个 key 的上传记录（视频内容哈希 -> {"cloud_name", "local_path", "state", "expiration_time"}），持久化在 {root}/{key}.json。
+    旧版文件以本地路径为键，读取后保持原样，直到 migrate 为其补上内容哈希。
+    每个 key 各自加锁；任何网络请求和文件写入都不在锁内进行。
+    """
+
+    def __init__(self, keys, root="UploadVideos"):
+        self.root = root
+        self.keys = {}
+        for key in keys:
+            uploads = {}
+            path = self.path(key)
+            if os.path.exists(path):
+                with open(path, "r") as f:
+                    uploads = json.load(f)
+            self.keys[key] = KeyUploads(uploads)
+
+    def path(self, key):
+        return os.path.join(self.root, f"{key}.json")
+
+    def get(self, key, content_id):
+        state = self.keys[key]
+        with state.lock:
+            info = state.uploads.get(content_id)
+            return dict(info) if info else None
+
+    def set(self, key, content_id, info):
+        state = self.keys[key]
+        with state.lock:
+            state.uploads[content_id] = info
+            state.version += 1
+
+    def update(self, key, content_id, cloud_name, **fields):
+        """仅当记录仍指向 cloud_name 时更新其中的字段"""
+        state = self.keys[key]
+        with state.lock:
+            info = state.uploads.get(content_id)
+            if info is None or info.get("cloud_name") != cloud_name:
+                return False
+            info.update(fields)
+            state.version += 1
+            return True
+
+    def pop(self, key, content_id, cloud_name=None):
+        """删除一条记录；给出 cloud_name 时只有记录仍指向该文件才删除，避免误删其它线程刚写入的新记录"""
+        state = self.keys[key]
+        with state.lock:
+            info = state.uploads.get(content_id)
+            if info is None or (cloud_name and info.get("cloud_name") != cloud_name):
+                return False
+            state.uploads.pop(content_id)
+            state.version += 1
+            return True
+
+    def pop_cloud_names(self, key, cloud_names):
+        state = self.keys[key]
+        with state.lock:
+            for content_id in [cid for cid, info in state.uploads.items() if info.get("cloud_name") in cloud_names]:
+                state.uploads.pop(content_id)
+                state.version += 1
+
+    def migrate(self, local_path, content_id):
+        """把所有 key 中以本地路径为键的旧记录改为以内容哈希为键"""
+        for state in self.keys.values():
+            with state.lock:
+                info = state.uploads.pop(local_path, None)
+                if info is None:
+                    continue
+                if content_id not in state.uploads:
+                    state.uploads[content_id] = {**info, "local_path": local_path}
+                state.version += 1
+
+    def holders(self, content_id):
+        """返回 {key: 记录}，即所有记录了该内容的 key"""
+        result = {}
+        for key, state in self.keys.items():
+            with state.lock:
+                info = state.uploads.get(content_id)
+            if info:
+                result[key] = dict(info)
+        return result
+
+    def content_id_of(self, cloud_name):
+        for state in self.keys.values():
+            with state.lock:
+                content_id = next((cid for cid, info in state.uploads.items() if info.get("cloud_name") == cloud_name), None)
+            if content_id:
+                return content_id
+        return None
+
+    def persist(self, key):
+        """把一个 key 的记录写回磁盘。先在锁内拷贝快照，再在锁外写临时文件并原子替换。"""
+        state = self.keys[key]
+        with state.write_lock:
+            with state.lock:
+                if state.version == state.written_version:
+                    return
+                snapshot = {cid: dict(info) for cid, info in state.uploads.items()}
+                version = state.version
+
+            os.makedirs(self.root, exist_ok=True)
+            tmp_path = self.path(key) + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(snapshot, f, indent=4)
+            os.replace(tmp_path, self.path(key))
+            state.written_version = version
+
+    def flush(self):
+        for key in self.keys:
+            self.persist(key)
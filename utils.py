@@ -4,9 +4,19 @@ from google import genai
 import time
 import random
 import threading
+import asyncio
 import os
 import json
 
+from rate_limit import RateLimiter, backoff_delay, parse_retry_delay, parse_quota_id, usage_tokens, estimate_tokens
+from response_cache import ResponseCache
+from context_cache import ContextCache
+from key_scheduler import KeyScheduler
+from upload_registry import UploadRegistry
+from upload_manager import UploadManager, file_record
+from embedding_cache import EmbeddingCache
+from concurrent.futures import ThreadPoolExecutor
+
 
 def time_to_seconds(time_str):
     """将 hh:mm:ss 或 mm:ss 转为秒数"""
@@ -86,45 +96,53 @@ MODEL_LIST = [
 # }
 
 # Configure the client and tools
-FREE_API_KEYS = {key: {'client': genai.Client(api_key=key, http_options={'timeout': 600000}), 'available_model': {model: True for model in MODEL_LIST}, 'status': True, 'uploads': {}, 'timer': None, 'lock': threading.Lock()} for key in FREE_KEYS}
-PAID_API_KEYS = {key: {'client': genai.Client(api_key=key, http_options={'timeout': 600000}), 'available_model': {model: True for model in MODEL_LIST}, 'status': True, 'uploads': {}, 'timer': None, 'lock': threading.Lock()} for key in PAID_KEYS}
+FREE_API_KEYS = {key: {'client': genai.Client(api_key=key, http_options={'timeout': 600000}), 'available_model': {model: True for model in MODEL_LIST}, 'status': True, 'timer': None, 'lock': threading.Lock()} for key in FREE_KEYS}
+PAID_API_KEYS = {key: {'client': genai.Client(api_key=key, http_options={'timeout': 600000}), 'available_model': {model: True for model in MODEL_LIST}, 'status': True, 'timer': None, 'lock': threading.Lock()} for key in PAID_KEYS}
 ALL_API_KEYS = FREE_API_KEYS | PAID_API_KEYS
 
-STATUS_LOCK = threading.Lock()
+# 每个 key 的配额状态由 ALL_API_KEYS[key]['lock'] 保护，上传记录由 UPLOAD_REGISTRY 按 key 分别加锁，不再使用全局锁
+UPLOAD_REGISTRY = UploadRegistry(ALL_API_KEYS.keys(), root="UploadVideos")
+# 以视频内容哈希合并并发上传，并记录各 key 持有的 ACTIVE 副本
+UPLOAD_MANAGER = UploadManager(UPLOAD_REGISTRY)
+
+# 按 (key, model) 主动限速，代替失败后固定 sleep 120 秒
+RATE_LIMITER = RateLimiter(FREE_KEYS, PAID_KEYS)
+
+# generate_content 响应的磁盘缓存，命中时不发出任何网络请求
+RESPONSE_CACHE = ResponseCache("ResponseCache")
+
+# 文本嵌入的磁盘缓存；EMBED_BATCH_SIZE 为单次 embed_content 请求的文本数（接口上限 100）
+EMBEDDING_CACHE = EmbeddingCache("EmbeddingCache")
+EMBED_BATCH_SIZE = 100
 
-for key in ALL_API_KEYS.keys():
-    upload_videos_file = f"UploadVideos/{key}.json"
-    if os.path.exists(upload_videos_file):
-        with open(upload_videos_file, "r") as f:
-            ALL_API_KEYS[key]['uploads'] = json.load(f)
+# 逐请求挑选 key；PAID_DAILY_BUDGET 限制每天最多溢出到付费 key 的请求数
+PAID_DAILY_BUDGET = 500
+KEY_SCHEDULER = KeyScheduler(FREE_KEYS, PAID_KEYS, RATE_LIMITER, paid_daily_budget=PAID_DAILY_BUDGET)
+
+# 每个 (视频, key, 模型) 一份 Gemini 上下文缓存，"完整视频 + 提示词"形式的请求只需发送提示词
+CONTEXT_CACHE = ContextCache(ttl=900, rate_limiter=RATE_LIMITER, scheduler=KEY_SCHEDULER)
+
+FILE_URI_PREFIX = "https://generativelanguage.googleapis.com/v1beta/"
 
 
 def get_client(key=None, local_path=None):
-    with STATUS_LOCK:
-        # print(f"{local_path} get client")
-        if key:
-            return ALL_API_KEYS[key]['client']
-
-        # if local_path:
-        #     for key in ALL_API_KEYS.keys():
-        #         upload_videos = ALL_API_KEYS[key]['uploads']
-        #         if local_path in upload_videos.keys() and ALL_API_KEYS[key]['status']:
-        #             try:
-        #                 cloud_name = upload_videos[local_path]["cloud_name"]
-        #                 cloud_file = ALL_API_KEYS[key]['client'].files.get(name=cloud_name)
-        #                 if cloud_file.state and cloud_file.state.name == "ACTIVE":
-        #                     return ALL_API_KEYS[key]['client']
-        #             except Exception as e:
-        #                 pass
-
-        """获取一个可用的 API key，如果免费都不可用，则返回付费 key"""
-        available_free_apis = [api['client'] for api in FREE_API_KEYS.values() if api['status']]
-        available_paid_apis = [api['client'] for api in PAID_API_KEYS.values()]
-
-        if available_free_apis:
-            return random.choice(available_free_apis)
-        else:
-            return random.choice(available_paid_apis)
+    # print(f"{local_path} get client")
+    if key:
+        return ALL_API_KEYS[key]['client']
+
+    # 优先选择已持有该视频 ACTIVE 副本或正在上传它的 key，省去重复上传
+    if local_path and os.path.exists(local_path):
+        holders = UPLOAD_MANAGER.holders(UPLOAD_MANAGER.resolve(local_path))
+        best_key = KEY_SCHEDULER.pick([key for key in holders if key_usable(key, MODEL_LIST[0])], MODEL_LIST[0])
+        if best_key:
+            return ALL_API_KEYS[best_key]['client']
+
+    """获取负载最低、最健康的可用 API key，如果免费都不可用（且付费预算未用完），则返回付费 key"""
+    candidates = [key for key in ALL_API_KEYS.keys() if key_usable(key, MODEL_LIST[0])]
+    best_key = KEY_SCHEDULER.pick(candidates, MODEL_LIST[0])
+    if best_key:
+        return ALL_API_KEYS[best_key]['client']
+    return random.choice([api['client'] for api in PAID_API_KEYS.values()])
 
 
 def get_key_from_client(client):
@@ -134,23 +152,33 @@ def get_key_from_client(client):
 
 
 def upload_file(client, local_path):
+    # 同一视频、同一 key 的并发调用共享一次上传
     key = get_key_from_client(client)
+    digest = UPLOAD_MANAGER.resolve(local_path)
+    return UPLOAD_MANAGER.single_flight(key, digest, lambda: upload_to_key_tracked(client, key, local_path, digest))
+
 
-    with STATUS_LOCK:
-        # print(f"{local_path} test cloud")
-        upload_videos = ALL_API_KEYS[key]['uploads']
-
-        if local_path in upload_videos.keys():
-            cloud_name = upload_videos[local_path]["cloud_name"]
-            try:
-                cloud_file = client.files.get(name=cloud_name)
-                if cloud_file.state and cloud_file.state.name == "ACTIVE":
-                    video_file = cloud_file
-                    return video_file
-                else:
-                    upload_videos.pop(local_path)
-            except Exception as e:
-                upload_videos.pop(local_path)
+def upload_to_key_tracked(client, key, local_path, digest):
+    # 上传期间计入该 key 的在途数量，并行上传的视频因此分散到不同 key
+    with KEY_SCHEDULER.track(key, observe=False):
+        return upload_to_key(client, key, local_path, digest)
+
+
+def upload_to_key(client, key, local_path, digest):
+    # 先取出记录，再在锁外向服务端确认文件是否仍然可用
+    uploaded = UPLOAD_REGISTRY.get(key, digest)
+    if uploaded:
+        cloud_name = uploaded["cloud_name"]
+        try:
+            cloud_file = client.files.get(name=cloud_name)
+            if cloud_file.state and cloud_file.state.name == "ACTIVE":
+                video_file = cloud_file
+                UPLOAD_REGISTRY.set(key, digest, file_record(video_file, local_path))
+                RESPONSE_CACHE.register_file(video_file, local_path, digest)
+                return video_file
+        except Exception as e:
+            pass
+        UPLOAD_REGISTRY.pop(key, digest, cloud_name)
 
     try_count = 0
     while True:
@@ -164,14 +192,8 @@ def upload_file(client, local_path):
             print(f'Upload failed: {get_key_from_client(client)}, try again after several minutes.')
             time.sleep(120)
 
-    with STATUS_LOCK:
-        # print(f"{local_path} update upload files")
-        upload_videos = ALL_API_KEYS[key]['uploads']
-
-        upload_videos[local_path] = {"cloud_name": video_file.name}
-        upload_videos_file = f"UploadVideos/{key}.json"
-        with open(upload_videos_file, "w") as f:
-            json.dump(upload_videos, f, indent=4)
+    UPLOAD_REGISTRY.set(key, digest, file_record(video_file, local_path))
+    UPLOAD_REGISTRY.persist(key)
 
     # Poll until the video file is completely processed (state becomes ACTIVE).
     try_count = 0
@@ -186,17 +208,20 @@ def upload_file(client, local_path):
             if try_count >= 10:
                 raise
 
+    UPLOAD_REGISTRY.update(key, digest, video_file.name, **file_record(video_file, local_path))
+    UPLOAD_REGISTRY.persist(key)
+    RESPONSE_CACHE.register_file(video_file, local_path, digest)
     return video_file
 
 
 def restore_key(key):
-    with STATUS_LOCK:
+    with ALL_API_KEYS[key]['lock']:
         FREE_API_KEYS[key]['status'] = True
         print(f"[{time.strftime('%H:%M:%S')}] API {key} is now restored.")
 
 
 def feedback(key, model):
-    with STATUS_LOCK:
+    with ALL_API_KEYS[key]['lock']:
         if key in FREE_KEYS:
             FREE_API_KEYS[key]["available_model"][model] = False
 
@@ -216,7 +241,7 @@ def feedback(key, model):
 
 
 def out_of_quota(key, model):
-    with STATUS_LOCK:
+    with ALL_API_KEYS[key]['lock']:
         if key in FREE_KEYS:
             return not FREE_API_KEYS[key]["available_model"][model]
         else:
@@ -224,7 +249,7 @@ def out_of_quota(key, model):
 
 
 def get_available_model(key):
-    with STATUS_LOCK:
+    with ALL_API_KEYS[key]['lock']:
         if key in FREE_KEYS:
             for model in MODEL_LIST:
                 if FREE_API_KEYS[key]["available_model"][model]:
@@ -234,56 +259,185 @@ def get_available_model(key):
             return MODEL_LIST[0]
 
 
-def send_request(client, model, contents, config, retry_sec=120):
+def key_usable(key, model):
+    with ALL_API_KEYS[key]['lock']:
+        if key in FREE_KEYS:
+            return FREE_API_KEYS[key]['status'] and FREE_API_KEYS[key]['available_model'].get(model, False)
+        return True
+
+
+def cloud_name_of(uri):
+    return uri[uri.index("files/"):] if "files/" in uri else uri
+
+
+def referenced_files(contents):
+    """收集 contents 中引用的所有云端文件名（files/xxx）"""
+    names = set()
+
+    def walk(obj):
+        if isinstance(obj, types.File):
+            names.add(obj.name)
+        elif isinstance(obj, types.Part) and obj.file_data:
+            names.add(cloud_name_of(obj.file_data.file_uri))
+        elif isinstance(obj, types.Content):
+            for part in obj.parts or []:
+                walk(part)
+        elif isinstance(obj, (list, tuple)):
+            for item in obj:
+                walk(item)
+
+    walk(contents)
+    return names
+
+
+def file_holders(cloud_name):
+    """返回 {key: cloud_name}，即所有持有同一视频内容 ACTIVE 副本的 key 及其云端文件"""
+    digest = UPLOAD_REGISTRY.content_id_of(cloud_name)
+    if not digest:
+        return {}
+    return {key: info["cloud_name"] for key, info in UPLOAD_MANAGER.active_holders(digest).items()}
+
+
+def forget_uploads(key, contents):
+    """目标 key 上的文件副本已失效（403/404）时，从该 key 的上传记录中删除"""
+    UPLOAD_REGISTRY.pop_cloud_names(key, referenced_files(contents))
+
+
+def rebind_contents(contents, name_map):
+    """把 contents 中引用的云端文件替换为 name_map 给出的、另一个 key 上的副本"""
+    def rebind(obj):
+        if isinstance(obj, types.File) and obj.name in name_map:
+            name = name_map[obj.name]
+            return obj.model_copy(update={"name": name, "uri": FILE_URI_PREFIX + name})
+        if isinstance(obj, types.Part) and obj.file_data and cloud_name_of(obj.file_data.file_uri) in name_map:
+            name = name_map[cloud_name_of(obj.file_data.file_uri)]
+            return obj.model_copy(update={"file_data": obj.file_data.model_copy(update={"file_uri": FILE_URI_PREFIX + name})})
+        if isinstance(obj, types.Content):
+            return obj.model_copy(update={"parts": [rebind(part) for part in obj.parts or []]})
+        if isinstance(obj, (list, tuple)):
+            return [rebind(item) for item in obj]
+        return obj
+
+    return rebind(contents)
+
+
+def route_request(key, model, contents):
+    """
+    为单次请求选择 (key, model, contents)。
+    开启调度时，在所有持有所需文件的 key 中挑选得分最优者并改写文件 URI；若没有 key 还有该模型的配额，则按 MODEL_LIST 顺序降级。
+    关闭调度时，仅保留原 key，并在其配额耗尽时换用可用模型。
+    """
+    if not KEY_SCHEDULER.enabled:
+        if out_of_quota(key, model):
+            model = get_available_model(key)
+        return key, model, contents
+
+    names = referenced_files(contents)
+    holders = {name: file_holders(name) for name in names}
+    if names:
+        candidates = set.intersection(*(set(holder) for holder in holders.values()))
+    else:
+        candidates = set(ALL_API_KEYS.keys())
+
+    for candidate_model in [model] + [m for m in MODEL_LIST if m != model]:
+        best_key = KEY_SCHEDULER.pick([k for k in candidates if key_usable(k, candidate_model)], candidate_model)
+        if best_key == key:
+            return key, candidate_model, contents
+        if best_key:
+            return best_key, candidate_model, rebind_contents(contents, {name: holders[name][best_key] for name in names})
+
+    return key, get_available_model(key), contents
+
+
+def handle_request_error(key, model, e, attempt, retry_sec):
+    """
+    根据失败原因更新限速状态，返回 (新的 model, 重试前需等待的秒数)。
+    每日配额耗尽时切换到下一个可用模型（没有则返回 None）；其余 429 按服务端给出的 retryDelay 冷却 (key, model)，
+    其它错误使用带抖动的指数退避。
+    """
+    if getattr(e, 'code', None) == 429:
+        if parse_quota_id(e) == "GenerateRequestsPerDayPerProjectPerModel-FreeTier":
+            feedback(key, model)
+            return get_available_model(key), 0
+        retry_delay = parse_retry_delay(e)
+        RATE_LIMITER.penalize(key, model, retry_delay if retry_delay is not None else backoff_delay(attempt, retry_sec))
+        return model, 0
+    return model, backoff_delay(attempt, retry_sec)
+
+
+def send_request(client, model, contents, config, retry_sec=120, use_cache=True):
+    key = get_key_from_client(client)
     if model not in MODEL_LIST:
         model = MODEL_LIST[0]
 
-    if out_of_quota(get_key_from_client(client), model):
-        model = get_available_model(get_key_from_client(client))
+    use_cache = use_cache and RESPONSE_CACHE.enabled
+    if use_cache:
+        cache_key = RESPONSE_CACHE.make_key(model, contents, config)
+        response = RESPONSE_CACHE.get(cache_key, config)
+        if response is not None:
+            return response
 
+    # 预估的输入 token 数在发送前从 TPM 中预扣，请求结束后按实际用量补扣差额
+    estimated_tokens = estimate_tokens(contents)
     try_counter = 0
+    last_error = None
     while True:
+        request_key, request_model, request_contents = route_request(key, model, contents)
+        if not request_model:
+            raise last_error or RuntimeError(f"API {key} is out of quota for all models.")
+        request_client = ALL_API_KEYS[request_key]['client']
+        request_contents, request_config = CONTEXT_CACHE.prepare(request_client, request_key, request_model, request_contents, config)
+
+        RATE_LIMITER.acquire(request_key, request_model, estimated_tokens)
         try:
             # Send request with function declarations
-            response = client.models.generate_content(
-                model=model,
-                contents=contents,
-                config=config,
-            )
+            with KEY_SCHEDULER.track(request_key):
+                response = request_client.models.generate_content(
+                    model=request_model,
+                    contents=request_contents,
+                    config=request_config,
+                )
+            RATE_LIMITER.record_usage(request_key, request_model, usage_tokens(response), estimated_tokens)
+            CONTEXT_CACHE.observe(response)
             # if not response or not response.text:
             #     print(f"Response is None from {get_key_from_client(client)}.")
             #     response = SimpleNamespace(text="[]")
             if response and response.text:
                 break
         except Exception as e:
-            print(f'Request failed: {get_key_from_client(client)}, try again after several minutes. Detail: {e}')
-
-            if hasattr(e, 'code') and e.code == 500:
-                pass
-            elif hasattr(e, 'code') and e.code == 429:
-                try:
-                    if e.details['error']['details'][0]['violations'][0]['quotaId'] == "GenerateRequestsPerDayPerProjectPerModel-FreeTier":
-                        feedback(get_key_from_client(client), model)
-                        model = get_available_model(client)
-                        if not model:
-                            raise
-                        try_counter = 0
-                    # elif e.details['error']['details'][0]['violations'][0]['quotaId'] == "GenerateContentInputTokensPerModelPerMinute-FreeTier":
-                except Exception as e_again:
-                    pass
+            print(f'Request failed: {request_key}, try again later. Detail: {e}')
+            last_error = e
+
+            if CONTEXT_CACHE.failed(request_config, e):
+                # 上下文缓存过期或不被接受：下一轮重新创建缓存或直接发送完整视频
+                continue
+
+            if getattr(e, 'code', None) in (403, 404) and request_key != key:
+                forget_uploads(request_key, request_contents)
+                continue
+
+            new_model, delay = handle_request_error(request_key, request_model, e, try_counter, retry_sec)
+            if new_model != request_model:
+                # 每日配额耗尽：下一轮由 route_request 换 key 或降级模型
+                try_counter = 0
+                continue
 
             try_counter += 1
             if try_counter >= 10:
-                # feedback(get_key_from_client(client))
                 raise
-            time.sleep(retry_sec)
+            time.sleep(delay)
 
+    # 降级到其它模型得到的回答不写入主模型的缓存键，以免之后的运行一直读到较弱的结果
+    if use_cache and request_model == model:
+        RESPONSE_CACHE.put(cache_key, response, config)
     return response
 
 
-def get_embed(client, model, contents, config):
+def get_embed(client, model, contents, config, retry_sec=120):
+    key = get_key_from_client(client)
     try_counter = 0
     while True:
+        RATE_LIMITER.acquire(key, model, estimate_tokens(contents))
         try:
             # Send request with function declarations
             response = client.models.embed_content(
@@ -293,19 +447,237 @@ def get_embed(client, model, contents, config):
             )
             break
         except Exception as e:
-            print(f'Embed failed: {get_key_from_client(client)}, try again after several minutes. Detail: {e}')
+            print(f'Embed failed: {key}, try again later. Detail: {e}')
+            _, delay = handle_request_error(key, model, e, try_counter, retry_sec)
             try_counter += 1
             if try_counter >= 10:
                 raise
-            time.sleep(120)
+            time.sleep(delay)
+
+    return response.embeddings[0].values
+
+
+def embed_batch(model, texts, config, retry_sec=120):
+    """发送一次批量嵌入请求，返回与 texts 对应的向量列表；每次尝试都重新挑选 key，出错的 key 由限速器冷却"""
+    try_counter = 0
+    while True:
+        key = KEY_SCHEDULER.pick(list(ALL_API_KEYS.keys()), model) or random.choice(PAID_KEYS)
+        client = ALL_API_KEYS[key]['client']
+        RATE_LIMITER.acquire(key, model, estimate_tokens(texts))
+        try:
+            with KEY_SCHEDULER.track(key):
+                response = client.models.embed_content(
+                    model=model,
+                    contents=texts,
+                    config=config,
+                )
+            return [embedding.values for embedding in response.embeddings]
+        except Exception as e:
+            print(f'Embed failed: {key}, try again later. Detail: {e}')
+            _, delay = handle_request_error(key, model, e, try_counter, retry_sec)
+            try_counter += 1
+            if try_counter >= 10:
+                raise
+            time.sleep(delay)
+
+
+def embed_texts(texts, model, task_type, batch_size=EMBED_BATCH_SIZE, max_workers=8, retry_sec=120):
+    """
+    批量计算文本嵌入，返回与 texts 一一对应的向量。
+    先查 EMBEDDING_CACHE；未命中的文本去重后按 batch_size 分批，各批次并行发送、各自挑选 key，结果写回缓存。
+    """
+    vectors = EMBEDDING_CACHE.get_many(model, task_type, texts)
+    missing = list(dict.fromkeys(text for text in texts if text not in vectors))
+    if missing:
+        config = types.EmbedContentConfig(task_type=task_type)
+        batches = [missing[i:i + batch_size] for i in range(0, len(missing), batch_size)]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            results = executor.map(lambda batch: embed_batch(model, batch, config, retry_sec), batches)
+            for batch, batch_vectors in zip(batches, results):
+                EMBEDDING_CACHE.put_many(model, task_type, batch, batch_vectors)
+                vectors.update(zip(batch, batch_vectors))
+    return [vectors[text] for text in texts]
+
+
+# 所有 key 共用一个事件循环（运行在后台守护线程中）。每个 key 的 client.aio 连接池都绑定在这个循环上，
+# 因此协程版本的接口必须在该循环中执行：同步代码请通过 run_async 调用。
+ASYNC_LOOP = None
+ASYNC_LOOP_LOCK = threading.Lock()
+# 整个进程同时在途的请求上限（跨所有 key）
+MAX_IN_FLIGHT = 256
+IN_FLIGHT = {}
+
+
+def get_event_loop():
+    global ASYNC_LOOP
+    with ASYNC_LOOP_LOCK:
+        if ASYNC_LOOP is None:
+            ASYNC_LOOP = asyncio.new_event_loop()
+            threading.Thread(target=ASYNC_LOOP.run_forever, name="gemini-aio", daemon=True).start()
+        return ASYNC_LOOP
+
+
+def run_async(coro):
+    """在共享事件循环上执行协程，阻塞当前线程直到返回结果"""
+    return asyncio.run_coroutine_threadsafe(coro, get_event_loop()).result()
+
+
+def in_flight_slot():
+    # asyncio.Semaphore 绑定在首次使用它的事件循环上，因此按循环分别创建
+    loop = asyncio.get_running_loop()
+    if loop not in IN_FLIGHT:
+        IN_FLIGHT[loop] = asyncio.Semaphore(MAX_IN_FLIGHT)
+    return IN_FLIGHT[loop]
+
+
+async def async_send_request(client, model, contents, config, retry_sec=120, use_cache=True):
+    key = get_key_from_client(client)
+    if model not in MODEL_LIST:
+        model = MODEL_LIST[0]
+
+    use_cache = use_cache and RESPONSE_CACHE.enabled
+    if use_cache:
+        # 缓存键的哈希和磁盘读写都放到线程中，不阻塞共享事件循环上的其它请求
+        cache_key = await asyncio.to_thread(RESPONSE_CACHE.make_key, model, contents, config)
+        response = await asyncio.to_thread(RESPONSE_CACHE.get, cache_key, config)
+        if response is not None:
+            return response
+
+    # 预估的输入 token 数在发送前从 TPM 中预扣，请求结束后按实际用量补扣差额
+    estimated_tokens = estimate_tokens(contents)
+    try_counter = 0
+    last_error = None
+    while True:
+        request_key, request_model, request_contents = route_request(key, model, contents)
+        if not request_model:
+            raise last_error or RuntimeError(f"API {key} is out of quota for all models.")
+        request_client = ALL_API_KEYS[request_key]['client']
+        request_contents, request_config = await CONTEXT_CACHE.prepare_async(request_client, request_key, request_model, request_contents, config)
+
+        await RATE_LIMITER.acquire_async(request_key, request_model, estimated_tokens)
+        try:
+            async with in_flight_slot():
+                with KEY_SCHEDULER.track(request_key):
+                    response = await request_client.aio.models.generate_content(
+                        model=request_model,
+                        contents=request_contents,
+                        config=request_config,
+                    )
+            RATE_LIMITER.record_usage(request_key, request_model, usage_tokens(response), estimated_tokens)
+            CONTEXT_CACHE.observe(response)
+            if response and response.text:
+                break
+        except Exception as e:
+            print(f'Request failed: {request_key}, try again later. Detail: {e}')
+            last_error = e
+
+            if CONTEXT_CACHE.failed(request_config, e):
+                # 上下文缓存过期或不被接受：下一轮重新创建缓存或直接发送完整视频
+                continue
+
+            if getattr(e, 'code', None) in (403, 404) and request_key != key:
+                await asyncio.to_thread(forget_uploads, request_key, request_contents)
+                continue
+
+            new_model, delay = handle_request_error(request_key, request_model, e, try_counter, retry_sec)
+            if new_model != request_model:
+                # 每日配额耗尽：下一轮由 route_request 换 key 或降级模型
+                try_counter = 0
+                continue
+
+            try_counter += 1
+            if try_counter >= 10:
+                raise
+            await asyncio.sleep(delay)
+
+    # 降级到其它模型得到的回答不写入主模型的缓存键，以免之后的运行一直读到较弱的结果
+    if use_cache and request_model == model:
+        await asyncio.to_thread(RESPONSE_CACHE.put, cache_key, response, config)
+    return response
+
+
+async def async_upload_file(client, local_path):
+    key = get_key_from_client(client)
+    digest = await asyncio.to_thread(UPLOAD_MANAGER.resolve, local_path)
+    return await UPLOAD_MANAGER.single_flight_async(key, digest, lambda: async_upload_to_key_tracked(client, key, local_path, digest))
+
+
+async def async_upload_to_key_tracked(client, key, local_path, digest):
+    with KEY_SCHEDULER.track(key, observe=False):
+        return await async_upload_to_key(client, key, local_path, digest)
+
+
+async def async_upload_to_key(client, key, local_path, digest):
+    uploaded = UPLOAD_REGISTRY.get(key, digest)
+    if uploaded:
+        cloud_name = uploaded["cloud_name"]
+        try:
+            cloud_file = await client.aio.files.get(name=cloud_name)
+            if cloud_file.state and cloud_file.state.name == "ACTIVE":
+                UPLOAD_REGISTRY.set(key, digest, file_record(cloud_file, local_path))
+                RESPONSE_CACHE.register_file(cloud_file, local_path, digest)
+                return cloud_file
+        except Exception as e:
+            pass
+        UPLOAD_REGISTRY.pop(key, digest, cloud_name)
+
+    try_count = 0
+    while True:
+        try:
+            async with in_flight_slot():
+                video_file = await client.aio.files.upload(file=local_path)
+            break
+        except Exception as e:
+            try_count += 1
+            if try_count >= 3:
+                raise
+            print(f'Upload failed: {key}, try again after several minutes.')
+            await asyncio.sleep(120)
+
+    UPLOAD_REGISTRY.set(key, digest, file_record(video_file, local_path))
+    await asyncio.to_thread(UPLOAD_REGISTRY.persist, key)
+
+    # Poll until the video file is completely processed (state becomes ACTIVE).
+    try_count = 0
+    while not video_file.state or video_file.state.name != "ACTIVE":
+        await asyncio.sleep(5)
+        try:
+            video_file = await client.aio.files.get(name=video_file.name)
+        except Exception as e:
+            try_count += 1
+            if try_count >= 10:
+                raise
+
+    UPLOAD_REGISTRY.update(key, digest, video_file.name, **file_record(video_file, local_path))
+    await asyncio.to_thread(UPLOAD_REGISTRY.persist, key)
+    RESPONSE_CACHE.register_file(video_file, local_path, digest)
+    return video_file
+
+
+async def async_get_embed(client, model, contents, config, retry_sec=120):
+    key = get_key_from_client(client)
+    try_counter = 0
+    while True:
+        await RATE_LIMITER.acquire_async(key, model, estimate_tokens(contents))
+        try:
+            async with in_flight_slot():
+                response = await client.aio.models.embed_content(
+                    model=model,
+                    contents=contents,
+                    config=config,
+                )
+            break
+        except Exception as e:
+            print(f'Embed failed: {key}, try again later. Detail: {e}')
+            _, delay = handle_request_error(key, model, e, try_counter, retry_sec)
+            try_counter += 1
+            if try_counter >= 10:
+                raise
+            await asyncio.sleep(delay)
 
     return response.embeddings[0].values
 
 
 def dump_upload_files():
-    with STATUS_LOCK:
-        # print(f"dump files")
-        for key in ALL_API_KEYS.keys():
-            upload_videos_file = f"UploadVideos/{key}.json"
-            with open(upload_videos_file, "w") as f:
-                json.dump(ALL_API_KEYS[key]['uploads'], f, indent=4)
+    # 只写回有改动的 key，且不持有任何全局锁
+    UPLOAD_REGISTRY.flush()
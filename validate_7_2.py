@@ -3,7 +3,6 @@ import pandas as pd
 import glob
 import os
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from sklearn.metrics import precision_score, recall_score, f1_score
 import networkx as nx
@@ -12,8 +11,10 @@ import json
 import traceback
 from collections import defaultdict
 
-from utils import time_to_seconds, seconds_to_mmss
-from Run_Detect import upload_file_and_run_detect
+from utils import time_to_seconds, seconds_to_mmss, RESPONSE_CACHE, CONTEXT_CACHE
+from Run_Detect import run_detect_on_staged
+from rag import EXEMPLAR_CACHE
+from upload_pipeline import pipelined
 
 
 def unavailable_str(element):
@@ -537,8 +538,18 @@ if __name__ == "__main__":
     parser.add_argument('-c', type=str, default='None')
     parser.add_argument('--wr', action="store_true")
     parser.add_argument('-o', type=str, default='result.json')
+    parser.add_argument('--no-cache', action="store_true", help="bypass the on-disk response cache")
+    parser.add_argument('--no-context-cache', action="store_true", help="send the full video with every request instead of a Gemini cached content")
+    parser.add_argument('--workers', type=int, default=10, help="videos under detection at the same time")
+    parser.add_argument('--upload-workers', type=int, default=4, help="background upload threads")
+    parser.add_argument('--upload-depth', type=int, default=8, help="max videos uploaded ahead of detection")
     args = parser.parse_args()
 
+    if args.no_cache:
+        RESPONSE_CACHE.enabled = False
+    if args.no_context_cache:
+        CONTEXT_CACHE.enabled = False
+
     if args.c != "None":
         with open(args.c, "r") as f:
             old_result_dict = json.load(f)
@@ -570,31 +581,28 @@ if __name__ == "__main__":
 
 
     if not args.wr:
-        with ThreadPoolExecutor(max_workers=10) as executor:
-            futures = {executor.submit(upload_file_and_run_detect, app_gt['video'], available_dp): key for key, app_gt in video_need_detect.items()}
-            for future in tqdm(as_completed(futures), total=len(futures)):
-                original_key = futures[future]
-                app_gt = video_need_detect[original_key]
-                local_path = app_gt["video"]
-
-                try:
-                    result_dict_this_sample = future.result()
-                except Exception as e:
-                    print(f"[Error] Future failed on video {local_path}: {e}")
-                    traceback.print_exc()
-                    with RESULT_LOCK:
-                        result_dict[local_path] = {"crashed_future": True, "error_info": traceback.format_exc()}
-                    continue
-
+        # 后台线程提前上传后续视频，检测只取已 ACTIVE 的视频，上传与检测重叠进行
+        video_paths = [app_gt['video'] for app_gt in video_need_detect.values()]
+        results = pipelined(video_paths, lambda staged: run_detect_on_staged(staged, available_dp),
+                            upload_workers=args.upload_workers, depth=args.upload_depth, max_workers=args.workers)
+        for local_path, result_dict_this_sample, error in tqdm(results, total=len(video_paths)):
+            if error is not None:
+                print(f"[Error] Future failed on video {local_path}: {error}")
+                error_info = "".join(traceback.format_exception(type(error), error, error.__traceback__))
+                print(error_info)
                 with RESULT_LOCK:
-                    if "broken_client" in result_dict_this_sample.keys() or "broken_file_upload" in result_dict_this_sample.keys():
-                        print(f"Gemini cannot respond with this api on video {app_gt['video']}")
-                        result_dict[local_path] = result_dict_this_sample
-                        dump_result_file(args.o, result_dict)
-                        continue
+                    result_dict[local_path] = {"crashed_future": True, "error_info": error_info}
+                continue
 
+            with RESULT_LOCK:
+                if "broken_client" in result_dict_this_sample.keys() or "broken_file_upload" in result_dict_this_sample.keys():
+                    print(f"Gemini cannot respond with this api on video {local_path}")
                     result_dict[local_path] = result_dict_this_sample
                     dump_result_file(args.o, result_dict)
+                    continue
+
+                result_dict[local_path] = result_dict_this_sample
+                dump_result_file(args.o, result_dict)
 
     for video_path, result_dict_this_sample in result_dict.items():
         if video_path != "all-average-metrics":
@@ -613,3 +621,7 @@ if __name__ == "__main__":
     result_dict["all-average-metrics"] = calculate_metrics_on_all_sample(available_dp, result_dict)
 
     dump_result_file(args.o, result_dict)
+    print(f"Response cache: {RESPONSE_CACHE.stats()}")
+    print(f"Context cache: {CONTEXT_CACHE.stats()}")
+    print(f"Exemplar cache: {EXEMPLAR_CACHE.stats()}")
+    CONTEXT_CACHE.clear()
@@ -0,0 +1,189 @@
+import io
+import os
+import json
+import argparse
+import threading
+
+import numpy as np
+from PIL import Image
+
+from clip_model import CLIP_MODELS, DEFAULT_MODEL, encode_images
+from embedding_store import segment_embeddings
+from faiss_index import FaissIndex
+from keyframes import select_keyframes
+from rag import summary_records, exemplar_keyframes, KEYFRAME_INTERVAL, KEYFRAME_THRESHOLD, RAG_TOP_K
+from utils import time_to_seconds
+
+
+# local_database/clip_image_index 中是 langchain 保存的单向量索引，不对应任何示例，这里另建目录
+VISUAL_INDEX_DIR = os.path.join("local_database", "exemplar_keyframe_index")
+# 每个查询关键帧取回的近邻关键帧数
+NEIGHBORS = 32
+
+
+class VisualRetriever:
+    """
+    用 CLIP 图像嵌入检索示例广告：索引 rag_done_list.json 中每个示例保存的关键帧，
+    查询时在本地对候选广告片段取关键帧嵌入并搜索 FaissIndex，返回与摘要检索相同的文档 JSON。
+    索引的每行是一个关键帧，行 id 为其所属示例的 doc_id；docs.json 记录 doc_id -> 文档内容及编码所用的模型。
+    """
+
+    def __init__(self, index_dir=VISUAL_INDEX_DIR, model=DEFAULT_MODEL, backend=None, kind="flat"):
+        self.index_dir = index_dir
+        self.model = model
+        self.backend = backend
+        # load_lock 保证只同步一次，lock 保护索引的读写
+        self.load_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.kind = kind
+        self.index = None
+        self.docs = {}
+
+    def path(self, name):
+        return os.path.join(self.index_dir, name)
+
+    def open(self):
+        self.index = FaissIndex(self.path("keyframes"), self.kind)
+        docs_path = self.path("docs.json")
+        if not os.path.exists(docs_path):
+            self.index.clear()
+            return False
+        with open(docs_path, "r") as f:
+            meta = json.load(f)
+        if meta["model"] != self.model or meta["backend"] != (self.backend or CLIP_MODELS.backend):
+            # 换了模型，旧嵌入不可比较
+            self.index.clear()
+            return False
+        self.docs = meta["docs"]
+        return True
+
+    def save(self):
+        self.index.persist()
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp_path = self.path("docs.tmp.json")
+        with open(tmp_path, "w") as f:
+            json.dump({"model": self.model, "backend": self.backend or CLIP_MODELS.backend, "docs": self.docs}, f)
+        os.replace(tmp_path, self.path("docs.json"))
+
+    def encode_exemplar(self, content):
+        doc = json.loads(content)
+        images = (Image.open(io.BytesIO(frame)).convert("RGB") for frame in exemplar_keyframes(doc["video"], doc["start_time"], doc["end_time"]))
+        return encode_images(images, self.model, backend=self.backend)
+
+    def sync(self, video_summaries_file="rag_done_list.json"):
+        """
+        增量同步示例：只为新增的示例编码关键帧，删除已不存在的示例的行。
+        没有保存关键帧的示例不会进入索引。返回 (新增数, 删除数)。
+        """
+        records = summary_records(video_summaries_file)
+        with self.lock:
+            if self.index is None:
+                self.open()
+            stale = set(self.docs) - records.keys()
+            new_ids = [doc_id for doc_id in records if doc_id not in self.docs]
+            if not stale and not new_ids:
+                return 0, 0
+
+            self.index.remove(stale)
+            for doc_id in stale:
+                del self.docs[doc_id]
+            for doc_id in new_ids:
+                content = records[doc_id][1]
+                embeddings = self.encode_exemplar(content)
+                self.index.add([doc_id] * len(embeddings), embeddings)
+                self.docs[doc_id] = content
+            self.save()
+            return len(new_ids), len(stale)
+
+    def load(self, sync=True):
+        """首次调用时打开索引（sync=True 时先增量同步），之后直接返回"""
+        if self.loaded:
+            return self
+        with self.load_lock:
+            if not self.loaded:
+                if sync:
+                    added, removed = self.sync()
+                    if added or removed:
+                        print(f"Visual exemplar index synced: {added} added, {removed} removed.")
+                elif not self.open():
+                    raise FileNotFoundError(f"No visual exemplar index in {self.index_dir}")
+                self.loaded = True
+        return self
+
+    def score(self, hits, query_count, k):
+        """每个示例的得分为各查询关键帧与其最相似关键帧的相似度之和除以查询关键帧数，返回得分最高的 k 个 [(doc_id, 得分)]"""
+        scores = {}
+        for row_hits in hits:
+            best = {}
+            for doc_id, sim in row_hits:
+                # 结果按相似度降序，每个示例只取第一次出现的值
+                best.setdefault(doc_id, sim)
+            for doc_id, sim in best.items():
+                scores[doc_id] = scores.get(doc_id, 0.0) + sim / query_count
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def search(self, embeddings, k=RAG_TOP_K, neighbors=NEIGHBORS):
+        """embeddings 为一个候选片段的 (N, D) 关键帧嵌入，返回按得分从高到低的 [(doc_id, 得分)]"""
+        return self.search_batch([embeddings], k, neighbors)[0]
+
+    def search_batch(self, queries, k=RAG_TOP_K, neighbors=NEIGHBORS):
+        """多个候选片段的关键帧拼成一次 FAISS 查询，再按片段拆开计分"""
+        counts = [len(embeddings) for embeddings in queries]
+        if sum(counts) == 0:
+            return [[] for _ in queries]
+        hits = self.index.search(np.concatenate([embeddings for embeddings in queries if len(embeddings)]), neighbors)
+        results = []
+        offset = 0
+        for count in counts:
+            results.append(self.score(hits[offset:offset + count], count, k) if count else [])
+            offset += count
+        return results
+
+    def query_embeddings(self, video_path, start_time, end_time):
+        """候选片段的关键帧嵌入，帧嵌入从持久化的 embedding_store 读取，不解码关键帧图像"""
+        frame_times, embeddings = segment_embeddings(
+            video_path, time_to_seconds(start_time), time_to_seconds(end_time), KEYFRAME_INTERVAL, self.model, self.backend
+        )
+        if len(embeddings) == 0:
+            return embeddings
+        keyframe_indices, _ = select_keyframes(frame_times, embeddings, threshold=KEYFRAME_THRESHOLD)
+        return embeddings[keyframe_indices]
+
+    def candidates(self, video_path, windows, fetch_k):
+        """每个片段的 [(文档 JSON, 得分, 示例关键帧的平均方向)]，供 exemplar_selection.rerank 做 MMR 重排"""
+        queries = [self.query_embeddings(video_path, start_time, end_time) for start_time, end_time in windows]
+        results = self.search_batch(queries, fetch_k)
+        doc_ids = list(dict.fromkeys(doc_id for hits in results for doc_id, _ in hits))
+        if not doc_ids:
+            return [[] for _ in windows]
+        vectors = dict(zip(doc_ids, self.index.id_vectors(doc_ids)))
+        return [[(self.docs[doc_id], score, vectors[doc_id]) for doc_id, score in hits] for hits in results]
+
+    def invoke(self, video_path, start_time, end_time, k=RAG_TOP_K):
+        """返回与候选片段最相似的示例文档 JSON 列表，可直接交给 rag.generate_exemplars_parts"""
+        return self.batch(video_path, [(start_time, end_time)], k)[0]
+
+    def batch(self, video_path, windows, k=RAG_TOP_K):
+        """同一视频的多个 (start_time, end_time) 片段一次检索，返回与 windows 一一对应的文档列表"""
+        queries = [self.query_embeddings(video_path, start_time, end_time) for start_time, end_time in windows]
+        return [[self.docs[doc_id] for doc_id, _ in hits] for hits in self.search_batch(queries, k)]
+
+
+VISUAL_RETRIEVER = VisualRetriever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--query", nargs=3, metavar=("VIDEO", "START", "END"), help="query a video segment (mm:ss) after syncing")
+    parser.add_argument("-k", type=int, default=RAG_TOP_K)
+    args = parser.parse_args()
+
+    VISUAL_RETRIEVER.load()
+    print(f"{len(VISUAL_RETRIEVER.docs)} exemplars, {len(VISUAL_RETRIEVER.index)} keyframes indexed.")
+    if args.query:
+        video_path, start_time, end_time = args.query
+        embeddings = VISUAL_RETRIEVER.query_embeddings(video_path, start_time, end_time)
+        for doc_id, score in VISUAL_RETRIEVER.search(embeddings, args.k):
+            doc = json.loads(VISUAL_RETRIEVER.docs[doc_id])
+            print(f"{score:.4f}  {os.path.basename(doc['video'])}  {doc['start_time']}-{doc['end_time']}")